@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from mrpy.seq import Composite, Loop, List, Acquisition
+from mrpy.rf import ex
+from mrpy.grad import TrapGradient
+
+@pytest.fixture
+def protocol():
+    '''
+    protocol(size,**parms) returns the parameters of a GradientEcho with matrix size,
+    parms replace the defaults, the ss and enc dicts are merged into them
+    '''
+    def make(size,**parms):
+        base = {
+            'tr': 0,
+            'te': 0,
+            'ss': {'thk': 5,'flip': 20,'pulse_dur': 2.0,'pulse': 'gauss'},
+            'enc': {'fov': np.array([240.,240.,120.]),'img_matrix': np.array(size),
+                'dwell': 0.010},
+        }
+        for key in ('ss','enc'):
+            base[key].update(parms.pop(key,{}))
+        base.update(parms)
+        return base
+    return make
+
+@pytest.fixture
+def spoiled():
+    '''
+    spoiled(flip,tr,te,ntr,area) returns ntr TRs of a short block pulse, one ADC sample
+    at te and a spoiler gradient of area (ms*mT/m) along S
+    '''
+    def make(flip,tr,te,ntr,area=0.0):
+        pulse = ex.Block(dur=0.02,flip=flip,tbw=1.0)
+        pulse.anchor = 0.01
+        acq = Acquisition(npoints=1,dwell=0.001)
+        acq.time = te
+        spoil = TrapGradient(gmax=area/1.8,dur=2.0,axis='S')
+        spoil.time = te + 0.5
+        base = Composite(dur=tr,parts=[pulse,acq,spoil])
+        base.anchor = 0.01
+        loop = Loop(obj=base)
+        loop.add_list(List(np.arange(ntr)))
+        loop.build()
+        return Composite(dur=loop.dur,parts=[loop])
+    return make
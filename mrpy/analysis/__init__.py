@@ -0,0 +1,4 @@
+from .kspace import Trajectory
+from .scan import ScanAnalysis
+from .hardware import HardwareCheck
+from .pns import PNS
\ No newline at end of file
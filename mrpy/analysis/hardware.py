@@ -0,0 +1,181 @@
+import numpy as np
+from mrpy.limits import GradientLimits
+from mrpy.timeline import Timeline
+from mrpy.analysis.scan import ScanAnalysis, leaf_groups, GroupShapes
+
+axes = ('R','P','S')
+
+class HardwareCheck:
+    '''
+    HardwareCheck(seq) checks the gradients of a sequence against the limits of the
+    gradient system, over every repetition of its loops at once
+
+        HardwareCheck(seq,limits,bands)
+        seq = a sequence object (e.g. a built GradientEcho) or a compiled Timeline
+        limits = class with grad_max, vector_max, slew_max, rms_max, dwell and
+            resonances attributes, see GradientLimits
+        bands = forbidden frequency bands, (fmin kHz, fmax kHz, max amplitude mT/m)
+            tuples, limits.resonances by default
+
+        Calculated parameters:
+        grad_peak = peak gradient amplitude per axis, mT/m
+        slew_peak = peak slew rate per axis, mT/m/ms
+        vector_peak = peak amplitude of the combined R, P and S gradient, mT/m
+        grad_rms = RMS gradient amplitude over the sequence per axis (duty cycle), mT/m
+        band_peak = per band, peak amplitude of the harmonics inside the band per axis,
+            mT/m
+        times = time at which each peak above is first reached, same keys as the
+            peaks ('R', 'slew R', 'vector', 'band 0 R', ...), ms
+        violations = descriptions of the limits that are exceeded
+        ok = True if no limit is exceeded
+
+    The gradient objects are reduced to unit shapes and amplitude tables as in
+    ScanAnalysis, with all objects repeated by the same loops tabulated together.
+    Amplitudes and slew rates of all repetitions are products of the amplitude table
+    with the shapes sampled at their breakpoints. For the resonance bands the objects
+    of every loop nest are taken to repeat with the period of its innermost loop (e.g.
+    TR): each unit shape is sampled on the dwell raster of one period and Fourier
+    transformed once, and the harmonics of all repetitions follow from the amplitude
+    table. Only the harmonics inside the bands are formed. The RMS amplitudes are
+    those of ScanAnalysis.
+    '''
+    chunk = 2**22 # table entries times intervals evaluated at once
+
+    def __init__(self,seq,limits=GradientLimits,bands=None):
+        if not isinstance(seq,Timeline):
+            seq = Timeline.compile(seq)
+        self.timeline = seq
+        self.limits = limits
+        self.bands = limits.resonances if bands is None else bands
+        self.calc()
+
+    def calc(self):
+        self._peaks = {}
+        for axis in axes:
+            self._keep(axis,0.0,0.0)
+            self._keep('slew ' + axis,0.0,0.0)
+            for n in range(len(self.bands)):
+                self._keep('band %d %s' % (n,axis),0.0,0.0)
+        self._keep('vector',0.0,0.0)
+
+        for group in leaf_groups(self.timeline,axes,split=False):
+            g = GroupShapes(self.timeline,group)
+            if g.breaks is not None:
+                self._amplitudes(g)
+                self._spectrum(g)
+
+        self.times = {k: t for k,(v,t) in self._peaks.items()}
+        self.grad_peak = {a: self._peaks[a][0] for a in axes}
+        self.slew_peak = {a: self._peaks['slew ' + a][0] for a in axes}
+        self.vector_peak = self._peaks['vector'][0]
+        self.band_peak = [{a: self._peaks['band %d %s' % (n,a)][0] for a in axes}
+            for n in range(len(self.bands))]
+        self.grad_rms = ScanAnalysis(self.timeline).grad_rms
+
+        lim = self.limits
+        self.violations = []
+        for a in axes:
+            self._check('%s amplitude' % a,self.grad_peak[a],lim.grad_max,'mT/m',a)
+            self._check('%s slew rate' % a,self.slew_peak[a],lim.slew_max,'mT/m/ms',
+                'slew ' + a)
+            if self.grad_rms[a] > lim.rms_max*(1 + 1e-9):
+                self.violations.append('%s RMS amplitude %g mT/m exceeds %g mT/m' %
+                    (a,self.grad_rms[a],lim.rms_max))
+        self._check('Vector amplitude',self.vector_peak,lim.vector_max,'mT/m','vector')
+        for n,(fmin,fmax,amax) in enumerate(self.bands):
+            for a in axes:
+                self._check('%s harmonics in %g-%g kHz' % (a,fmin,fmax),
+                    self.band_peak[n][a],amax,'mT/m','band %d %s' % (n,a))
+        self.ok = not self.violations
+
+    def check(self):
+        '''
+        check() raises an Exception listing every violated limit
+        '''
+        if self.violations:
+            raise Exception('Gradient limits exceeded:\n' + '\n'.join(self.violations))
+
+    def _keep(self,name,val,t):
+        # largest value of every peak and the time it is first reached
+        if name not in self._peaks or val > self._peaks[name][0]:
+            self._peaks[name] = (val,t)
+
+    def _check(self,what,val,limit,unit,name):
+        if val > limit*(1 + 1e-9):
+            self.violations.append('%s %g %s exceeds %g %s at %g ms' %
+                (what,val,unit,limit,unit,self.times[name]))
+
+    def _rows(self,g,width):
+        # table entries split so that no intermediate exceeds the chunk size
+        step = max(1,self.chunk//max(width,1))
+        for r0 in range(0,len(g),step):
+            yield np.arange(r0,min(r0+step,len(g)))
+
+    def _amplitudes(self,g):
+        chans = np.array(g.channels)
+        t0,t1 = g.breaks[:-1],g.breaks[1:]
+        for rows in self._rows(g,len(t0)):
+            amps = g.amps[rows]
+            shift = g.start(rows)[:,None]
+
+            vec0,vec1 = 0.0,0.0
+            for axis in axes:
+                sel = chans == axis
+                if not np.any(sel):
+                    continue
+                a = amps[:,sel]
+                left,right,slope = a @ g.left[sel],a @ g.right[sel],a @ g.slope[sel]
+                vec0,vec1 = vec0 + left**2,vec1 + right**2
+
+                self._arg_keep(axis,np.abs(left),shift + t0)
+                self._arg_keep(axis,np.abs(right),shift + t1)
+                self._arg_keep('slew ' + axis,np.abs(slope),shift + t0)
+
+            # the norm of a line is convex, so its peak is at an end of the interval
+            self._arg_keep('vector',np.sqrt(vec0),shift + t0)
+            self._arg_keep('vector',np.sqrt(vec1),shift + t1)
+
+    def _arg_keep(self,name,vals,times):
+        i = np.argmax(vals)
+        t = np.broadcast_to(times,vals.shape).flat[i]
+        self._keep(name,float(vals.flat[i]),float(t))
+
+    def _spectrum(self,g):
+        if not len(self.bands):
+            return
+        tl = self.timeline
+        dwell = self.limits.dwell
+
+        # one period of the repeated waveform on the dwell raster, pieces reaching past
+        # the period fold back onto its start
+        t_start = g.breaks[0]
+        period = g.strides[-1] if len(g.loops) else g.breaks[-1] - t_start
+        nper = max(1,int(round(period/dwell)))
+        nwrap = -(-int(np.ceil((g.breaks[-1] - t_start)/period*nper))//nper)
+        tg = t_start + np.arange(max(nwrap,1)*nper)*period/nper
+
+        samples = np.empty((len(g.comps),nper))
+        for n,(leaf,sid) in enumerate(g.comps):
+            s = slice(tl.shape_off[sid],tl.shape_off[sid+1])
+            w = np.interp(tg,tl.shape_t[s] + leaf.offset,tl.shape_wave[s],left=0,right=0)
+            samples[n] = w.reshape(-1,nper).sum(axis=0)
+
+        # amplitude of each harmonic as a sinusoid
+        spec = np.fft.rfft(samples,axis=1)*2/nper
+        spec[:,0] /= 2
+        freq = np.arange(spec.shape[1])/period
+
+        chans = np.array(g.channels)
+        for n,(fmin,fmax,amax) in enumerate(self.bands):
+            cols = np.flatnonzero((freq >= fmin) & (freq <= fmax))
+            if not len(cols):
+                continue
+            for axis in axes:
+                sel = chans == axis
+                if not np.any(sel):
+                    continue
+                s = spec[sel][:,cols]
+                for rows in self._rows(g,len(cols)):
+                    amp = np.abs(g.amps[rows][:,sel] @ s)
+                    self._arg_keep('band %d %s' % (n,axis),amp,
+                        (g.start(rows) + t_start)[:,None])
@@ -0,0 +1,80 @@
+import numpy as np
+from mrpy.limits import gamma
+from mrpy.timeline import Timeline, piecewise
+
+class Trajectory:
+    '''
+    Trajectory(seq) computes the gradient moments and k-space position at every ADC
+    sample of a sequence, relative to the most recent RF pulse
+    
+        Trajectory(seq)
+        seq = a sequence object (e.g. a built GradientEcho) or a compiled Timeline
+        
+        Calculated parameters, per acquisition in time order:
+        t = ADC sample times, (nacq,npoints) ms
+        m0 = zeroth gradient moment, (nacq,npoints,3) along R, P, S, ms*mT/m
+        m1 = first gradient moment about the RF pulse, (nacq,npoints,3) ms^2*mT/m
+        k = k-space position, (nacq,npoints,3) 1/mm
+        
+        Per RF pulse in time order:
+        tex = reference time of the pulse (start + anchor), ms
+        residual = zeroth moment at the start of the next pulse (or the end of the
+            sequence), (nrf,3) ms*mT/m
+    
+    Every RF pulse is treated as an excitation that resets the moments. The gradients
+    are piecewise linear, so the moments are integrated exactly per linear piece and
+    accumulated with cumulative sums over all repetitions at once.
+    '''
+    def __init__(self,seq):
+        if not isinstance(seq,Timeline):
+            seq = Timeline.compile(seq)
+        self.timeline = seq
+        self.calc()
+    
+    def calc(self):
+        tl = self.timeline
+        grads = [tl.expand(axis) for axis in ('R','P','S')]
+        at,aw,aph,aoff = tl.expand('acq')
+        
+        rf = tl.events('rf')
+        anchors = np.array([leaf.obj.anchor if leaf.channel == 'rf' else 0.0
+            for leaf in tl.leaves])
+        self.tex = rf.start + anchors[rf.leaf]
+        
+        breaks = np.unique(np.concatenate([g[0] for g in grads] + [at,self.tex,rf.start]))
+        if len(breaks) < 2:
+            breaks = np.concatenate((breaks,breaks+1.0))[:2]
+        dt = np.diff(breaks)
+        
+        # most recent excitation at the start of every interval, and at every break
+        ex_int = np.searchsorted(self.tex,breaks[:-1],'right') - 1
+        ex_break = np.searchsorted(self.tex,breaks,'right') - 1
+        t_ex = np.where(ex_int >= 0,self.tex[np.maximum(ex_int,0)],breaks[0])
+        
+        m0 = np.zeros((3,len(breaks)))
+        m1 = np.zeros((3,len(breaks)))
+        for n,(t,wave,phase,off) in enumerate(grads):
+            mid,slope = piecewise(breaks,t,wave,off)
+            
+            # exact integrals of each linear piece, the first moment about the start
+            # of the piece is shifted to the excitation time
+            g0 = mid - slope*dt/2
+            i0 = mid*dt
+            i1 = g0*dt**2/2 + slope*dt**3/3 + (breaks[:-1]-t_ex)*i0
+            m0[n,1:] = np.cumsum(i0)
+            m1[n,1:] = np.cumsum(i1)
+        
+        # moments since the excitation in effect at each break
+        ex_idx = np.searchsorted(breaks,self.tex)
+        base = np.where(ex_break >= 0,ex_idx[np.maximum(ex_break,0)],0)
+        
+        nacq = len(aoff)-1
+        idx = np.searchsorted(breaks,at)
+        self.t = at.reshape(nacq,-1) if nacq else at
+        self.m0 = (m0[:,idx] - m0[:,base[idx]]).T.reshape(self.t.shape + (3,))
+        self.m1 = (m1[:,idx] - m1[:,base[idx]]).T.reshape(self.t.shape + (3,))
+        self.k = gamma/2/np.pi*self.m0/1000
+        
+        # moment accumulated from each excitation up to the start of the next pulse
+        end = np.append(np.searchsorted(breaks,rf.start[1:]),len(breaks)-1).astype(np.int64)
+        self.residual = (m0[:,end] - m0[:,ex_idx]).T
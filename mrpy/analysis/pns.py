@@ -0,0 +1,106 @@
+import numpy as np
+from mrpy.limits import PNSLimits
+from mrpy.timeline import Timeline
+from mrpy.analysis.scan import leaf_groups, GroupShapes
+
+axes = ('R','P','S')
+
+class PNS:
+    '''
+    PNS(seq) predicts peripheral nerve stimulation from the gradient slew rates of a
+    sequence with the SAFE model
+
+        PNS(seq,model)
+        seq = a sequence object (e.g. a built GradientEcho) or a compiled Timeline
+        model = class with tau, weight, threshold and g_scale attributes per axis, see
+            PNSLimits
+
+        Calculated parameters:
+        peak = peak stimulation as a fraction of the threshold, combined over the axes
+        time = time of the peak, ms
+        axis_peak = peak stimulation fraction of every axis on its own
+        axis_time = time of the peak of every axis, ms
+
+    Per axis the stimulation is g_scale/threshold times the weighted sum of
+    |lp(slew,tau1)|, lp(|slew|,tau2) and |lp(slew,tau3)|, where lp is a first order
+    low-pass filter with unit gain. The axes combine as the root of the sum of
+    squares. The stimulation scales with the slew rate, so dividing the rise times by
+    peak brings a sequence to the threshold.
+
+    The gradients are piecewise linear, so the slew rate is constant between
+    breakpoints and the filters are evaluated exactly by recursion over the intervals
+    of one repetition, for all repetitions of a loop nest at once (see ScanAnalysis).
+    Every repetition is taken to follow copies of itself, one stride of the innermost
+    loop apart: the filter state at its start is the periodic steady state, which is
+    exact for repeated waveforms and close for slowly changing ones (e.g. phase
+    encoding), as the state decays by exp(-TR/tau) per repetition.
+    '''
+    chunk = 2**16 # table entries filtered at once
+
+    def __init__(self,seq,model=PNSLimits):
+        if not isinstance(seq,Timeline):
+            seq = Timeline.compile(seq)
+        self.timeline = seq
+        self.model = model
+        self.calc()
+
+    def calc(self):
+        self.peak,self.time = 0.0,0.0
+        self.axis_peak = {a: 0.0 for a in axes}
+        self.axis_time = {a: 0.0 for a in axes}
+
+        for group in leaf_groups(self.timeline,axes,split=False):
+            g = GroupShapes(self.timeline,group)
+            if g.breaks is None:
+                continue
+            chans = np.array(g.channels)
+            t = g.breaks
+            for r0 in range(0,len(g),self.chunk):
+                rows = np.arange(r0,min(r0+self.chunk,len(g)))
+                shift = g.start(rows)[:,None] + t
+
+                total = 0.0
+                for n,axis in enumerate(axes):
+                    sel = chans == axis
+                    if not np.any(sel):
+                        continue
+                    stim = self._stimulation(g,g.amps[rows][:,sel] @ g.slope[sel],n)
+                    total = total + stim**2
+                    self._keep(stim,shift,axis)
+                self._keep(np.sqrt(total),shift)
+
+    def _keep(self,stim,times,axis=None):
+        i = np.argmax(stim)
+        val,t = float(stim.flat[i]),float(times.flat[i])
+        if axis is None:
+            if val > self.peak:
+                self.peak,self.time = val,t
+        elif val > self.axis_peak[axis]:
+            self.axis_peak[axis],self.axis_time[axis] = val,t
+
+    def _stimulation(self,g,slew,n):
+        # stimulation fraction of one axis at every breakpoint, (rows,nbreaks)
+        m = self.model
+        dt = np.diff(g.breaks)
+        period = g.strides[-1] if len(g.loops) else np.inf
+        gap = period - (g.breaks[-1] - g.breaks[0])
+
+        stim = 0.0
+        for tau,weight,mag in zip(m.tau[n],m.weight[n],(False,True,False)):
+            y = self._lowpass(np.abs(slew) if mag else slew,dt,tau,gap)
+            stim = stim + weight*(y if mag else np.abs(y))
+        return stim*m.g_scale[n]/m.threshold[n]
+
+    @staticmethod
+    def _lowpass(x,dt,tau,gap):
+        # exact response of dy/dt = (x-y)/tau to a piecewise constant input, starting
+        # from the periodic steady state with a gap of zero input after the last piece
+        decay = np.exp(-dt/tau)
+        y = np.zeros((len(x),len(dt)+1))
+        for i in range(len(dt)):
+            y[:,i+1] = y[:,i]*decay[i] + x[:,i]*(1 - decay[i])
+
+        # the state left after a period, y0*a + y[:,-1]*exp(-gap/tau), equals y0
+        a = np.exp(-(np.sum(dt) + gap)/tau)
+        y0 = y[:,-1]*np.exp(-gap/tau)/(1 - a)
+        return y + y0[:,None]*np.exp(-np.concatenate(([0],np.cumsum(dt)))/tau)
@@ -0,0 +1,177 @@
+import numpy as np
+from mrpy.timeline import Timeline, piecewise
+
+class ScanAnalysis:
+    '''
+    ScanAnalysis(seq) computes scan time, gradient duty cycle and RF energy of a
+    sequence in closed form, without expanding its loops
+    
+        ScanAnalysis(seq)
+        seq = a sequence object (e.g. a built GradientEcho) or a compiled Timeline
+        
+        Calculated parameters:
+        scan_time = total duration, ms
+        grad_energy = integral of G^2 per axis, (mT/m)^2*ms
+        grad_rms = RMS gradient amplitude over the scan per axis, mT/m
+        grad_peak = peak gradient amplitude per axis, mT/m
+        slew_peak = peak slew rate per axis, mT/m/ms
+        rf_energy = integral of |B1|^2, SAR proxy, kHz^2*ms
+        rf_rms = RMS B1 over the scan, kHz
+        rf_peak = peak B1, kHz
+    
+    Every waveform object is reduced to its unit shape and the table of amplitudes it
+    takes over the Lists of its loops (see Timeline). Objects on the same channel that
+    overlap inside the same loops are combined through the Gram matrix of their shapes,
+    so the energy is exact: sum over the List values of a.Q.a, scaled by the number of
+    repetitions of the loops the amplitudes do not depend on.
+    '''
+    def __init__(self,seq):
+        if not isinstance(seq,Timeline):
+            seq = Timeline.compile(seq)
+        self.timeline = seq
+        self.calc()
+    
+    def calc(self):
+        tl = self.timeline
+        self.scan_time = tl.dur
+        
+        stats = {}
+        for channel in ('R','P','S','rf'):
+            energy,peak,slew = 0.0,0.0,0.0
+            for group in self._groups(channel):
+                e,p,s = self._group_stats(group)
+                energy += e
+                peak = max(peak,p)
+                slew = max(slew,s)
+            stats[channel] = (energy,peak,slew)
+        
+        axes = ('R','P','S')
+        self.grad_energy = {a: stats[a][0] for a in axes}
+        self.grad_rms = {a: np.sqrt(stats[a][0]/self.scan_time) if self.scan_time else 0.0
+            for a in axes}
+        self.grad_peak = {a: stats[a][1] for a in axes}
+        self.slew_peak = {a: stats[a][2] for a in axes}
+        self.rf_energy = stats['rf'][0]
+        self.rf_rms = np.sqrt(self.rf_energy/self.scan_time) if self.scan_time else 0.0
+        self.rf_peak = stats['rf'][1]
+    
+    def _groups(self,channel):
+        return leaf_groups(self.timeline,(channel,))
+    
+    def _group_stats(self,group):
+        g = GroupShapes(self.timeline,group)
+        if g.breaks is None:
+            return 0.0,0.0,0.0
+        
+        # Gram matrix of the shapes, Simpson's rule is exact for products of lines
+        w = np.diff(g.breaks)/6
+        q = ((g.left*w) @ g.left.T + 4*(g.mid*w) @ g.mid.T + (g.right*w) @ g.right.T)
+        energy = g.mult*np.einsum('ri,ij,rj->',g.amps,q,g.amps)
+        
+        peak = max(np.max(np.abs(g.amps @ g.left)),np.max(np.abs(g.amps @ g.right)))
+        slew = np.max(np.abs(g.amps @ g.slope))
+        return energy,peak,slew
+
+def leaf_groups(tl,channels,split=True):
+    '''
+    leaf_groups(tl,channels,split) yields the leaves of a Timeline on the given channels
+    in groups: leaves repeated by the same loops whose windows overlap within a
+    repetition, or all leaves repeated by the same loops if split is False
+    '''
+    shape_dur = tl.shape_dur()
+    nests = {}
+    for leaf in tl.leaves:
+        if leaf.channel in channels:
+            key = (tuple(id(loop) for loop in leaf.loops),leaf.strides.tobytes())
+            nests.setdefault(key,[]).append(leaf)
+    
+    for leaves in nests.values():
+        leaves.sort(key=lambda leaf: leaf.offset)
+        if not split:
+            yield leaves
+            continue
+        group,end = [],-np.inf
+        for leaf in leaves:
+            if group and leaf.offset >= end - 1e-9:
+                yield group
+                group,end = [],-np.inf
+            group.append(leaf)
+            end = max(end,leaf.offset + np.max(shape_dur[leaf.shape_ids]))
+        if group:
+            yield group
+
+class GroupShapes:
+    '''
+    GroupShapes(tl,group) tabulates a group of leaves from leaf_groups() as unit shape
+    components on the union of their breakpoints, with the amplitude every component
+    takes over the loop values
+    
+        GroupShapes(tl,group)
+        tl = the compiled Timeline
+        group = list of Leaf objects sharing their loops
+        
+        loops, nreps, strides = loops of the group, their repetitions and strides
+        dep = loops any amplitude table depends on
+        table_shape = repetitions of the dependent loops, 1 for the others
+        mult = number of repetitions of the loops the amplitudes do not depend on
+        comps = (leaf, shape id) of every component
+        channels = channel of every component
+        amps = amplitude of every component per table entry, (ntable,ncomp)
+        breaks = breakpoints in the first repetition, ms (None for an empty group)
+        left, mid, right, slope = unit shape values at the start, middle and end of
+            every interval and their slopes, (ncomp,nbreaks-1)
+    '''
+    def __init__(self,tl,group):
+        leaf = group[0]
+        self.loops = leaf.loops
+        self.nreps = np.array(leaf.nreps,dtype=np.int64)
+        self.strides = leaf.strides
+        
+        self.dep = np.zeros(len(self.loops),dtype=bool)
+        for leaf in group:
+            self.dep |= np.array(leaf.shape_ids.shape) > 1
+        self.table_shape = tuple(np.where(self.dep,self.nreps,1))
+        self.mult = np.prod(self.nreps[~self.dep],dtype=np.float64)
+        
+        # one component per (leaf, shape), with its amplitude over the table
+        self.comps,self.channels,amps = [],[],[]
+        for leaf in group:
+            for sid in np.unique(leaf.shape_ids):
+                a = np.where(leaf.shape_ids == sid,leaf.amps,0.0)
+                self.comps.append((leaf,sid))
+                self.channels.append(leaf.channel)
+                amps.append(np.broadcast_to(a,self.table_shape).ravel())
+        self.amps = np.stack(amps,axis=1)
+        
+        # unit shapes on the union of their breakpoints, rounded so that pieces ending
+        # and starting at the same time do not leave slivers from round-off
+        t = [np.round(tl.shape_t[tl.shape_off[sid]:tl.shape_off[sid+1]] + leaf.offset,9)
+            for leaf,sid in self.comps]
+        self.breaks = np.unique(np.concatenate(t))
+        if len(self.breaks) < 2:
+            self.breaks = None
+            return
+        
+        dt = np.diff(self.breaks)
+        mid,slope = [],[]
+        for (leaf,sid),ti in zip(self.comps,t):
+            w = tl.shape_wave[tl.shape_off[sid]:tl.shape_off[sid+1]]
+            m,s = piecewise(self.breaks,ti,w,np.array([0,len(ti)]))
+            mid.append(m)
+            slope.append(s)
+        self.mid,self.slope = np.array(mid),np.array(slope)
+        self.left = self.mid - self.slope*dt/2
+        self.right = self.mid + self.slope*dt/2
+    
+    def __len__(self):
+        return len(self.amps)
+    
+    def start(self,entry):
+        '''
+        start(entry) returns the time shift of table entries relative to the first
+        repetition, ms
+        '''
+        if not len(self.loops):
+            return 0.0*np.asarray(entry,dtype=np.float64)
+        idx = np.unravel_index(entry,self.table_shape)
+        return sum(i*s for i,s in zip(idx,self.strides))
@@ -0,0 +1,3 @@
+from .base import Backend
+from .stream import StreamBackend
+from .scanner import MockScanner
\ No newline at end of file
@@ -0,0 +1,56 @@
+'''
+Serves a MockScanner, the local stand-in for a scanner that a StreamBackend streams to.
+
+    python -m mrpy.backend (--unix PATH | --port PORT | --stdio) [--depth 8]
+        [--speed 1]
+
+serves until interrupted and prints the statistics of every session. With --stdio
+one session is served over the standard input and output (statistics go to stderr),
+for a StreamBackend connected to the pipes of the process.
+'''
+import sys
+import json
+import asyncio
+import argparse
+from mrpy.backend import stream
+from mrpy.backend.scanner import MockScanner
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m mrpy.backend',
+        description=__doc__.strip().splitlines()[0])
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument('--unix',help='unix socket path to listen on')
+    where.add_argument('--port',type=int,help='TCP port to listen on (localhost)')
+    where.add_argument('--stdio',action='store_true',help='serve one session on stdio')
+    parser.add_argument('--depth',type=int,default=MockScanner.depth,
+        help='blocks the queue holds')
+    parser.add_argument('--speed',type=float,default=MockScanner.speed,
+        help='playback speed over real time')
+    args = parser.parse_args(argv)
+
+    scanner = MockScanner(depth=args.depth,speed=args.speed)
+    async def session(reader,writer):
+        await scanner.serve(reader,writer)
+        print(json.dumps(getattr(scanner,'stats',{})),flush=True)
+
+    async def serve():
+        if args.stdio:
+            await scanner.serve(*await stream.stdio())
+            print(json.dumps(getattr(scanner,'stats',{})),file=sys.stderr,flush=True)
+            return
+        if args.unix is not None:
+            server = await asyncio.start_unix_server(session,args.unix)
+        else:
+            server = await asyncio.start_server(session,'127.0.0.1',args.port)
+        print('listening on',args.unix or args.port,flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
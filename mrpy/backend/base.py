@@ -0,0 +1,47 @@
+from mrpy.timeline import Timeline
+
+class Backend:
+    '''
+    Backend is the interface of the hardware a compiled sequence is played on. run(seq)
+    compiles the sequence and play(timeline) hands it over block by block, calling
+
+        open(timeline) once before the first block, the shape library is
+            timeline.shapes (or the flat timeline.shape_t, shape_wave, shape_phase)
+        send(t0,t1,events) for every block, events maps each channel to the
+            EventTable of the events starting in [t0,t1)
+        close() once after the last block, its return value is returned by play
+
+        Backend(block)
+        block = block duration, ms, by default one period of the innermost loop (one
+            TR of GradientEcho)
+
+    The blocks come from Timeline.stream, which generates every block when it is asked
+    for, so the events of the whole sequence are never held at once. Backends that
+    pace the blocks themselves, like StreamBackend, override play instead.
+    '''
+    block = None
+
+    def __init__(self,**kwargs):
+        for key,value in kwargs.items():
+            setattr(self,key,value)
+
+    def run(self,seq):
+        '''
+        run(seq) plays a sequence object or a compiled Timeline
+        '''
+        return self.play(seq if isinstance(seq,Timeline) else Timeline.compile(seq))
+
+    def play(self,timeline):
+        self.open(timeline)
+        for t0,t1,events in timeline.stream(self.block):
+            self.send(t0,t1,events)
+        return self.close()
+
+    def open(self,timeline):
+        raise Exception('%s does not implement open' % type(self).__name__)
+
+    def send(self,t0,t1,events):
+        raise Exception('%s does not implement send' % type(self).__name__)
+
+    def close(self):
+        pass
@@ -0,0 +1,165 @@
+'''
+A local stand-in for the scanner end of a StreamBackend, for testing without hardware.
+python -m mrpy.backend serves one, see mrpy/backend/__main__.py.
+'''
+import json
+import time
+import asyncio
+import numpy as np
+from mrpy import export
+from mrpy.backend import stream
+
+class MockScanner:
+    '''
+    MockScanner(depth,speed) accepts sequences from a StreamBackend and plays them like a
+    scanner would: blocks wait in a queue of depth blocks and are consumed in real
+    time, scaled by speed
+
+        MockScanner(depth,speed,prefill,keep)
+        depth = number of blocks the queue holds, announced to the backend, their
+            duration has to cover the delays of the host and the connection
+        speed = playback speed over real time, a block of (t1 - t0) ms is consumed in
+            (t1 - t0)/speed ms, np.inf consumes blocks as soon as they arrive
+        prefill = number of blocks queued before playback starts (default depth)
+        keep = keep the received events
+
+        Calculated parameters (of the last session):
+        library = header and shape_off, shape_t, shape_wave, shape_phase of the
+            sequence, see stream.unpack_library
+        events = the received events, export.event_dtype (keep only)
+        stats = dict of the number of blocks, events and payload bytes received, dur
+            (ms of the sequence played), underruns (times the queue ran empty while
+            the next block was due), max_queue (most blocks queued) and wall (s)
+
+    Sessions are served one at a time. Blocks are checked to arrive in order, without
+    overlapping in time and with events inside the block and shapes from the library,
+    otherwise an error frame is sent and the session ends.
+    '''
+    depth = 8
+    speed = 1.0
+    prefill = None
+    keep = False
+
+    def __init__(self,**kwargs):
+        for key,value in kwargs.items():
+            setattr(self,key,value)
+        self.server = None
+
+    async def start(self,path=None,host='127.0.0.1',port=0):
+        '''
+        start(path,host,port) listens on a unix socket path, or on a TCP host and port
+        (0 picks a free one), and returns the address to connect to
+        '''
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.serve,path)
+            return path
+        self.server = await asyncio.start_server(self.serve,host,port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def serve(self,reader,writer):
+        '''
+        serve(reader,writer) runs one session over a pair of streams
+        '''
+        try:
+            writer.write(stream.frame(stream.hello,index=self.depth))
+            hdr,payload = await stream.read_frame(reader)
+            if hdr['kind'] != stream.library:
+                raise Exception('Expected the sequence library first')
+            self.library = stream.unpack_library(payload)
+
+            self.stats = {'blocks': 0,'events': 0,'bytes': 0,'dur': 0.0,'underruns': 0,
+                'max_queue': 0,'wall': 0.0}
+            self._received = []
+            self._ready = asyncio.Event()
+            queue = asyncio.Queue()
+            start = time.perf_counter()
+            tasks = [asyncio.ensure_future(task) for task in
+                (self._receive(reader,queue),self._play(writer,queue))]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+
+            self.stats['wall'] = time.perf_counter() - start
+            self.events = (np.concatenate(self._received) if self._received else
+                np.zeros(0,dtype=export.event_dtype)) if self.keep else None
+            writer.write(stream.frame(stream.done,json.dumps(self.stats).encode()))
+            await writer.drain()
+        except (asyncio.IncompleteReadError,ConnectionError):
+            pass
+        except Exception as e:
+            writer.write(stream.frame(stream.error,str(e).encode()))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def _receive(self,reader,queue):
+        nshapes = int(self.library[0]['nshapes'])
+        prefill = self.depth if self.prefill is None else self.prefill
+        last = -np.inf
+        while True:
+            hdr,payload = await stream.read_frame(reader)
+            if hdr['kind'] == stream.end:
+                await queue.put(None)
+                self._ready.set()
+                return
+            if hdr['kind'] != stream.block:
+                raise Exception('Unexpected frame %d' % hdr['kind'])
+
+            t0,t1 = float(hdr['t0']),float(hdr['t1'])
+            if hdr['index'] != self.stats['blocks']:
+                raise Exception('Block %d arrived out of order' % hdr['index'])
+            if t0 < last or t1 < t0:
+                raise Exception('Block %d overlaps the one before' % hdr['index'])
+            if len(payload) % export.event_dtype.itemsize:
+                raise Exception('Block %d is not a whole number of events' % hdr['index'])
+            events = np.frombuffer(payload,dtype=export.event_dtype)
+            if len(events) and (np.any(events['start'] < t0) or
+                    np.any(events['start'] >= t1)):
+                raise Exception('Block %d holds events outside of it' % hdr['index'])
+            if np.any((events['shape'] < 0) | (events['shape'] >= nshapes)):
+                raise Exception('Block %d refers to unknown shapes' % hdr['index'])
+            last = t1
+
+            self.stats['blocks'] += 1
+            self.stats['events'] += len(events)
+            self.stats['bytes'] += len(payload)
+            if self.keep:
+                self._received.append(events)
+            await queue.put((int(hdr['index']),t0,t1))
+            self.stats['max_queue'] = max(self.stats['max_queue'],queue.qsize())
+            if queue.qsize() >= prefill:
+                self._ready.set()
+
+    async def _play(self,writer,queue):
+        # playback starts once the queue is filled, every block is due when the one
+        # before has played and plays late after an underrun
+        await self._ready.wait()
+        loop = asyncio.get_running_loop()
+        due = loop.time()
+        while True:
+            late = queue.empty()
+            item = await queue.get()
+            if item is None:
+                return
+            index,t0,t1 = item
+            writer.write(stream.frame(stream.ack,index=index))
+            await writer.drain()
+            if late:
+                self.stats['underruns'] += 1
+                due = max(due,loop.time())
+            due += (t1 - t0)/self.speed/1000
+            if due > loop.time():
+                await asyncio.sleep(due - loop.time())
+            self.stats['dur'] += t1 - t0
@@ -0,0 +1,236 @@
+'''
+Streaming of compiled sequences to a scanner over a local socket or pipe. Both ends
+exchange frames, a frame_dtype header followed by nbytes of payload, little endian:
+
+    hello       scanner -> host, index = number of blocks its queue holds
+    library     host -> scanner, the export header and shape library of the sequence
+                (the first two sections of a binary sequence file, see mrpy.export)
+    block       host -> scanner, block index of the sequence covering [t0,t1) ms, the
+                events starting in it as export.event_dtype records
+    end         host -> scanner, no more blocks follow
+    ack         scanner -> host, block index has left the queue to be played
+    done        scanner -> host, after the last block has played, JSON statistics
+    error       either way, a message, the connection is closed after it
+
+The host never has more blocks sent and not acknowledged than the scanner queue holds,
+so a scanner that plays in real time holds the host back (backpressure) and the host
+only needs to stay a queue length ahead of it.
+'''
+import sys
+import json
+import asyncio
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from mrpy import export
+from mrpy.backend.base import Backend
+
+frame_dtype = np.dtype([('kind','<u4'),('index','<u4'),('nbytes','<u8'),('t0','<f8'),
+    ('t1','<f8')])
+
+hello, library, block, end, ack, done, error = range(1,8)
+
+def frame(kind,payload=b'',index=0,t0=0.0,t1=0.0):
+    '''
+    frame(kind,payload,index,t0,t1) returns a frame as bytes
+    '''
+    hdr = np.zeros(1,dtype=frame_dtype)
+    hdr['kind'],hdr['index'],hdr['nbytes'] = kind,index,len(payload)
+    hdr['t0'],hdr['t1'] = t0,t1
+    return hdr.tobytes() + bytes(payload)
+
+async def read_frame(reader):
+    '''
+    read_frame(reader) returns the header and payload of the next frame of a stream
+    '''
+    hdr = np.frombuffer(await reader.readexactly(frame_dtype.itemsize),
+        dtype=frame_dtype)[0]
+    payload = await reader.readexactly(int(hdr['nbytes']))
+    if hdr['kind'] == error:
+        raise Exception('Remote error: ' + payload.decode(errors='replace'))
+    return hdr,payload
+
+def pack_library(timeline):
+    '''
+    pack_library(timeline) returns the library payload of a compiled sequence
+    '''
+    hdr = np.zeros(1,dtype=export.header_dtype)
+    hdr['magic'] = export.magic
+    hdr['version'] = export.version
+    hdr['nshapes'] = len(timeline.shapes)
+    hdr['nlib'] = len(timeline.shape_t)
+    hdr['nevents'] = sum(len(leaf) for leaf in timeline.leaves)
+    hdr['lib_off'] = export.header_dtype.itemsize
+    hdr['dur'] = timeline.dur
+    return b''.join([hdr.tobytes(),timeline.shape_off.astype('<i8').tobytes()] +
+        [arr.astype('<f8').tobytes() for arr in
+        (timeline.shape_t,timeline.shape_wave,timeline.shape_phase)])
+
+def unpack_library(payload):
+    '''
+    unpack_library(payload) returns the header and the shape_off, shape_t, shape_wave
+    and shape_phase arrays of a library payload
+    '''
+    hdr = np.frombuffer(payload,dtype=export.header_dtype,count=1)[0]
+    if hdr['magic'] != export.magic:
+        raise Exception('Not an mrpy sequence library')
+    if hdr['version'] > export.version:
+        raise Exception('Unsupported sequence library version %d' % hdr['version'])
+    nshapes,nlib = int(hdr['nshapes']),int(hdr['nlib'])
+    off = int(hdr['lib_off'])
+    if len(payload) != off + 8*(nshapes+1) + 3*8*nlib:
+        raise Exception('Sequence library payload has the wrong size')
+    shape_off = np.frombuffer(payload,dtype='<i8',count=nshapes+1,offset=off)
+    off += 8*(nshapes+1)
+    t,wave,phase = [np.frombuffer(payload,dtype='<f8',count=nlib,offset=off+8*nlib*n)
+        for n in range(3)]
+    return hdr,shape_off,t,wave,phase
+
+async def connect(address):
+    '''
+    connect(address) opens the streams to a scanner at a unix socket path or a
+    (host,port) TCP address, a (reader,writer) pair of streams is used as is
+    '''
+    if isinstance(address,str):
+        return await asyncio.open_unix_connection(address)
+    if isinstance(address[0],asyncio.StreamReader):
+        return address
+    return await asyncio.open_connection(*address)
+
+async def stdio():
+    '''
+    stdio() returns a (reader,writer) pair of streams over the standard input and output
+    of the process
+    '''
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+        sys.stdin.buffer)
+    transport,protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin,
+        sys.stdout.buffer)
+    return reader,asyncio.StreamWriter(transport,protocol,reader,loop)
+
+class StreamBackend(Backend):
+    '''
+    StreamBackend(address) streams compiled sequences block by block to a scanner,
+    see MockScanner for a local stand-in
+
+        StreamBackend(address,block,batch,lookahead)
+        address = unix socket path, (host,port) or a (reader,writer) pair of asyncio
+            streams, e.g. the pipes of a subprocess
+        block = block duration, ms, by default one TR (see Backend)
+        batch = number of blocks generated at once
+        lookahead = number of batches generated ahead of the one being sent
+
+        Calculated parameters (of the last run):
+        blocks, events, bytes = number of blocks, events and payload bytes sent
+        wait_generate = time the sender waited for a block to be generated, s
+        wait_scanner = time the sender waited for room in the scanner queue, s
+        result = statistics returned by the scanner after the last block
+
+    Three tasks run at once: a thread generates and packs the next batches of blocks
+    into a queue of lookahead batches (two by default, one being sent while the next
+    is generated), the sender writes the blocks as the scanner acknowledges earlier
+    ones, and the receiver reads those acknowledgements. A batch is taken from
+    Timeline.stream as one long block and split, which costs little more than a single
+    block. play(timeline) runs the tasks in a new event loop, play_async in a running
+    one. Generation that falls behind the scanner shows up as wait_generate and as
+    underruns in result.
+    '''
+    address = None
+    batch = 64
+    lookahead = 2
+
+    def play(self,timeline):
+        return asyncio.run(self.play_async(timeline))
+
+    async def play_async(self,timeline):
+        self.blocks = self.events = self.bytes = 0
+        self.wait_generate = self.wait_scanner = 0.0
+        reader,writer = await connect(self.address)
+        try:
+            hdr,payload = await read_frame(reader)
+            if hdr['kind'] != hello:
+                raise Exception('Expected a hello frame from the scanner')
+            credit = asyncio.Semaphore(max(int(hdr['index']),1))
+
+            writer.write(frame(library,pack_library(timeline),t1=timeline.dur))
+            queue = asyncio.Queue(max(self.lookahead,1))
+            tasks = [asyncio.ensure_future(task) for task in (
+                self._generate(timeline,queue),
+                self._send(queue,writer,credit),
+                self._receive(reader,credit))]
+            try:
+                self.result = (await asyncio.gather(*tasks))[-1]
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError,BrokenPipeError):
+                pass
+        return self.result
+
+    async def _generate(self,timeline,queue):
+        # one worker thread steps the stream generator, None marks its end
+        loop = asyncio.get_running_loop()
+        dur = self.block or timeline.period()
+        batches = timeline.stream(dur*self.batch)
+        end = timeline.dur
+        def generate():
+            item = next(batches,None)
+            if item is None:
+                return None
+            t0,t1,events = item
+            events = export.pack(events)
+
+            # the blocks of the batch up to the one the sequence ends in
+            n = min(self.batch,max(int(np.ceil((end - t0)/dur - 1e-9)),1))
+            edges = t0 + dur*np.arange(n + 1)
+            if n == self.batch:
+                edges[-1] = t1
+            split = np.searchsorted(events['start'],edges[1:-1])
+            return list(zip(edges[:-1],edges[1:],np.split(events,split)))
+
+        with ThreadPoolExecutor(1) as pool:
+            while True:
+                item = await loop.run_in_executor(pool,generate)
+                await queue.put(item)
+                if item is None:
+                    break
+
+    async def _send(self,queue,writer,credit):
+        loop = asyncio.get_running_loop()
+        while True:
+            t = loop.time()
+            batch = await queue.get()
+            self.wait_generate += loop.time() - t
+            if batch is None:
+                writer.write(frame(end))
+                await writer.drain()
+                return
+
+            for t0,t1,events in batch:
+                # backpressure: wait until the scanner queue has room for the block
+                t = loop.time()
+                await credit.acquire()
+                self.wait_scanner += loop.time() - t
+
+                payload = events.tobytes()
+                writer.write(frame(block,payload,self.blocks,t0,t1))
+                await writer.drain()
+                self.blocks += 1
+                self.events += len(events)
+                self.bytes += len(payload)
+
+    async def _receive(self,reader,credit):
+        while True:
+            hdr,payload = await read_frame(reader)
+            if hdr['kind'] == ack:
+                credit.release()
+            elif hdr['kind'] == done:
+                return json.loads(payload.decode())
+            else:
+                raise Exception('Unexpected frame %d from the scanner' % hdr['kind'])
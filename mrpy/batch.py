@@ -0,0 +1,157 @@
+import os
+import json
+import hashlib
+import multiprocessing
+import numpy as np
+import mrpy
+from mrpy.gradientecho import GradientEcho
+from mrpy.sim import SequenceSim, BlochSim
+
+def _plain(val):
+    # JSON compatible form of serialize() output, numpy values become python values
+    if isinstance(val,dict):
+        return {str(k): _plain(v) for k,v in val.items()}
+    if isinstance(val,np.ndarray):
+        return val.tolist()
+    if isinstance(val,(list,tuple)):
+        return [_plain(v) for v in val]
+    if isinstance(val,np.generic):
+        return val.item()
+    return val
+
+def _arrays(val):
+    # undo the JSON conversion: lists of numbers become numpy arrays again
+    if isinstance(val,dict):
+        return {k: _arrays(v) for k,v in val.items()}
+    if isinstance(val,list):
+        return np.array(val)
+    return val
+
+def protocol_hash(parms,*extra):
+    '''
+    protocol_hash(parms,*extra) returns a stable hex digest of serialized parameters,
+    the library version and any extra values (e.g. the task name)
+    '''
+    text = json.dumps([_plain(parms),mrpy.__version__,_plain(list(extra))],sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def render(seq):
+    '''
+    render(seq) compiles a sequence and returns its waveforms as a dict of arrays
+    '''
+    s = SequenceSim()
+    s.run(seq,render=False)
+    out = {}
+    for name,wave in list(s.grad.items()) + [('rf',s.rf),('acq',s.acq)]:
+        out[name+'_t'] = wave.t
+        out[name+'_wave'] = wave.wave
+        out[name+'_off'] = wave.off
+    return out
+
+def simulate(seq,spins):
+    '''
+    simulate(seq,spins) returns the Bloch simulated ADC samples of a sequence
+    '''
+    return {'signal': BlochSim(seq).run(spins)}
+
+_worker = {}
+
+def _init_worker(seqclass,task,spins):
+    _worker.update(seqclass=seqclass,task=task,spins=spins)
+
+def _run_one(job):
+    parms,path = job
+    seq = _worker['seqclass'](**_arrays(parms))
+    if _worker['task'] == 'simulate':
+        res = simulate(seq,_worker['spins'])
+    else:
+        res = render(seq)
+    res['te'] = seq.te
+    res['tr'] = seq.tr
+
+    # write next to the final name and rename, so a crashed run leaves no partial file
+    tmp = path + '.%d.tmp' % os.getpid()
+    with open(tmp,'wb') as f:
+        np.savez(f,**res)
+    os.replace(tmp,path)
+    return path
+
+class Batch:
+    '''
+    Batch builds, renders or simulates many serialized protocols in worker processes
+    and caches the results on disk
+
+        Batch(cache_dir,task,workers,seqclass,spins)
+        cache_dir = directory the .npz results are stored in
+        task = 'render' (waveforms) or 'simulate' (Bloch simulated ADC samples)
+        workers = number of worker processes
+        seqclass = sequence class the protocols are passed to, GradientEcho by default
+        spins = Isochromats, required for task='simulate'
+
+    Results are keyed by a hash of the protocol, the task, the spins and the library
+    version, so protocols that were already processed are loaded instead of rebuilt.
+    '''
+    def __init__(self,cache_dir,task='render',workers=None,seqclass=GradientEcho,
+            spins=None):
+        if task not in ('render','simulate'):
+            raise Exception('Unknown batch task: ' + task)
+        if task == 'simulate' and spins is None:
+            raise Exception('Batch simulation requires spins')
+
+        self.cache_dir = cache_dir
+        self.task = task
+        self.workers = workers or os.cpu_count()
+        self.seqclass = seqclass
+        self.spins = spins
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir,exist_ok=True)
+
+    def path(self,parms):
+        return self._path(parms,self._spin_digest())
+
+    def _path(self,parms,digest):
+        key = protocol_hash(parms,self.task,self.seqclass.__name__,digest)
+        return os.path.join(self.cache_dir,key + '.npz')
+
+    def _spin_digest(self):
+        # the contents are hashed on every run, so spins changed in place are seen,
+        # which is cheap next to simulating them
+        if self.spins is None:
+            return None
+        data = np.ascontiguousarray(self.spins.pack()).tobytes()
+        return hashlib.sha256(data).hexdigest()
+
+    def run(self,protocols):
+        '''
+        run(protocols) processes a list of serialize() dictionaries and returns the
+        result of each as a dict of arrays, in the same order
+        '''
+        protocols = [_plain(p) for p in protocols]
+        digest = self._spin_digest()
+        paths = [self._path(p,digest) for p in protocols]
+
+        # unchanged protocols (and duplicates within this batch) are only built once
+        todo = {}
+        for parms,path in zip(protocols,paths):
+            if not os.path.exists(path) and path not in todo:
+                todo[path] = parms
+        self.misses += len(todo)
+        self.hits += len(paths) - len(todo)
+
+        jobs = [(parms,path) for path,parms in todo.items()]
+        args = (self.seqclass,self.task,self.spins)
+        if self.workers > 1 and len(jobs) > 1:
+            with multiprocessing.Pool(min(self.workers,len(jobs)),_init_worker,args) as pool:
+                for path in pool.imap_unordered(_run_one,jobs):
+                    pass
+        else:
+            _init_worker(*args)
+            for job in jobs:
+                _run_one(job)
+
+        results = []
+        for path in paths:
+            with np.load(path) as f:
+                results.append(dict(f))
+        return results
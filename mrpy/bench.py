@@ -0,0 +1,198 @@
+'''
+Benchmarks of the hot paths: GradientEcho construction, traversal of the loops by
+SequenceSim, RF and gradient waveform generation, List arithmetic, the phantom
+reconstruction, the rasterization to DAC codes and the EPG steady state, over several
+matrix sizes. Run as
+
+    python -m mrpy.bench [--sizes 64x64x1,128x128x32] [--cases build,traverse]
+        [--repeat 3] [--output bench.json] [--baseline base.json] [--threshold 0.2]
+
+The wall clock time (best of the repeats) and the peak traced memory of every case
+are written as JSON. With a baseline every metric is compared against it and the exit
+status is 1 if any of them grew by more than the threshold.
+'''
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+import mrpy
+from mrpy.seq import List
+from mrpy.cache import waveforms
+from mrpy.gradientecho import GradientEcho
+from mrpy.sim import SequenceSim, CartesianRecon, EPG
+from mrpy.rf import excitation_pulses, refocusing_pulses
+from mrpy.grad import TrapGradient
+from mrpy.timeline import Timeline
+from mrpy.raster import Raster
+
+sizes = ((64,64,1),(128,128,32),(256,256,128))
+
+# differences below these are measurement noise, not regressions
+min_change = {'time': 1e-3,'memory': 1 << 20} # s, bytes
+
+def protocol(size):
+    '''
+    protocol(size) returns the GradientEcho parameters benchmarked at a matrix size
+    '''
+    return {
+        'tr': 0,
+        'te': 0,
+        'ss': {'thk': 5,'flip': 20,'pulse_dur': 2.0,'pulse': 'gauss'},
+        'enc': {'fov': np.array([240.,240.,120.]),'img_matrix': np.array(size),
+            'dwell': 0.010},
+    }
+
+# every case is set up for a size and returns the function that is timed
+
+def _build(size):
+    parms = protocol(size)
+    return lambda: GradientEcho(**parms)
+
+def _traverse(size):
+    seq = GradientEcho(**protocol(size))
+    return lambda: SequenceSim().run(seq,render=False)
+
+def _waveforms(size):
+    pulses = set(excitation_pulses.values()) | set(refocusing_pulses.values())
+    areas = List(np.linspace(-1,1,size[1]*size[2])*20.0)
+    def run():
+        # designs are memoized, the cache is emptied to time them
+        waveforms.clear()
+        for pulse in pulses:
+            pulse(dur=2.0,flip=90).get_wave()
+        for slew in (None,100.0):
+            TrapGradient.by_area(area=areas,axis='P',slew=slew).get_wave()
+    return run
+
+def _lists(size):
+    a = List(np.arange(np.prod(size),dtype=np.float64))
+    b = List(np.linspace(-1,1,np.prod(size)))
+    def run():
+        c = (a*2.0 + b)/3.0 - abs(b)*a
+        return c.vals,c.value()
+    return run
+
+def _recon(size):
+    seq = GradientEcho(**protocol(size))
+    return lambda: CartesianRecon(seq)
+
+def _raster(size):
+    tl = Timeline.compile(GradientEcho(**protocol(size)))
+    return lambda: Raster(tl,dac=True)
+
+def _epg(size):
+    # a grid of T1, T2 and up to 16 flip angles, a million combinations at the
+    # largest size
+    t1,t2,flip = np.meshgrid(np.linspace(300,2000,size[0]),np.linspace(20,150,size[1]),
+        np.linspace(2,40,min(size[2],16)),indexing='ij')
+    return lambda: EPG(None,t1=t1,t2=t2,flip=flip,tr=8.0,te=3.0,steady=True)
+
+cases = {
+    'build': _build,
+    'traverse': _traverse,
+    'waveforms': _waveforms,
+    'lists': _lists,
+    'recon': _recon,
+    'raster': _raster,
+    'epg': _epg,
+}
+
+def measure(func,repeat=3):
+    '''
+    measure(func,repeat) returns the best wall clock time of func() over repeat runs
+    (s) and its peak traced memory (bytes), after one run that warms up the caches
+    '''
+    func()
+
+    # traced apart from the timed runs, tracing slows down the allocations it follows
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    best = np.inf
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best,time.perf_counter() - t0)
+    return {'time': best,'memory': peak}
+
+def run(sizes=sizes,names=None,repeat=3):
+    '''
+    run(sizes,names,repeat) runs the benchmark cases (all by default) at every matrix
+    size and returns the results as a JSON compatible dict, keyed 'case/RxPxS'
+    '''
+    results = {}
+    for name in names or cases:
+        if name not in cases:
+            raise Exception('Unknown benchmark case: ' + name)
+        for size in sizes:
+            func = cases[name](size)
+            results['%s/%s' % (name,'x'.join(str(n) for n in size))] = measure(func,repeat)
+    return {
+        'version': mrpy.__version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+def compare(current,baseline,threshold=0.2):
+    '''
+    compare(current,baseline,threshold) returns the metrics of current that grew by
+    more than the fraction threshold over baseline, as (key,metric,baseline,current)
+    tuples. Cases missing from either are skipped.
+    '''
+    regressions = []
+    for key,res in sorted(current['results'].items()):
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        for metric,val in sorted(res.items()):
+            ref = base.get(metric)
+            if ref is None:
+                continue
+            if val > ref*(1 + threshold) and val - ref > min_change.get(metric,0):
+                regressions.append((key,metric,ref,val))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m mrpy.bench',
+        description='Benchmark mrpy and compare against a baseline')
+    parser.add_argument('--sizes',default=','.join('x'.join(str(n) for n in s)
+        for s in sizes),help='matrix sizes, e.g. 64x64x1,128x128x32')
+    parser.add_argument('--cases',default=','.join(cases),help='benchmark cases to run')
+    parser.add_argument('--repeat',type=int,default=3,help='timed runs per case')
+    parser.add_argument('--output',help='write the results to this JSON file')
+    parser.add_argument('--baseline',help='JSON results to compare against')
+    parser.add_argument('--threshold',type=float,default=0.2,
+        help='allowed growth of every metric over the baseline, fraction')
+    args = parser.parse_args(argv)
+
+    run_sizes = [tuple(int(n) for n in s.split('x')) for s in args.sizes.split(',')]
+    current = run(run_sizes,args.cases.split(','),args.repeat)
+    for key,res in sorted(current['results'].items()):
+        print('%-28s %10.4f s %10.1f MB' % (key,res['time'],res['memory']/2**20))
+
+    if args.output:
+        with open(args.output,'w') as f:
+            json.dump(current,f,indent=1,sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current,baseline,args.threshold)
+        for key,metric,ref,val in regressions:
+            print('REGRESSION %s %s: %.4g -> %.4g (%+.0f%%)' % (key,metric,ref,val,
+                100*(val/ref - 1)))
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import numpy as np
+from collections import OrderedDict
+
+class WaveformCache:
+    '''
+    WaveformCache is a bounded, least recently used cache of waveform arrays
+
+        WaveformCache(maxsize)
+        maxsize = number of entries kept before the oldest is evicted
+
+        hits, misses = lookup counters
+
+    Cached arrays are made read-only, so they can be handed out to every caller
+    without copying.
+    '''
+    def __init__(self,maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self,key):
+        return key in self._entries
+
+    def get(self,key,func):
+        '''
+        get(key,func) returns the cached entry for key, calling func() to create it on
+        a miss. func returns an array or a tuple of arrays.
+        '''
+        try:
+            val = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            val = func()
+            if isinstance(val,tuple):
+                val = tuple(self._freeze(v) for v in val)
+            else:
+                val = self._freeze(val)
+
+            self._entries[key] = val
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return val
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return val
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return {'hits': self.hits,'misses': self.misses,'size': len(self._entries),
+            'maxsize': self.maxsize}
+
+    @staticmethod
+    def _freeze(val):
+        if isinstance(val,np.ndarray):
+            val.flags.writeable = False
+        return val
+
+# shared by the RF pulses and gradients
+waveforms = WaveformCache()
@@ -2,13 +2,27 @@ import numpy as np
 from . import Encoding
 import mrpy.seq as seq
 import mrpy.limits as limits
-from mrpy.grad import trap
+from mrpy.grad import trap, design
+from . import sampling
 
 class CartesianEncoding(seq.Composite):
-    req_parms = ('fov','img_matrix','dwell','enc_matrix')
+    req_parms = ('fov','img_matrix','dwell','enc_matrix','slew','partial_fourier','accel',
+        'acs','pattern','reorder','seed')
     offset = np.array([0,0,0])
     dwell = 0.020
     enc_matrix = None
+    slew = None # mT/m/ms, time-optimal gradients instead of the fixed rise time
+    moment = None # extra area of the pre-encoding gradients along R, P, S, ms*mT/m
+    
+    # sampling pattern of the phase encoding steps, see encoding.sampling
+    partial_fourier = (1,1) # fraction of the pe1 and pe2 lines acquired, from 0.5
+    accel = (1,1) # undersampling of pe1 and pe2, every accel-th line
+    acs = (0,0) # fully sampled autocalibration lines of pe1 and pe2 around the center
+    pattern = None # 'poisson' (variable density, accel[0]*accel[1] overall),
+                   # 'elliptical' (the lines above without the corners of k-space) or
+                   # an (npe2,npe1) bool mask, all make the pe steps joint
+    reorder = 'linear' # 'linear', 'centric' or 'elliptical'
+    seed = 0 # of the Poisson-disc mask
     
     def build(self,before_dur=0,after_dur=0):
     
@@ -22,7 +36,12 @@ class CartesianEncoding(seq.Composite):
         ##########################
         grad_str = 2*np.pi/self.dwell/self.fov[0]/limits.gamma * 1000 # mT/m
         dur = self.enc_matrix[0]*self.dwell
-        self.ro_grad = trap.ConstGradient(gmax=grad_str,top_dur=dur,axis='R')
+        if self.slew is None:
+            self.ro_grad = trap.ConstGradient(gmax=grad_str,top_dur=dur,axis='R')
+        else:
+            ramp = abs(grad_str)/self.slew
+            self.ro_grad = trap.ConstGradient(gmax=grad_str,top_dur=dur,axis='R',
+                trise=ramp,tfall=ramp)
         self.ro_grad.anchor = self.ro_grad.dur/2
         self.acq = seq.Acquisition(dwell=self.dwell,npoints=self.enc_matrix[0])
         self.acq.dfdz = limits.gamma/2/np.pi*grad_str
@@ -31,29 +50,43 @@ class CartesianEncoding(seq.Composite):
         # build pre-encoding gradients
         ##########################
         pp_area = -self.ro_grad.area/2
-        pe1_area = -np.pi*(self.enc_matrix[1]-1)/self.fov[1]/limits.gamma * 1000 # mT/m
-        npe1 = self.enc_matrix[1]/2
-        pe1_list = seq.List(np.arange(np.floor(-npe1+1),np.floor(npe1)+1)/npe1)
-        pe2_area = -np.pi*(self.enc_matrix[2]-1)/self.fov[2]/limits.gamma * 1000 # mT/m
-        npe2 = self.enc_matrix[2]/2
-        pe2_list = seq.List(np.arange(np.floor(-npe2+1),np.floor(npe2)+1)/npe2)
+        pe1_area = -np.pi*self.enc_matrix[1]/self.fov[1]/limits.gamma * 1000 # mT/m
+        pe2_area = -np.pi*self.enc_matrix[2]/self.fov[2]/limits.gamma * 1000 # mT/m
+        self.build_pattern()
+        pe1_list = seq.List(self.pe1_lines/(self.enc_matrix[1]/2))
+        pe2_list = seq.List(self.pe2_lines/(self.enc_matrix[2]/2))
+        
+        moment = np.zeros(3) if self.moment is None else self.moment
+        pre_area = (pp_area + moment[0],pe1_area*pe1_list + moment[1],
+            pe2_area*pe2_list + moment[2])
         
-        min_dur = trap.TrapGradient.calc_min_dur(pp_area)
-        min_dur = max(min_dur,trap.TrapGradient.calc_min_dur(pe1_area))
-        min_dur = max(min_dur,trap.TrapGradient.calc_min_dur(pe1_area))
+        if self.slew is None:
+            min_dur = trap.TrapGradient.calc_min_dur(pp_area)
+            min_dur = max(min_dur,trap.TrapGradient.calc_min_dur(pe1_area))
+            min_dur = max(min_dur,trap.TrapGradient.calc_min_dur(pe2_area))
+        else:
+            # the three axes share the pre- and post-encoding windows
+            min_dur = design.joint_min_dur(pre_area,limits.GradientLimits.grad_lim,
+                self.slew)
         
         before_dur = max(before_dur,min_dur)
-        self.pp_grad = trap.TrapGradient.by_area(area=pp_area,dur=before_dur,axis='R')
-        self.pe1_grad = trap.TrapGradient.by_area(area=pe1_area*pe1_list,dur=before_dur,axis='P')
-        self.pe2_grad = trap.TrapGradient.by_area(area=pe2_area*pe2_list,dur=before_dur,axis='S')
+        self.pp_grad = trap.TrapGradient.by_area(area=pre_area[0],dur=before_dur,axis='R',
+            slew=self.slew)
+        self.pe1_grad = trap.TrapGradient.by_area(area=pre_area[1],dur=before_dur,
+            axis='P',slew=self.slew)
+        self.pe2_grad = trap.TrapGradient.by_area(area=pre_area[2],dur=before_dur,
+            axis='S',slew=self.slew)
         
         ##########################
         # create copies for post readout
         ##########################
         after_dur = max(after_dur,min_dur)
-        self.ppr_grad = trap.TrapGradient.by_area(area=pp_area,dur=after_dur,axis='R')
-        self.pe1r_grad = trap.TrapGradient.by_area(area=-pe1_area*pe1_list,dur=after_dur,axis='P')
-        self.pe2r_grad = trap.TrapGradient.by_area(area=-pe2_area*pe2_list,dur=after_dur,axis='S')
+        self.ppr_grad = trap.TrapGradient.by_area(area=pp_area,dur=after_dur,axis='R',
+            slew=self.slew)
+        self.pe1r_grad = trap.TrapGradient.by_area(area=-pe1_area*pe1_list,dur=after_dur,
+            axis='P',slew=self.slew)
+        self.pe2r_grad = trap.TrapGradient.by_area(area=-pe2_area*pe2_list,dur=after_dur,
+            axis='S',slew=self.slew)
         
         ##########################
         # create the composite objects interfaced by other sequences
@@ -62,4 +95,43 @@ class CartesianEncoding(seq.Composite):
         self.readout.anchor = self.readout.dur/2
         self.before = seq.Composite(dur=before_dur,parts=[self.pp_grad,self.pe1_grad,self.pe2_grad])
         self.after = seq.Composite(dur=after_dur,parts=[self.ppr_grad,self.pe1r_grad,self.pe2r_grad])
+    
+    def build_pattern(self):
+        # lines of the phase encoding steps in acquisition order. A grid of pe1 and pe2
+        # lines is looped over by separate loops, other patterns pair every pe1 step
+        # with its pe2 step (joint), the GradientEcho then has one loop over them.
+        n1,n2 = int(self.enc_matrix[1]),int(self.enc_matrix[2])
+        keep1 = sampling.axis_mask(n1,self.partial_fourier[0],self.accel[0],self.acs[0])
+        keep2 = sampling.axis_mask(n2,self.partial_fourier[1],self.accel[1],self.acs[1])
+        k1,k2 = sampling.lines(n1),sampling.lines(n2)
+        
+        self.joint = self.pattern is not None or self.reorder == 'elliptical'
+        if not self.joint:
+            self.pe1_lines = k1[keep1][sampling.reorder(k1[keep1],0*k1[keep1],self.reorder)]
+            self.pe2_lines = k2[keep2][sampling.reorder(0*k2[keep2],k2[keep2],self.reorder)]
+            self.mask = np.outer(keep2,keep1)
+            self.npe = len(self.pe1_lines)*len(self.pe2_lines)
+            return
+        
+        if self.pattern is None:
+            mask = np.outer(keep2,keep1)
+        elif isinstance(self.pattern,str) and self.pattern == 'elliptical':
+            mask = np.outer(keep2,keep1) & (sampling.radius((n2,n1)) <= 1)
+        elif isinstance(self.pattern,str) and self.pattern == 'poisson':
+            pf = np.outer(sampling.axis_mask(n2,self.partial_fourier[1]),
+                sampling.axis_mask(n1,self.partial_fourier[0]))
+            mask = pf & sampling.poisson_disc((n2,n1),self.accel[0]*self.accel[1],
+                self.acs,self.seed)
+        elif isinstance(self.pattern,str):
+            raise Exception('Unknown sampling pattern: ' + self.pattern)
+        else:
+            mask = np.asarray(self.pattern,dtype=bool)
+            if mask.shape != (n2,n1):
+                raise Exception('Sampling mask must have the shape (npe2,npe1)')
+        
+        i2,i1 = np.nonzero(mask)
+        order = sampling.reorder(k1[i1],k2[i2],self.reorder)
+        self.pe1_lines,self.pe2_lines = k1[i1][order],k2[i2][order]
+        self.mask = mask
+        self.npe = len(order)
 
@@ -0,0 +1,127 @@
+'''
+Phase encoding sampling patterns of CartesianEncoding. The lines of an axis with n
+phase encoding steps are numbered k = floor(-n/2+1) .. floor(n/2), as the values of
+its List, and 2D masks are (npe2,npe1) boolean arrays over those lines.
+'''
+import numpy as np
+from mrpy.cache import waveforms
+
+def lines(n):
+    '''
+    lines(n) returns the line numbers of an axis with n phase encoding steps
+    '''
+    return np.arange(np.floor(-n/2+1),np.floor(n/2)+1).astype(np.int64)
+
+def axis_mask(n,partial_fourier=1,accel=1,acs=0):
+    '''
+    axis_mask(n,partial_fourier,accel,acs) returns which of the n lines of an axis are
+    sampled
+
+        partial_fourier = fraction of the lines kept, from 0.5, the first lines of
+            k-space are left out
+        accel = undersampling factor, every accel-th line counted from the center
+        acs = number of autocalibration lines around the center that are all sampled
+    '''
+    if not 0.5 <= partial_fourier <= 1:
+        raise Exception('Partial Fourier fraction must be between 0.5 and 1')
+    if accel < 1 or accel != int(accel):
+        raise Exception('Undersampling factor must be a positive integer')
+    keep = (lines(n) % int(accel) == 0) | _acs(n,acs)
+    keep &= np.arange(n) >= n - int(np.ceil(partial_fourier*n - 1e-9))
+    return keep
+
+def _acs(n,acs):
+    # the acs lines around the center
+    k = lines(n)
+    return (k >= -(acs//2)) & (k < acs - acs//2)
+
+def radius(shape):
+    '''
+    radius(shape) returns the distance of every point of an (npe2,npe1) mask from the
+    center of k-space, 1 on the edge of the ellipse inscribed in k-space
+    '''
+    k2,k1 = (lines(n)/max(n/2,1) for n in shape)
+    return np.sqrt(k2[:,None]**2 + k1[None,:]**2)
+
+def poisson_disc(shape,accel,acs=(0,0),seed=0,falloff=2.0):
+    '''
+    poisson_disc(shape,accel,acs,seed,falloff) returns a variable density Poisson-disc
+    mask of shape (npe2,npe1) that samples one in accel points
+
+        acs = number of autocalibration lines along pe1 and pe2, the block around the
+            center that is fully sampled
+        seed = seed of the random numbers, the same seed gives the same mask
+        falloff = the distance between samples grows by 1 + falloff*radius from the
+            center of k-space to its edge
+
+    Points are visited in random order and kept unless they are closer to a kept point
+    than its distance, which is scaled until the mask has the requested number of
+    points. Masks are cached.
+    '''
+    key = ('sampling.poisson',tuple(int(n) for n in shape),float(accel),
+        tuple(int(n) for n in acs),seed,float(falloff))
+    return waveforms.get(key,lambda: _poisson_disc(shape,accel,acs,seed,falloff))
+
+def _poisson_disc(shape,accel,acs,seed,falloff):
+    shape = tuple(int(n) for n in shape)
+    calib = np.outer(_acs(shape[0],acs[1]),_acs(shape[1],acs[0]))
+    target = max(np.prod(shape)/accel,np.sum(calib))
+    visit = np.random.default_rng(seed).permutation(np.prod(shape))
+    scale = 1 + falloff*radius(shape)
+
+    # bisection on the distance between samples at the center
+    lo,hi = 0.0,2*np.sqrt(accel)
+    best = None
+    for it in range(24):
+        r0 = (lo + hi)/2
+        mask = _sequential(visit,r0*scale) | calib
+        n = np.sum(mask)
+        if best is None or abs(n - target) < abs(np.sum(best) - target):
+            best = mask
+        if abs(n - target) <= 0.005*target:
+            break
+        if n > target:
+            lo = r0
+        else:
+            hi = r0
+    best.flags.writeable = False
+    return best
+
+def _sequential(visit,dist):
+    # random sequential addition: a kept point blocks the points within its distance
+    n2,n1 = dist.shape
+    blocked = np.zeros((n2,n1),dtype=bool)
+    mask = np.zeros((n2,n1),dtype=bool)
+    for idx in visit:
+        i,j = divmod(int(idx),n1)
+        if blocked[i,j]:
+            continue
+        mask[i,j] = True
+        r = dist[i,j]
+        w = int(np.ceil(r))
+        i0,i1,j0,j1 = max(i-w,0),min(i+w+1,n2),max(j-w,0),min(j+w+1,n1)
+        di = np.arange(i0,i1)[:,None] - i
+        dj = np.arange(j0,j1)[None,:] - j
+        blocked[i0:i1,j0:j1] |= di*di + dj*dj < r*r
+    return mask
+
+def reorder(k1,k2,order='linear'):
+    '''
+    reorder(k1,k2,order) returns the acquisition order of phase encoding steps with
+    line numbers k1 (pe1) and k2 (pe2)
+
+        order = 'linear' (pe2 outer, pe1 inner, each from the first line to the last),
+            'centric' (the same, but each axis from the center out) or 'elliptical'
+            (by the distance from the center of k-space, see radius)
+    '''
+    k1,k2 = np.asarray(k1),np.asarray(k2)
+    if order == 'linear':
+        return np.lexsort((k1,k2))
+    if order == 'centric':
+        # 0, -1, 1, -2, 2, ...
+        return np.lexsort((2*np.abs(k1) - (k1 < 0),2*np.abs(k2) - (k2 < 0)))
+    if order == 'elliptical':
+        n1,n2 = max(np.max(np.abs(k1)),1),max(np.max(np.abs(k2)),1)
+        r = np.round(np.hypot(k1/n1,k2/n2),12)
+        return np.lexsort((np.arctan2(k2/n2,k1/n1),r))
+    raise Exception('Unknown phase encoding order: ' + order)
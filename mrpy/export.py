@@ -0,0 +1,148 @@
+'''
+Binary sequence files hold a compiled sequence as a deduplicated shape library and a
+time ordered event table. All sections are little endian and 64 byte aligned:
+
+    header      header_dtype, 64 bytes
+    library     shape_off int64[nshapes+1], then t, wave, phase float64[nlib] each
+    events      event_dtype[nevents]
+
+Event i plays shape events['shape'][i], scaled by 'amp' and phase shifted by 'phase'
+(radians), starting at 'start' (ms) on channel timeline.channels[events['channel'][i]].
+'''
+import numpy as np
+from mrpy.timeline import Timeline, EventTable, channels
+
+magic = b'\x89MRPYSQ\n'
+version = 1
+
+header_dtype = np.dtype([('magic','S8'),('version','<u4'),('flags','<u4'),
+    ('nshapes','<u8'),('nlib','<u8'),('nevents','<u8'),('lib_off','<u8'),
+    ('events_off','<u8'),('dur','<f8')])
+
+event_dtype = np.dtype([('start','<f8'),('amp','<f8'),('phase','<f8'),('shape','<i4'),
+    ('channel','u1'),('pad','V3')])
+
+def _align(n):
+    return -(-n//64)*64
+
+def _pad(f,n):
+    f.write(b'\0'*(n - f.tell()))
+
+def write(seq,path):
+    '''
+    write(seq,path) compiles a sequence (or takes a Timeline) and writes it to path
+    '''
+    tl = seq if isinstance(seq,Timeline) else Timeline.compile(seq)
+
+    nshapes = len(tl.shapes)
+    nlib = len(tl.shape_t)
+    nevents = sum(len(leaf) for leaf in tl.leaves)
+
+    hdr = np.zeros(1,dtype=header_dtype)
+    hdr['magic'] = magic
+    hdr['version'] = version
+    hdr['nshapes'] = nshapes
+    hdr['nlib'] = nlib
+    hdr['nevents'] = nevents
+    hdr['lib_off'] = _align(header_dtype.itemsize)
+    hdr['events_off'] = _align(int(hdr['lib_off'][0]) + 8*(nshapes+1) + 3*8*nlib)
+    hdr['dur'] = tl.dur
+
+    with open(path,'wb') as f:
+        hdr.tofile(f)
+        _pad(f,int(hdr['lib_off'][0]))
+        tl.shape_off.astype('<i8').tofile(f)
+        for arr in (tl.shape_t,tl.shape_wave,tl.shape_phase):
+            arr.astype('<f8').tofile(f)
+        _pad(f,int(hdr['events_off'][0]))
+
+        # events are generated and written in blocks of roughly a million events
+        block = tl.dur*min(1.0,2.0**20/max(nevents,1)) or None
+        for t0,t1,events in tl.stream(block):
+            pack(events).tofile(f)
+
+def pack(events):
+    '''
+    pack(events) merges the per channel EventTables of a block (as yielded by
+    Timeline.stream) into one time ordered event_dtype array
+    '''
+    ev = [events[ch] for ch in channels]
+    code = np.concatenate([np.full(len(e),n,dtype=np.uint8) for n,e in enumerate(ev)])
+    ev = EventTable.concat(ev)
+    order = np.argsort(ev.start,kind='stable')
+
+    out = np.zeros(len(ev),dtype=event_dtype)
+    out['start'] = ev.start[order]
+    out['amp'] = ev.amp[order]
+    out['shape'] = ev.shape[order]
+    out['channel'] = code[order]
+    return out
+
+class SequenceFile:
+    '''
+    SequenceFile(path) opens a binary sequence file written by write(), all arrays are
+    read-only memory maps so nothing is loaded until it is used
+
+        header = file header (header_dtype)
+        shape_off, shape_t, shape_wave, shape_phase = shape library, see Timeline
+        events = time ordered event table (event_dtype)
+        dur = duration of the sequence, ms
+    '''
+    def __init__(self,path):
+        self.path = path
+        self.header = np.memmap(path,dtype=header_dtype,mode='r',shape=(1,))[0]
+        if self.header['magic'] != magic:
+            raise Exception('Not an mrpy sequence file: ' + path)
+        if self.header['version'] > version:
+            raise Exception('Unsupported sequence file version %d' % self.header['version'])
+
+        nshapes = int(self.header['nshapes'])
+        nlib = int(self.header['nlib'])
+        off = int(self.header['lib_off'])
+        self.shape_off = np.memmap(path,dtype='<i8',mode='r',offset=off,shape=(nshapes+1,))
+        off += 8*(nshapes+1)
+        self.shape_t,self.shape_wave,self.shape_phase = [
+            np.memmap(path,dtype='<f8',mode='r',offset=off+8*nlib*n,shape=(nlib,))
+            if nlib else np.zeros(0) for n in range(3)]
+
+        nevents = int(self.header['nevents'])
+        self.events = (np.memmap(path,dtype=event_dtype,mode='r',
+            offset=int(self.header['events_off']),shape=(nevents,))
+            if nevents else np.zeros(0,dtype=event_dtype))
+        self.dur = float(self.header['dur'])
+
+    def __len__(self):
+        return len(self.events)
+
+    def shape(self,n):
+        '''
+        shape(n) returns t,wave,phase of shape n as views into the file
+        '''
+        s = slice(self.shape_off[n],self.shape_off[n+1])
+        return self.shape_t[s],self.shape_wave[s],self.shape_phase[s]
+
+    def channel(self,name):
+        '''
+        channel(name) returns the events of one channel ('R','P','S','rf' or 'acq')
+        '''
+        return self.events[self.events['channel'] == channels.index(name)]
+
+    def expand(self,events):
+        '''
+        expand(events) renders a slice of events (e.g. channel('R') or
+        events[i:j]) into samples, returns t,wave,phase,off as Timeline.expand does
+        '''
+        shape = events['shape'].astype(np.int64)
+        npts = self.shape_off[shape+1] - self.shape_off[shape]
+        off = np.concatenate(([0],np.cumsum(npts))).astype(np.int64)
+
+        ev = np.repeat(np.arange(len(events)),npts)
+        src = np.arange(off[-1]) - off[ev] + self.shape_off[shape][ev]
+
+        t = events['start'][ev] + self.shape_t[src]
+        wave = events['amp'][ev]*self.shape_wave[src]
+        phase = self.shape_phase[src] + events['phase'][ev]
+        return t,wave,phase,off
+
+def load(path):
+    return SequenceFile(path)
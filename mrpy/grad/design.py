@@ -0,0 +1,67 @@
+'''
+Time-optimal gradient design. Every function takes scalars, arrays or Lists of areas
+(ms*mT/m) and works on all of them at once. A gradient of area A reaches it fastest
+by ramping at the slew limit: as a triangle if A is too small to reach the amplitude
+limit, as a trapezoid at the amplitude limit otherwise.
+'''
+import numpy as np
+from mrpy.limits import GradientLimits
+from mrpy.seq import List
+
+def _vals(x):
+    return np.abs(x.vals if isinstance(x,List) else np.asarray(x,dtype=np.float64))
+
+def min_dur(area,gmax=GradientLimits.grad_lim,slew=GradientLimits.slew_lim):
+    '''
+    min_dur(area,gmax,slew) returns the duration of the shortest gradient with each
+    area, ms
+    '''
+    area = _vals(area)
+    tri = area <= gmax**2/slew
+    return np.where(tri,2*np.sqrt(area/slew),area/gmax + gmax/slew)
+
+def ramp_time(area,dur,slew=GradientLimits.slew_lim):
+    '''
+    ramp_time(area,dur,slew) returns the rise (and fall) time of the gradient with each
+    area that fills dur with the lowest amplitude, ramping at the slew limit, ms
+    '''
+    area = _vals(area)
+    # area = slew*r*(dur - r), the smaller root
+    disc = np.maximum(dur**2 - 4*area/slew,0.0)
+    return (dur - np.sqrt(disc))/2
+
+def trapezoid(area,dur,slew=GradientLimits.slew_lim):
+    '''
+    trapezoid(area,dur,slew) returns the amplitude (signed, mT/m) and ramp time (ms) of
+    the lowest amplitude gradient with each area in dur
+    '''
+    r = ramp_time(area,dur,slew)
+    area = area.vals if isinstance(area,List) else np.asarray(area,dtype=np.float64)
+    g = area/np.where(dur > r,dur - r,np.inf)
+    return g,r
+
+def joint_min_dur(areas,gmax=GradientLimits.grad_lim,slew=GradientLimits.slew_lim,
+        vmax=None):
+    '''
+    joint_min_dur(areas,gmax,slew,vmax) returns the shortest duration in which
+    gradients on several axes reach their areas together, ms
+
+        areas = area per axis, each a scalar, array or List (the largest magnitude of
+            each is used)
+        gmax, slew = amplitude and slew limit of every axis
+        vmax = limit of the combined amplitude of the axes, None for none
+
+    The axes play the same shape scaled by their areas, so the combined gradient is a
+    single trapezoid whose amplitude and slew limits follow from the axis with the
+    largest area and from vmax. Without vmax this is the duration of the slowest axis.
+    '''
+    peaks = np.array([np.max(_vals(a),initial=0.0) for a in areas])
+    amax = np.max(peaks,initial=0.0)
+    if amax == 0:
+        return 0.0
+
+    total = np.sqrt(np.sum(peaks**2))
+    g,s = gmax*total/amax,slew*total/amax
+    if vmax is not None:
+        g = min(g,vmax)
+    return float(min_dur(total,g,s))
@@ -1,6 +1,8 @@
 import numpy as np
 from mrpy.limits import *
 from mrpy.seq import Sequence, List
+from mrpy.cache import waveforms
+from mrpy.grad import design
 
 class Gradient(Sequence):
     def run(self,machine):
@@ -37,20 +39,37 @@ class TrapGradient(Gradient):
         self.area = (2*self.dur-self.trise-self.tfall)/2*self.gmax.value() # ms*mT/m
         
     def get_wave(self):
-        self.t = np.array([0, self.trise, self.dur-self.tfall, self.dur])# - self.anchor
-        self.g = np.array([0, self.gmax.value(), self.gmax.value(), 0])
+        g = self.gmax.value()
+        self.g,self.t = waveforms.get(('trap',self.trise,self.dur,self.tfall,g),
+            lambda: (np.array([0, g, g, 0]),
+                np.array([0, self.trise, self.dur-self.tfall, self.dur])))# - self.anchor
         return self.g,self.t,self.axis
     
     @staticmethod
-    def by_area(area,dur=0,axis='S',anchor=0,time=0):
-        min_dur = TrapGradient.calc_min_dur(area)
+    def by_area(area,dur=0,axis='S',anchor=0,time=0,slew=None):
+        '''
+        by_area(area,dur,axis,anchor,time,slew) returns the gradient with area (ms*mT/m)
+        in at least dur. With slew (mT/m/ms) the ramps are as short as the slew limit
+        allows and fit to the largest area, otherwise they are trise and tfall.
+        '''
+        min_dur = TrapGradient.calc_min_dur(area,slew)
         dur = max(dur,min_dur)
-        gmax = 2.0*area/(2.0*dur-TrapGradient.trise-TrapGradient.tfall)
+        if slew is None:
+            gmax = 2.0*area/(2.0*dur-TrapGradient.trise-TrapGradient.tfall)
+            return TrapGradient(gmax=gmax,dur=dur,axis=axis,anchor=anchor,time=time)
         
-        return TrapGradient(gmax=gmax,dur=dur,axis=axis,anchor=anchor,time=time)
+        # one shape for every value of a List, scaled by the areas
+        peak = np.max(np.abs(area.vals if isinstance(area,List) else area))
+        r = float(design.ramp_time(peak,dur,slew))
+        gmax = area/(dur-r) if dur > r else area*0.0
+        return TrapGradient(gmax=gmax,dur=dur,axis=axis,anchor=anchor,time=time,
+            trise=r,tfall=r)
     
     @staticmethod
-    def calc_min_dur(area):
+    def calc_min_dur(area,slew=None):
+        if slew is not None:
+            return float(np.max(design.min_dur(area,GradientLimits.grad_lim,slew)))
+        
         try:
             area = area.value()
         except:
@@ -89,3 +108,45 @@ class ConstGradient(TrapGradient):
             self.anchor = self.dur/2
             
         self.area = (2*self.dur-self.trise-self.tfall)/2*self.gmax.value() # ms*mT/m
+
+class ArbGradient(Gradient):
+    '''
+    ArbGradient defines a gradient waveform by its samples, linear in between, like
+    the slice gradient of a VERSE pulse
+    
+        ArbGradient(g,t,axis)
+        g = amplitude of each sample, mT/m
+        t = time of each sample from the beginning of the waveform, ms
+        axis = 'R', 'P', or 'S'
+        
+        Other parameters:
+        anchor = reference point in time relative to the beginning of the waveform, ms
+        time = placement the anchor inside the parent sequence element, ms
+        
+        Calculated parameters:
+        dur = duration of the waveform, ms
+        area = area of the gradient waveform, ms*mT/m
+    '''
+    anchor = 0
+    time = 0
+    
+    def build(self):
+        self.g = np.asarray(self.g,dtype=np.float64)
+        self.t = np.asarray(self.t,dtype=np.float64)
+        self.dur = self.t[-1]
+        self.area = self.area_until(self.dur)
+    
+    def area_until(self,t):
+        '''
+        area_until(t) returns the area of the waveform up to time t, ms*mT/m
+        '''
+        cum = np.concatenate(([0],np.cumsum((self.g[1:]+self.g[:-1])/2*np.diff(self.t))))
+        i = np.clip(np.searchsorted(self.t,t,'right')-1,0,len(self.t)-2)
+        dt = t - self.t[i]
+        slope = (self.g[i+1]-self.g[i])/np.where(self.t[i+1] > self.t[i],
+            self.t[i+1]-self.t[i],np.inf)
+        return cum[i] + self.g[i]*dt + slope*dt**2/2
+    
+    def get_wave(self):
+        return self.g,self.t,self.axis
+
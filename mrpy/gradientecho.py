@@ -19,6 +19,26 @@ class GradientEcho(Composite):
         self.ss = SliceSelection(**self.ss)
         self.enc = CartesianEncoding(**self.enc)
     
+    @staticmethod
+    def join(ss,enc):
+        # with time-optimal encoding gradients the slice refocusing area is played by
+        # the slice phase encoding gradient, instead of a second gradient overlapping it
+        if enc.slew is not None:
+            enc.moment = np.array([0,0,ss.refocus])
+    
+    @staticmethod
+    def calc_min_te(ss,enc):
+        return ( ss.dur-ss.anchor + 
+            max(ss.after.dur,enc.before.dur) +  # these will be combined
+            enc.readout.anchor )
+    
+    @staticmethod
+    def calc_min_tr(ss,enc,te):
+        return (enc.readout.dur - enc.readout.anchor + 
+            te + 
+            enc.after.dur + 
+            ss.anchor)
+    
     def build_base(self):
         # define slice select rf and gradient pulses
         self.ss.thk = self.enc.fov[2]
@@ -26,12 +46,11 @@ class GradientEcho(Composite):
         
         # pre build the ss and enc objects to calculate other minimum durations
         self.ss.build()
+        self.join(self.ss,self.enc)
         self.enc.build()
         
         # Calculate the minimum echo time, and update the sequence
-        min_te = ( self.ss.dur-self.ss.anchor + 
-            max(self.ss.after.dur,self.enc.before.dur) +  # these will be combined
-            self.enc.readout.anchor )
+        min_te = self.calc_min_te(self.ss,self.enc)
         self.te = max(min_te,self.te)
         
         # allow duration of the pre-encoding gradients to be expanded to the limit of the 
@@ -40,10 +59,7 @@ class GradientEcho(Composite):
         pre_enc_dur = min(pre_enc_dur,self.enc.readout.dur) 
         
         # calculate min TR
-        min_tr = (self.enc.readout.dur - self.enc.readout.anchor + 
-            self.te + 
-            self.enc.after.dur + 
-            self.ss.anchor)
+        min_tr = self.calc_min_tr(self.ss,self.enc,self.te)
         self.tr = max(min_tr,self.tr)
         
         # allow duration of the post-encoding gradients to be expanded to the limit of the
@@ -56,7 +72,8 @@ class GradientEcho(Composite):
         self.enc.build(before_dur=pre_enc_dur,after_dur=post_enc_dur)
         
         # add ss refocusing pulse to before_readout
-        self.enc.before.add(self.ss.after)
+        if self.enc.moment is None:
+            self.enc.before.add(self.ss.after)
         
         self.enc.readout.time = self.te
         self.enc.before.anchor = 0
@@ -71,26 +88,39 @@ class GradientEcho(Composite):
         
     def build(self):
         self.build_base()
+        self.add(self.build_loops(self.base))
+        
+    def build_loops(self,obj):
+        # repeat obj, one TR, over the averages, phase encoding steps and repetitions
         
         # add averaging Loop
-        la = Loop(obj=self.base)
+        la = Loop(obj=obj)
         la.name = 'avg'
         la.add_list(List(np.arange(self.na)))
         la.build()
         
-        # add PE1 loop
-        l1 = Loop(obj=la)
-        l1.name = 'pe1'
-        l1.add_list(self.enc.pe1_grad.gmax)
-        l1.add_list(self.enc.pe1r_grad.gmax)
-        l1.build()
-        
-        # add PE2 loop
-        l2 = Loop(obj=l1)
-        l2.name = 'pe2'
-        l2.add_list(self.enc.pe2_grad.gmax)
-        l2.add_list(self.enc.pe2r_grad.gmax)
-        l2.build()
+        if self.enc.joint:
+            # add one PE loop over the pe1 and pe2 steps of the sampling pattern
+            l2 = Loop(obj=la)
+            l2.name = 'pe'
+            for grad in (self.enc.pe1_grad,self.enc.pe1r_grad,self.enc.pe2_grad,
+                    self.enc.pe2r_grad):
+                l2.add_list(grad.gmax)
+            l2.build()
+        else:
+            # add PE1 loop
+            l1 = Loop(obj=la)
+            l1.name = 'pe1'
+            l1.add_list(self.enc.pe1_grad.gmax)
+            l1.add_list(self.enc.pe1r_grad.gmax)
+            l1.build()
+            
+            # add PE2 loop
+            l2 = Loop(obj=l1)
+            l2.name = 'pe2'
+            l2.add_list(self.enc.pe2_grad.gmax)
+            l2.add_list(self.enc.pe2r_grad.gmax)
+            l2.build()
         
         # add rep loop
         lr = Loop(obj=l2)
@@ -98,5 +128,5 @@ class GradientEcho(Composite):
         lr.add_list(List(np.arange(self.nr)))
         lr.build()
         
-        self.add(lr)
+        return lr
         
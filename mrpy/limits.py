@@ -7,3 +7,16 @@ class GradientLimits:
     grad_lim = 400.0 # mT/m
     rise_time = 0.200 # ms
     dwell = 0.004 # ms
+    slew_max = grad_max/rise_time # mT/m/ms
+    slew_lim = grad_lim/rise_time # mT/m/ms
+    vector_max = grad_max # mT/m, combined amplitude of the three axes
+    rms_max = 250.0 # mT/m, RMS amplitude per axis over the sequence (duty cycle)
+    resonances = () # forbidden bands, (fmin kHz, fmax kHz, max amplitude mT/m)
+
+class PNSLimits:
+    # SAFE model per axis (R, P, S): the slew rate is passed through three exponential
+    # filters, the second of them acting on its magnitude
+    tau = ((0.20,0.03,3.0),)*3 # ms
+    weight = ((0.40,0.10,0.50),)*3
+    threshold = (24.0,24.0,24.0) # mT/m/ms, filtered slew rate at threshold
+    g_scale = (0.35,0.35,0.35) # scale of the nominal to the effective slew rate
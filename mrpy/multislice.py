@@ -0,0 +1,128 @@
+import numpy as np
+from mrpy.seq import RFChain, Composite, Loop, List
+from mrpy.gradientecho import GradientEcho
+
+class SlicePulse(RFChain):
+    '''
+    SlicePulse(pulse,freqs) plays an RF pulse at the frequency offset of the slice that
+    the concatenation and slot loops select
+
+        SlicePulse(pulse,freqs)
+        pulse = the RF pulse, with its dfdz set by the slice selection
+        freqs = frequency offset of every (concatenation, slot), kHz, NaN for a slot
+            without a slice, where the pulse is not played
+
+        Calculated parameters:
+        concat, slot = Lists of the indices into freqs, to be added to the
+            concatenation and slot loops
+    '''
+    def build(self):
+        self.freqs = np.atleast_2d(np.asarray(self.freqs,dtype=np.float64))
+        self.dur = self.pulse.dur
+        self.anchor = self.pulse.anchor
+        self.time = self.pulse.time
+        self.dfdz = self.pulse.dfdz
+        self.ph_cycle = self.pulse.ph_cycle
+        self.concat = List(np.arange(self.freqs.shape[0]))
+        self.slot = List(np.arange(self.freqs.shape[1]))
+
+    def get_wave(self):
+        freq = self.freqs[int(self.concat.value()),int(self.slot.value())]
+        if np.isnan(freq):
+            wave,phase,t = self.pulse.get_wave()
+            return np.zeros(np.shape(wave)),phase,t
+        return self.pulse.offset_wave(freq)
+
+    def run(self,machine):
+        return machine.addRF(self)
+
+class MultiSliceGradientEcho(GradientEcho):
+    '''
+    MultiSliceGradientEcho(GradientEcho) is a 2D gradient echo that excites several
+    slices in every TR, each in the dead time the others leave
+
+        MultiSliceGradientEcho(te,tr,nr,na,ss,enc,nslices,gap,order)
+        tr = repetition time of every slice, ms (at least the minimum TR of one slice)
+        nslices = number of slices
+        gap = distance between neighbouring slices, mm (from edge to edge)
+        order = order of the slices excited in a TR: 'interleaved' (every other one,
+            then the ones in between), 'sequential', 'reverse', or the positions
+            0..npack-1 in the order they are excited
+
+        Calculated parameters:
+        slot = duration of one slice, its minimum TR, ms
+        npack = number of slices excited per TR
+        nconcat = number of concatenations, each acquires all its slices completely
+            before the next one starts
+        positions = center of the slice in every (concatenation, slot), mm along S,
+            NaN for an empty slot
+        freqs = RF frequency offset of every (concatenation, slot), kHz
+        scan_time = duration of the whole acquisition, ms
+
+    As many slices as fit in the TR are packed into it, with the TR spread evenly over
+    them, and the remaining slices go to further concatenations. The slices are
+    stacked along S around enc.offset[2]. Concatenation c holds the slices c,
+    c + nconcat, c + 2*nconcat, ..., so that neighbouring slices are acquired in
+    different concatenations. When nslices is not a multiple of nconcat the last slot
+    of some concatenations has no slice, its gradients and acquisition are played
+    without the RF pulse.
+    '''
+    req_parms = GradientEcho.req_parms + ('nslices','gap','order')
+    nslices = 1
+    gap = 0 # mm
+    order = 'interleaved'
+
+    def build(self):
+        # one slice at its minimum TR, whose duration is the slot of every slice
+        tr = self.tr
+        self.tr = 0
+        self.build_base()
+        self.slot = self.tr
+
+        self.npack = min(self.nslices,max(1,int(np.floor(tr/self.slot + 1e-9))))
+        self.nconcat = -(-self.nslices//self.npack)
+        self.npack = -(-self.nslices//self.nconcat) # same number in every concatenation
+        self.tr = max(tr,self.npack*self.slot)
+
+        # slice m of concatenation c is slice c + m*nconcat of the stack
+        spacing = self.ss.thk + self.gap
+        index = np.arange(self.nconcat)[:,None] + self._order()[None,:]*self.nconcat
+        self.positions = np.where(index < self.nslices,
+            self.enc.offset[2] + (index - (self.nslices - 1)/2)*spacing,np.nan)
+
+        pulse = self.ss.parts[0]
+        self.freqs = pulse.dfdz*self.positions/1000
+        self.pulse = SlicePulse(pulse=pulse,freqs=self.freqs)
+        self.ss.parts = (self.pulse,) + tuple(self.ss.parts[1:])
+
+        # the slots fill the TR
+        self.base.dur = self.tr/self.npack
+        ls = Loop(obj=self.base)
+        ls.name = 'slot'
+        ls.add_list(self.pulse.slot)
+        ls.build()
+        block = Composite(dur=self.tr,parts=(ls,))
+
+        lc = Loop(obj=self.build_loops(block))
+        lc.name = 'concat'
+        lc.add_list(self.pulse.concat)
+        lc.build()
+        self.add(lc)
+
+        self.scan_time = lc.dur
+
+    def _order(self):
+        n = self.npack
+        if isinstance(self.order,str):
+            if self.order == 'interleaved':
+                return np.concatenate((np.arange(0,n,2),np.arange(1,n,2)))
+            if self.order == 'sequential':
+                return np.arange(n)
+            if self.order == 'reverse':
+                return np.arange(n)[::-1]
+            raise Exception('Unknown slice order: ' + self.order)
+
+        order = np.asarray(self.order,dtype=int)
+        if not np.array_equal(np.sort(order),np.arange(n)):
+            raise Exception('Slice order must hold every position 0..%d once' % (n - 1))
+        return order
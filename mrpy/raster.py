@@ -0,0 +1,237 @@
+'''
+Rasterization of a compiled sequence onto the uniform time grid of the hardware: one
+contiguous array per gradient axis, the complex RF and the ADC gate. Sample i holds the
+piecewise linear waveform at the center of the raster interval [i*dwell,(i+1)*dwell),
+its average over the interval unless a corner of the waveform falls inside it.
+'''
+import os
+import numpy as np
+from mrpy.limits import GradientLimits
+from mrpy.timeline import Timeline, segments
+
+dac_max = 32767
+
+class Raster:
+    '''
+    Raster(seq) renders a sequence onto the hardware raster, into preallocated or
+    memory-mapped buffers, a block of raster points at a time
+
+        Raster(seq,dwell,dac,full_scale,path,buffers,block)
+        seq = a sequence object or a compiled Timeline
+        dwell = raster time, ms
+        dac = store int16 DAC codes instead of float32 values
+        full_scale = values that map to the largest DAC code, per channel: 'grad' in
+            mT/m (default grad_max) and 'rf' in kHz (default the peak B1 of seq)
+        path = directory to create the buffers in as memory-mapped .npy files
+            (grad.npy, rf.npy and adc.npy), otherwise they are held in memory
+        buffers = dict of preallocated 'grad', 'rf' and 'adc' arrays to write into,
+            shaped and typed as below
+        block = raster points rendered at a time
+
+        Calculated parameters:
+        n = number of raster points
+        grad = gradients along R, P, S, (3,n) float32 mT/m, or int16 codes
+        rf = B1, (n,) complex64 kHz, or (n,2) int16 codes of the real and imaginary
+            part
+        adc = ADC gate, (n,) bool, True where an acquisition is running
+        peak = largest magnitude of every channel ('R', 'P', 'S', 'rf'), before
+            quantization
+        clipped = number of samples of every channel beyond the full scale, which are
+            clipped to it (dac only)
+
+    Events are taken from Timeline.stream block by block, so memory use beyond the
+    buffers is bounded by the block size. The samples of the events are spread onto
+    the raster as their linear pieces in one vectorized pass per block and channel,
+    overlapping events of a channel add up.
+    '''
+    dwell = GradientLimits.dwell
+    dac = False
+    full_scale = None
+    path = None
+    buffers = None
+    block = 1 << 20
+
+    def __init__(self,seq,**kwargs):
+        for key,value in kwargs.items():
+            setattr(self,key,value)
+        self.timeline = seq if isinstance(seq,Timeline) else Timeline.compile(seq)
+        self.calc()
+
+    def calc(self):
+        tl = self.timeline
+        self.n = int(np.ceil(tl.dur/self.dwell - 1e-9))
+        scale = {'grad': GradientLimits.grad_max,'rf': self._rf_peak()}
+        scale.update(self.full_scale or {})
+        self.scale = scale
+        self._allocate()
+
+        self.peak = {ch: 0.0 for ch in ('R','P','S','rf')}
+        self.clipped = {ch: 0 for ch in ('R','P','S','rf')}
+        self._templates = {}
+        pending = {}
+        gate = []
+        for t0,t1,events in tl.stream(self.block*self.dwell):
+            b0,b1 = self._index(t0),min(self._index(t1),self.n)
+            if b0 >= self.n:
+                break
+            for i,ch in enumerate(('R','P','S')):
+                acc = self._accumulate(events[ch],b0,b1,pending.get(ch),np.float64)
+                pending[ch] = acc[b1-b0:]
+                self._store(ch,self.grad[i],b0,b1,acc[:b1-b0],scale['grad'])
+            acc = self._accumulate(events['rf'],b0,b1,pending.get('rf'),np.complex128)
+            pending['rf'] = acc[b1-b0:]
+            self._store('rf',self.rf,b0,b1,acc[:b1-b0],scale['rf'])
+            gate = self._gate(events['acq'],b0,b1,gate)
+
+        for buf in (self.grad,self.rf,self.adc):
+            if isinstance(buf,np.memmap):
+                buf.flush()
+
+    def _rf_peak(self):
+        # peak B1 of the sequence from the shapes and their amplitudes
+        tl = self.timeline
+        peak = 0.0
+        for leaf in tl.leaves:
+            if leaf.channel == 'rf' and leaf.nevents:
+                shape = np.abs(np.asarray(leaf.shape_ids)).ravel()
+                amp = np.abs(np.asarray(leaf.amps)).ravel()
+                for sh in np.unique(shape):
+                    w = tl.shape_wave[tl.shape_off[sh]:tl.shape_off[sh+1]]
+                    if len(w):
+                        peak = max(peak,np.max(np.abs(w))*np.max(amp[shape == sh]))
+        return peak or 1.0
+
+    def _allocate(self):
+        n = self.n
+        if self.dac:
+            shapes = {'grad': ((3,n),np.int16),'rf': ((n,2),np.int16),'adc': ((n,),bool)}
+        else:
+            shapes = {'grad': ((3,n),np.float32),'rf': ((n,),np.complex64),
+                'adc': ((n,),bool)}
+
+        buffers = dict(self.buffers or {})
+        for name,(shape,dtype) in shapes.items():
+            buf = buffers.get(name)
+            if buf is None:
+                if self.path is None:
+                    buf = np.empty(shape,dtype=dtype)
+                else:
+                    os.makedirs(self.path,exist_ok=True)
+                    buf = np.lib.format.open_memmap(os.path.join(self.path,name + '.npy'),
+                        mode='w+',dtype=dtype,shape=shape)
+            elif buf.shape != shape or buf.dtype != dtype:
+                raise Exception('Raster buffer %s must be %s %s' % (name,shape,
+                    np.dtype(dtype).name))
+            setattr(self,name,buf)
+
+    def _index(self,t):
+        # first raster point whose center is at or after t
+        return int(np.ceil(t/self.dwell - 0.5 - 1e-9))
+
+    def _template(self,shape,frac):
+        # a shape starting frac ms after the center of a raster point, as its first
+        # raster point relative to that one and the values from there on
+        key = (shape,frac)
+        if key not in self._templates:
+            tl = self.timeline
+            s = slice(tl.shape_off[shape],tl.shape_off[shape+1])
+            t,wave,phase = tl.shape_t[s] + frac,tl.shape_wave[s],tl.shape_phase[s]
+            if np.any(phase):
+                wave = wave*np.exp(1j*phase)
+            ta,tb,wa,wb = segments(t,wave,np.array([0,len(t)]))
+
+            # every linear piece covers the points whose centers are inside it
+            i0 = np.ceil(ta/self.dwell - 1e-9).astype(np.int64)
+            i1 = np.ceil(tb/self.dwell - 1e-9).astype(np.int64)
+            n = np.maximum(i1 - i0,0)
+            seg = np.repeat(np.arange(len(ta)),n)
+            i = np.arange(len(seg)) - np.repeat(np.cumsum(n) - n,n) + i0[seg]
+            x = (i*self.dwell - ta[seg])/(tb - ta)[seg]
+            val = wa[seg] + (wb[seg] - wa[seg])*x
+
+            first = int(np.min(i)) if len(i) else 0
+            vals = np.zeros(int(np.max(i,initial=-1)) + 1 - first,dtype=val.dtype)
+            np.add.at(vals,i - first,val)
+            self._templates[key] = first,vals
+        return self._templates[key]
+
+    def _accumulate(self,events,b0,b1,pending,dtype):
+        # sum of the events at the raster points from b0 on, including the points past
+        # b1 that events reach into. Events of one shape starting at the same offset
+        # from the raster are scaled copies of one template.
+        size = b1 - b0
+        groups = []
+        if len(events):
+            # nearest raster point center before the start of every event
+            base = np.floor(events.start/self.dwell - 0.5 + 1e-9).astype(np.int64)
+            frac = np.round(events.start - (base + 0.5)*self.dwell,9)
+            keys,inv = np.unique(np.stack((events.shape,frac),axis=1),axis=0,
+                return_inverse=True)
+            for g,(shape,f) in enumerate(keys):
+                first,vals = self._template(int(shape),float(f))
+                sel = inv.ravel() == g
+                start = base[sel] + first - b0
+                if len(vals) and np.any(start < 0):
+                    raise Exception('Events start before the raster block they are in')
+                groups.append((start,events.amp[sel],vals))
+                size = max(size,int(np.max(start)) + len(vals))
+        if pending is not None:
+            size = max(size,len(pending))
+
+        acc = np.zeros(size,dtype=dtype)
+        for start,amp,vals in groups:
+            if not len(vals):
+                continue
+            idx = start[:,None] + np.arange(len(vals))
+            val = amp[:,None]*vals
+            # copies that do not overlap are added with one fancy index
+            order = np.argsort(start)
+            if np.all(np.diff(start[order]) >= len(vals)):
+                acc[idx] += val
+            else:
+                np.add.at(acc,idx,val)
+        if pending is not None:
+            acc[:len(pending)] += pending
+        return acc
+
+    def _store(self,ch,buf,b0,b1,val,scale):
+        # val is a scratch buffer, it is scaled in place
+        parts = (val.real,val.imag) if np.iscomplexobj(val) else (val,)
+        if len(val):
+            peak = np.max(np.abs(val)) if len(parts) > 1 else max(val.max(),-val.min())
+            self.peak[ch] = max(self.peak[ch],float(peak))
+        if not self.dac:
+            buf[b0:b1] = val
+            return
+
+        # int16 codes, values beyond the full scale are clipped to it
+        for n,part in enumerate(parts):
+            np.multiply(part,dac_max/scale,out=part)
+            np.rint(part,out=part)
+            if len(part) and max(part.max(),-part.min()) > dac_max:
+                self.clipped[ch] += int(np.count_nonzero(np.abs(part) > dac_max))
+                np.clip(part,-dac_max,dac_max,out=part)
+            if buf.ndim == 2:
+                buf[b0:b1,n] = part
+            else:
+                buf[b0:b1] = part
+        if buf.ndim == 2 and len(parts) == 1:
+            buf[b0:b1,1] = 0
+
+    def _gate(self,events,b0,b1,pending):
+        # acquisitions open the gate from their start for npoints*dwell, pending holds
+        # the ends of the acquisitions still open from the blocks before
+        self.adc[b0:b1] = False
+        spans = [(b0,i1) for i1 in pending]
+        if len(events):
+            dur = np.array([self.timeline.leaves[leaf].obj.dur for leaf in events.leaf])
+            i0 = np.ceil(events.start/self.dwell - 0.5 - 1e-9).astype(np.int64)
+            i1 = np.ceil((events.start + dur)/self.dwell - 0.5 - 1e-9).astype(np.int64)
+            spans += zip(i0.tolist(),i1.tolist())
+
+        later = []
+        for i0,i1 in spans:
+            self.adc[i0:min(i1,b1)] = True
+            if i1 > b1:
+                later.append(i1)
+        return later
@@ -1,12 +1,20 @@
 from . import ex
 from . import rfc
+from .profile import SliceProfile
 
 excitation_pulses = {
-    'bloch': ex.Block, 
+    'block': ex.Block,
+    'bloch': ex.Block, # old misspelled name of 'block'
     'gauss': ex.Gauss,
+    'slr': ex.SLR,
+    'sinc': ex.Sinc,
+    'verse': ex.Verse,
 }
 
 refocusing_pulses = {
+    'block': rfc.Block,
     'bloch': rfc.Block,
     'gauss': rfc.Gauss,
+    'slr': rfc.SLR,
+    'sinc': rfc.Sinc,
 }
\ No newline at end of file
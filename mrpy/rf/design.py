@@ -0,0 +1,162 @@
+'''
+RF pulse design: Shinnar-Le Roux (SLR), windowed sinc and VERSE reshaping. Designs are
+returned as the rotation angle of every sample (complex, radians) so they do not
+depend on the pulse duration, and are memoized in the shared waveform cache.
+'''
+import numpy as np
+from mrpy.cache import waveforms
+
+def dinf(d1,d2):
+    '''
+    dinf(d1,d2) returns the transition width times the number of samples of an FIR
+    filter with passband and stopband ripples d1 and d2 (Pauly et al. 1991)
+    '''
+    l1,l2 = np.log10(d1),np.log10(d2)
+    a = (5.309e-3,7.114e-2,-4.761e-1,-2.66e-3,-5.941e-1,-4.278e-1)
+    return (a[0]*l1**2 + a[1]*l1 + a[2])*l2 + (a[3]*l1**2 + a[4]*l1 + a[5])
+
+def firls(n,bands,desired,weights):
+    '''
+    firls(n,bands,desired,weights) returns a linear phase (symmetric) FIR filter with n
+    taps, least squares optimal over the bands
+
+        bands = band edges in cycles/sample, pairs in [0, 0.5]
+        desired = amplitude in each band
+        weights = weight of each band
+    '''
+    # cosine series about the center tap, fit on a dense grid of every band
+    k = np.arange(n)-(n-1)/2.0
+    f,d,w = [],[],[]
+    for (f0,f1),des,wt in zip(np.reshape(bands,(-1,2)),desired,weights):
+        fb = np.linspace(f0,f1,max(2,int(np.ceil((f1-f0)*16*n))))
+        f.append(fb)
+        d.append(np.full(len(fb),des,dtype=np.float64))
+        w.append(np.full(len(fb),np.sqrt(wt)))
+    f,d,w = np.concatenate(f),np.concatenate(d),np.concatenate(w)
+
+    half = k[k >= 0]
+    basis = np.cos(2*np.pi*np.outer(f,half))*np.where(half > 0,2,1)
+    c = np.linalg.lstsq(basis*w[:,None],d*w,rcond=None)[0]
+    return np.interp(np.abs(k),half,c)
+
+def _min_phase(mag):
+    # minimum phase spectrum with the given magnitude (folded cepstrum)
+    n = len(mag)
+    cep = np.fft.ifft(np.log(np.maximum(mag,1e-12)))
+    fold = np.zeros(n,dtype=np.complex128)
+    fold[0] = cep[0]
+    fold[1:(n+1)//2] = 2*cep[1:(n+1)//2]
+    if n % 2 == 0:
+        fold[n//2] = cep[n//2]
+    return np.exp(np.fft.fft(fold))
+
+def b2a(b):
+    '''
+    b2a(b) returns the minimum phase Cayley-Klein polynomial a matching b
+    '''
+    n = len(b)
+    npad = 16*n
+    bf = np.fft.fft(b,npad)
+    peak = np.max(np.abs(bf))
+    if peak >= 1:
+        bf = bf/(1e-7 + peak)
+    af = _min_phase(np.sqrt(1 - np.abs(bf)**2))
+    # coefficients in the order ab2rf expects them
+    return np.fft.ifft(af)[:n][::-1]
+
+def ab2rf(a,b):
+    '''
+    ab2rf(a,b) is the inverse SLR transform, it returns the rotation of every sample of
+    the hard pulse train with Cayley-Klein polynomials a and b
+    '''
+    n = len(a)
+    rf = np.zeros(n,dtype=np.complex128)
+    a = np.asarray(a,dtype=np.complex128)
+    b = np.asarray(b,dtype=np.complex128)
+    for j in range(n-1,-1,-1):
+        c = np.sqrt(1/(1 + np.abs(b[j]/a[j])**2))
+        s = np.conj(c*b[j]/a[j])
+        rf[j] = 2*np.arctan2(np.abs(s),c)*np.exp(1j*np.angle(s))
+        if j > 0:
+            a,b = (c*a + s*b)[1:j+1],(-np.conj(s)*a + c*b)[0:j]
+    return rf
+
+def slr(n,tbw,flip,ptype='ex',d1=0.01,d2=0.01):
+    '''
+    slr(n,tbw,flip,ptype,d1,d2) designs an SLR pulse of n samples
+
+        tbw = time-bandwidth product
+        flip = flip angle, degrees
+        ptype = 'st' (small tip), 'ex' (excitation) or 'se' (spin echo refocusing)
+        d1, d2 = passband and stopband ripple of the magnetization profile
+
+        returns the rotation of every sample, complex radians
+    '''
+    return waveforms.get(('rf.slr',n,tbw,flip,ptype,d1,d2),
+        lambda: _slr(n,tbw,flip,ptype,d1,d2))
+
+def _slr(n,tbw,flip,ptype,d1,d2):
+    # ripples of the beta polynomial that give d1, d2 in the profile
+    if ptype == 'st':
+        bsf = 1.0
+    elif ptype == 'ex':
+        bsf = np.sin(np.radians(flip)/2)
+        d1,d2 = np.sqrt(d1/2),d2/np.sqrt(2)
+    elif ptype == 'se':
+        bsf = np.sin(np.radians(flip)/2)
+        d1,d2 = d1/4,np.sqrt(d2)
+    else:
+        raise Exception('Unknown SLR pulse type: ' + ptype)
+
+    w = dinf(d1,d2)/tbw
+    bands = (0,(1-w)*tbw/2/n,(1+w)*tbw/2/n,0.5)
+    b = firls(n,bands,(1,0),(1,d1/d2))
+
+    if ptype == 'st':
+        # small tip: the pulse is the filter, scaled to the flip angle
+        return (b/np.sum(b)*np.radians(flip)).astype(np.complex128)
+    b = bsf*b
+    return ab2rf(b2a(b),b)
+
+def sinc(n,tbw,flip,window='hamming'):
+    '''
+    sinc(n,tbw,flip,window) returns a windowed sinc pulse of n samples with tbw zero
+    crossings, as the rotation of every sample, radians
+    '''
+    def design():
+        x = (np.arange(n) + 0.5)/n - 0.5
+        rf = np.sinc(tbw*x)
+        if window == 'hamming':
+            rf = rf*(0.54 + 0.46*np.cos(2*np.pi*x))
+        elif window == 'hanning':
+            rf = rf*(0.5 + 0.5*np.cos(2*np.pi*x))
+        elif window is not None:
+            raise Exception('Unknown window: ' + window)
+        return (rf/np.sum(rf)*np.radians(flip)).astype(np.complex128)
+    return waveforms.get(('rf.sinc',n,tbw,flip,window),design)
+
+def verse(rf,dt,b1max,smax,slew):
+    '''
+    verse(rf,dt,b1max,smax,slew) reshapes a pulse with the variable rate selective
+    excitation (VERSE) principle: where B1 is low the pulse and its slice gradient
+    are sped up, where B1 exceeds b1max they are slowed down, with the same profile
+
+        rf = rotation of every sample, radians
+        dt = duration of every sample, ms
+        b1max = peak B1 allowed, kHz
+        smax = largest speed-up, i.e. maximum over nominal slice gradient
+        slew = largest change of the speed-up per ms (slew rate over the nominal
+            gradient)
+
+        returns the sample durations (ms) and the speed-up of every sample, which
+        scales the slice gradient
+    '''
+    b1 = np.abs(rf)/(2*np.pi*dt)
+    s = np.minimum(smax,b1max/np.maximum(b1,1e-12))
+
+    # limit the rate of change of the gradient, going forward and backward
+    for order in (slice(None),slice(None,None,-1)):
+        sv,dv = s[order],np.broadcast_to(dt,s.shape)[order]
+        for j in range(1,len(sv)):
+            sv[j] = min(sv[j],sv[j-1] + slew*dv[j]/sv[j-1])
+    return dt/s,s
@@ -1,6 +1,12 @@
 import numpy as np
 from mrpy.limits import *
 from mrpy.seq import RFChain
+from mrpy.cache import waveforms
+from mrpy.rf import profile, design
+
+# measured time-bandwidth products, keyed by the pulse parameters. They are kept apart
+# from the waveform cache, where the many trapezoids of a protocol would evict them.
+_tbw = {}
 
 class RFPulse(RFChain):
     req_parms= ('dur','flip',)
@@ -14,33 +20,207 @@ class RFPulse(RFChain):
     
     def run(self,machine):
         return machine.addRF(self)
+    
+    def offset_wave(self,freq):
+        '''
+        offset_wave(freq) returns the waveform of the pulse with a frequency offset freq
+        (kHz), which moves the slice it excites by freq/dfdz. The phase of the offset is
+        zero at the anchor, sparse samples are repeated so that the phase is followed.
+        '''
+        wave,phase,t = self.get_wave()
+        if freq == 0:
+            return wave,phase,t
+        wave,phase,t = (np.asarray(x,dtype=np.float64) for x in (wave,phase,t))
+        
+        # time under the nominal slice gradient, which a VERSE pulse speeds up
+        k = t
+        scale = getattr(self,'grad_scale',None)
+        if scale is not None and len(scale) == len(t):
+            dk = 2*np.diff(t)/(1/scale[:-1] + 1/scale[1:])
+            k = t[0] + np.concatenate(([0],np.cumsum(dk)))
+        
+        # samples are held until the next one, at least 16 per cycle of the offset
+        step = min(getattr(self,'res',GradientLimits.dwell),1/16/abs(freq))
+        dt = np.diff(t)
+        n = np.maximum(np.ceil(dt/step).astype(int),1)
+        if np.any(n > 1):
+            seg = np.repeat(np.arange(len(dt)),n)
+            frac = (np.arange(len(seg)) - np.repeat(np.cumsum(n) - n,n))/n[seg]
+            wave,phase = np.append(wave[seg],wave[-1]),np.append(phase[seg],phase[-1])
+            t = np.append(t[seg] + frac*dt[seg],t[-1])
+            k = np.append(k[seg] + frac*np.diff(k)[seg],k[-1])
+        
+        k0 = np.interp(self.anchor,t,k)
+        return wave,phase - 2*np.pi*freq*(k - k0),t
+    
+    def _measure_bw(self,key):
+        # bandwidth from the measured time-bandwidth product, unless tbw is given
+        if self.tbw is None:
+            if key not in _tbw:
+                _tbw[key] = profile.measure_tbw(self)
+            self.tbw = _tbw[key]
+        self.bw = self.tbw/self.dur
+    
+    @staticmethod
+    def _samples(rf,dt,t0=0):
+        # B1 (kHz) at the centers of hard pulses with rotations rf (radians) of dt
+        dt = np.broadcast_to(dt,np.shape(rf))
+        t = t0 + np.cumsum(dt) - dt/2
+        b1 = rf/(2*np.pi*dt)
+        if np.all(np.abs(b1.imag) <= 1e-9*np.max(np.abs(b1))):
+            return b1.real.copy(),np.zeros(len(t)),t
+        return np.abs(b1),np.angle(b1),t
 
 class Block(RFPulse):
-    tbw = 2 # later: what is this really?
+    tbw = None # measured from the small tip slice profile when None
         
     def build(self):
         if self.anchor is None:
             self.anchor = self.dur/2
         
-        self.bw = self.tbw/self.dur
         self.b1 = self.flip/360./self.dur # kHz
         self.t = np.array([0, 0, self.dur, self.dur])# - self.anchor
         self.wave = np.array([0, self.b1, self.b1, 0])
-        self.phase = np.zeros(wave.shape)
+        self.phase = np.zeros(self.wave.shape)
+        self._measure_bw(('ex.block',self.dur,self.flip))
 
 class Gauss(RFPulse):
-    tbw = 2.74 # later: what is this really?
+    tbw = None # measured from the small tip slice profile when None
     res=GradientLimits.dwell
         
     def build(self):
         if self.anchor is None:
             self.anchor = self.dur/2
         
+        self.wave,self.phase,self.t = waveforms.get(
+            ('ex.gauss',self.dur,self.flip,self.res,self.anchor),self._wave)
+        self.b1 = self.wave
+        
+        self._measure_bw(('ex.gauss',self.dur,self.res,self.anchor))
+    
+    def _wave(self):
+        t = np.arange(0,self.dur,self.res)# - self.anchor
+        wave = np.exp(-(t-self.anchor)**2*9/(self.dur**2))
+        wave = wave/np.sum(wave)/self.res*self.flip/360.
+        phase = np.zeros(wave.shape)
+        return wave,phase,t
+
+class SLR(RFPulse):
+    '''
+    SLR(dur,flip) is a Shinnar-Le Roux pulse, see rf.design.slr
+    
+        SLR(dur,flip)
+        dur = duration of the pulse, ms
+        flip = flip angle, degrees
+        
+        Other parameters:
+        tbw = time-bandwidth product
+        ptype = 'ex' (excitation), 'st' (small tip) or 'se' (refocusing)
+        d1, d2 = passband and stopband ripple of the profile
+        res = duration of each sample, ms
+    '''
+    tbw = 4
+    ptype = 'ex'
+    d1 = 0.01
+    d2 = 0.01
+    res = GradientLimits.dwell
+    
+    def build(self):
+        if self.anchor is None:
+            self.anchor = self.dur/2
+        
+        n = int(round(self.dur/self.res))
+        rf = design.slr(n,self.tbw,self.flip,self.ptype,self.d1,self.d2)
+        self.wave,self.phase,self.t = self._samples(rf,self.dur/n)
+        self.b1 = self.wave
         self.bw = self.tbw/self.dur
+
+class Sinc(RFPulse):
+    '''
+    Sinc(dur,flip) is a windowed sinc pulse, see rf.design.sinc
+    
+        Sinc(dur,flip)
+        dur = duration of the pulse, ms
+        flip = flip angle, degrees
+        
+        Other parameters:
+        tbw = number of zero crossings (time-bandwidth product)
+        window = 'hamming', 'hanning' or None
+        res = duration of each sample, ms
+    '''
+    tbw = 4
+    window = 'hamming'
+    res = GradientLimits.dwell
+    
+    def build(self):
+        if self.anchor is None:
+            self.anchor = self.dur/2
         
-        self.t = np.arange(0,self.dur,self.res)# - self.anchor
-        wave = np.exp(-(self.t-self.anchor)**2*9/(self.dur**2))
-        self.b1 = wave/np.sum(wave)/self.res*self.flip/360.
-        self.wave = wave*self.b1
-        self.phase = np.zeros(wave.shape)
+        n = int(round(self.dur/self.res))
+        rf = design.sinc(n,self.tbw,self.flip,self.window)
+        self.wave,self.phase,self.t = self._samples(rf,self.dur/n)
+        self.b1 = self.wave
+        self._measure_bw(('ex.sinc',self.dur,n,self.tbw,self.window))
 
+class Verse(RFPulse):
+    '''
+    Verse(dur,flip) is an SLR or sinc pulse reshaped with VERSE, see rf.design.verse
+    
+        Verse(dur,flip)
+        dur = duration of the pulse before reshaping, ms
+        flip = flip angle, degrees
+        
+        Other parameters:
+        base = 'slr' or 'sinc', the pulse that is reshaped (with its tbw, ptype, d1,
+            d2 and window parameters)
+        b1max = peak B1 allowed, kHz (default: the peak of the base pulse, which
+            gives the shortest pulse at the same peak B1)
+        smax = largest slice gradient over the nominal one
+        slew = largest change of the speed-up per ms
+        
+        Calculated parameters:
+        dur = duration of the reshaped pulse, ms
+        bw = bandwidth under the nominal slice gradient, kHz
+        grad_t, grad_scale = sample times (ms) and the slice gradient over its
+            nominal value at each sample
+    '''
+    base = 'slr'
+    tbw = 4
+    ptype = 'ex'
+    d1 = 0.01
+    d2 = 0.01
+    window = 'hamming'
+    b1max = None
+    smax = 4.0
+    slew = GradientLimits.slew_lim/GradientLimits.grad_lim # 1/ms
+    res = GradientLimits.dwell
+    
+    def build(self):
+        if not hasattr(self,'dur0'):
+            self.dur0 = self.dur
+        n = int(round(self.dur0/self.res))
+        if self.base == 'slr':
+            rf = design.slr(n,self.tbw,self.flip,self.ptype,self.d1,self.d2)
+        elif self.base == 'sinc':
+            rf = design.sinc(n,self.tbw,self.flip,self.window)
+        else:
+            raise Exception('Unknown VERSE base pulse: ' + self.base)
+        
+        dt = self.dur0/n
+        b1max = self.b1max
+        if b1max is None:
+            b1max = np.max(np.abs(rf))/(2*np.pi*dt)
+        key = ('ex.verse',self.base,n,self.tbw,self.flip,self.ptype,self.d1,self.d2,
+            self.window,self.dur0,b1max,self.smax,self.slew)
+        dts,scale = waveforms.get(key,lambda: design.verse(rf,dt,b1max,self.smax,
+            self.slew))
+        
+        self.wave,self.phase,self.t = self._samples(rf,dts)
+        self.b1 = self.wave
+        self.grad_t,self.grad_scale = self.t,scale
+        self.dur = float(np.sum(dts))
+        self.bw = self.tbw/self.dur0
+        
+        # the profile is centered where half of the k-space weight has been played
+        k = np.cumsum(dt*np.ones(n)) - dt/2
+        self.anchor = float(np.interp(self.dur0/2,k,self.t))
@@ -0,0 +1,115 @@
+import numpy as np
+from mrpy.timeline import piecewise
+from mrpy.sim.bloch import spinor
+
+class SliceProfile:
+    '''
+    SliceProfile(pulse) computes the frequency response of an RF pulse, i.e. its slice
+    profile under a slice select gradient
+
+        SliceProfile(pulse,freq,method,refocus)
+        pulse = an RFPulse from mrpy.rf
+        freq = off-resonance frequencies, kHz (default +-8/dur in 4001 steps)
+        method = 'bloch' for the Bloch simulation of every frequency, or 'fft' for the
+            small tip approximation
+        refocus = remove the linear phase of precession after the anchor of the pulse
+
+        Calculated parameters:
+        freq = off-resonance frequencies, kHz
+        z = slice positions of the frequencies, mm (None if pulse.dfdz is not set)
+        mxy = transverse magnetization after the pulse, starting from equilibrium
+        mz = longitudinal magnetization after the pulse
+        a, b = Cayley-Klein parameters of the pulse ('bloch' only, b^2 is the spin
+            echo profile of a refocusing pulse)
+        fwhm = full width at half maximum of |mxy|, kHz
+        tbw = time-bandwidth product, fwhm*dur
+
+    The pulse is taken as piecewise constant between its samples. The small tip
+    approximation is the Fourier transform of B1, computed with one FFT on a uniform
+    raster, and is exact in the limit of small flip angles. The Bloch simulation
+    composes the rotation of every interval into one spinor per frequency, for all
+    frequencies at once.
+    '''
+    def __init__(self,pulse,freq=None,method='bloch',refocus=True):
+        self.pulse = pulse
+        if freq is None:
+            freq = np.linspace(-8,8,4001)/pulse.dur
+        self.freq = np.asarray(freq,dtype=np.float64)
+        self.method = method
+        self.refocus = refocus
+        self.calc()
+
+    def calc(self):
+        wave,phase,t = self.pulse.get_wave()
+        breaks = np.unique(t)
+        if len(breaks) < 2:
+            raise Exception('RF pulse has no duration')
+        b1 = piecewise(breaks,t,wave*np.exp(1j*phase),np.array([0,len(t)]))[0]
+        dt = np.diff(breaks)
+
+        # precession from the end of the pulse back to its anchor
+        t_ref = t[0] + self.pulse.anchor if self.refocus else breaks[-1]
+        rewind = np.exp(2j*np.pi*self.freq*(breaks[-1] - t_ref))
+
+        self.a = self.b = None
+        if self.method == 'fft':
+            self.mxy = self._small_tip(breaks,b1,t_ref)
+            self.mz = np.sqrt(np.maximum(1 - np.abs(self.mxy)**2,0.0))
+        elif self.method == 'bloch':
+            self.a,self.b = spinor(2*np.pi*b1*dt,2*np.pi*np.outer(dt,self.freq))
+            self.mxy = 2*np.conj(self.a)*self.b*rewind
+            self.mz = (np.abs(self.a)**2 - np.abs(self.b)**2)
+        else:
+            raise Exception('Unknown slice profile method: ' + self.method)
+
+        dfdz = getattr(self.pulse,'dfdz',None)
+        self.z = self.freq/dfdz*1000 if dfdz else None
+        self.fwhm = self._fwhm(np.abs(self.mxy))
+        self.tbw = self.fwhm*self.pulse.dur
+
+    def _small_tip(self,breaks,b1,t_ref):
+        # resample onto a uniform raster of the shortest interval, fine enough to reach
+        # the highest requested frequency
+        step = np.min(np.diff(breaks))
+        fmax = np.max(np.abs(self.freq))
+        if fmax > 0:
+            step = min(step,0.25/fmax)
+        n = max(1,int(round((breaks[-1] - breaks[0])/step)))
+        step = (breaks[-1] - breaks[0])/n
+        mid = breaks[0] + (np.arange(n) + 0.5)*step
+        x = b1[np.clip(np.searchsorted(breaks,mid,'right') - 1,0,len(b1)-1)]
+
+        # zero padded so that the FFT grid resolves the requested frequencies
+        df = np.min(np.diff(self.freq)) if len(self.freq) > 1 else 1/(n*step)
+        nfft = 1 << int(np.ceil(np.log2(max(4*n,1/(df*step),2))))
+        spec = np.fft.fftshift(np.fft.ifft(x,nfft))*nfft
+        f = np.fft.fftshift(np.fft.fftfreq(nfft,step))
+        spec = np.interp(self.freq,f,spec.real) + 1j*np.interp(self.freq,f,spec.imag)
+
+        # mxy = i*2*pi*sum(b1*dt*exp(i*2*pi*f*(t - t_ref))), each sample a box of step
+        return (2j*np.pi*step*np.sinc(self.freq*step)*spec*
+            np.exp(2j*np.pi*self.freq*(breaks[0] + step/2 - t_ref)))
+
+    def _fwhm(self,mag):
+        # width of the lobe around the peak above half of its maximum, interpolated
+        i = np.argmax(mag)
+        half = mag[i]/2
+        if half == 0:
+            return 0.0
+        below = np.flatnonzero(mag < half)
+        if not np.any(below < i) or not np.any(below > i):
+            raise Exception('Slice profile does not fall to half maximum, widen freq')
+        lo = below[below < i][-1] + 1
+        hi = below[below > i][0] - 1
+
+        f = self.freq
+        f_lo = np.interp(half,[mag[lo-1],mag[lo]],[f[lo-1],f[lo]])
+        f_hi = np.interp(half,[mag[hi+1],mag[hi]],[f[hi+1],f[hi]])
+        return f_hi - f_lo
+
+def measure_tbw(pulse):
+    '''
+    measure_tbw(pulse) returns the time-bandwidth product of a pulse from its small
+    tip slice profile
+    '''
+    return SliceProfile(pulse,method='fft').tbw
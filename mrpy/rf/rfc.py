@@ -1,6 +1,8 @@
 import numpy as np
 from mrpy.limits import *
 from .ex import RFPulse
+from . import ex
+from mrpy.cache import waveforms
 
 class Block(RFPulse):
     tbw = 2 # later: what is this really?
@@ -47,9 +49,20 @@ class Gauss(RFPulse):
         self.bw = self.tbw/self.dur
 
     def get_wave(self):
+        wave,phase,t = waveforms.get(('rfc.gauss',self.dur,self.flip,self.res,self.anchor),
+            self._wave)
+        self.b1 = wave
+        return wave,phase,t
+    
+    def _wave(self):
         t = np.arange(0,self.dur,self.res) - self.anchor
         wave = np.exp(-(t)**2*9/(self.dur**2))
-        self.b1 = wave/np.sum(wave)/self.res*self.flip/360.
-        wave = wave*self.b1
+        wave = wave/np.sum(wave)/self.res*self.flip/360.
         phase = np.zeros(wave.shape)
         return wave,phase,t
+
+class SLR(ex.SLR):
+    ptype = 'se'
+
+class Sinc(ex.Sinc):
+    pass
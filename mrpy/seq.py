@@ -3,6 +3,39 @@ from mrpy.limits import *
 
 class System: pass
 
+class Machine:
+    '''
+    Machine is the interface a sequence is run on: seq.run(machine) calls back the
+    method for the type of seq
+    
+        addComposite(compobj) for a Composite, which runs its parts
+        addLoop(loopobj) for a Loop, which runs loopobj.obj for its repetitions
+        addGradient(gradobj), addRF(rfobj), addAcquisition(acqobj) for the waveform
+            objects, whose samples are returned by their get_wave()
+    
+    Where the parts of a composite and the repetitions of a loop are placed in time
+    (from their time, anchor and dur) is up to the machine. SequenceSim renders the
+    waveforms, Compiler records them into a Timeline, which a Backend plays.
+    '''
+    def _unsupported(self,obj):
+        raise Exception('%s cannot run %s objects' % (type(self).__name__,
+            type(obj).__name__))
+    
+    def addComposite(self,compobj):
+        self._unsupported(compobj)
+    
+    def addLoop(self,loopobj):
+        self._unsupported(loopobj)
+    
+    def addGradient(self,gradobj):
+        self._unsupported(gradobj)
+    
+    def addRF(self,rfobj):
+        self._unsupported(rfobj)
+    
+    def addAcquisition(self,acqobj):
+        self._unsupported(acqobj)
+
 class Sequence:
     req_parms = None
     name = None
@@ -132,55 +165,129 @@ class Loop(Sequence):
         return machine.addLoop(self)
 
 class List:
-    def __init__(self,vals,loop=None):
-        if np.isscalar(vals):
-            vals = [vals,]
-        self.vals = np.array(vals)
+    '''
+    List(vals,loop) holds the values a parameter takes over the repetitions of a Loop
+    
+        List(vals,loop)
+        vals = the values, one per repetition (copied)
+        loop = the Loop selecting the current value, set by Loop.add_list
+    
+    Arithmetic between Lists and numbers is lazy: it records the operation and the
+    values of the whole expression are computed once, in one pass with a single output
+    buffer, the first time they are needed. vals holds the values for every loop index
+    at once, value() the value of the current loop index, or the value with the largest
+    magnitude when the loop is not running (cached).
+    '''
+    # make numpy scalars and arrays defer to the reflected List operators
+    __array_ufunc__ = None
+    
+    def __init__(self,vals,loop=None,op=None,args=None):
+        if op is None:
+            if np.isscalar(vals):
+                vals = [vals,]
+            vals = np.array(vals)
+        else:
+            # array operands are copied, like the values of a List
+            vals = None
+            args = tuple(a if isinstance(a,List) or np.isscalar(a) else np.array(a)
+                for a in args)
+        self._vals = vals
+        self._op = op
+        self._args = args
+        self._peak = None
         self.loop = loop
     
+    @property
+    def vals(self):
+        if self._vals is None:
+            self._vals,fresh = self._eval()
+            self._vals.flags.writeable = False
+            self._op = self._args = None
+        return self._vals
+    
+    @vals.setter
+    def vals(self,vals):
+        self._vals = np.array(vals)
+        self._op = self._args = None
+        self._peak = None
+    
+    def _eval(self):
+        # returns the values and whether they are a new buffer that may be reused
+        if self._vals is not None:
+            return self._vals,False
+        
+        ops = []
+        for arg in self._args:
+            if isinstance(arg,List):
+                ops.append(arg._eval())
+            else:
+                ops.append((arg,False))
+        
+        vals = [v for v,fresh in ops]
+        dtype = self._op.resolve_dtypes(tuple(type(v) if type(v) in (int,float,complex)
+            else np.asarray(v).dtype for v in vals) + (None,))[-1]
+        shape = np.broadcast_shapes(*[np.shape(v) for v in vals])
+        # a temporary is only reused as the output when it has the result dtype
+        for v,fresh in ops:
+            if fresh and v.dtype == dtype and v.shape == shape:
+                return self._op(*vals,out=v),True
+        return self._op(*vals),True
+    
+    @property
+    def shape(self):
+        if self._vals is not None:
+            return self._vals.shape
+        return np.broadcast_shapes(*[a.shape if isinstance(a,List) else np.shape(a)
+            for a in self._args])
+    
     def value(self):
         if self.loop is None or self.loop.idx is None:
-            imax = np.argmax(np.abs(self.vals))
-            val = self.vals[imax]
-        else:
-            val = self.vals[self.loop.idx]
-            
-        return val
+            if self._peak is None:
+                vals = self.vals
+                self._peak = vals[np.argmax(np.abs(vals))]
+            return self._peak
         
+        return self.vals[self.loop.idx]
+    
     def __len__(self):
-        return len(self.vals)
+        return self.shape[0]
+    
+    def __getitem__(self,idx):
+        return self.vals[idx]
+    
+    def __array__(self,dtype=None,copy=None):
+        return np.asarray(self.vals,dtype=dtype)
     
     def __repr__(self):
         return 'List: ' + repr(self.vals)
-        
+    
     """ Basic +-*/ """
     def __add__(self, other):
-        if isinstance(other, List):
-            other = other.vals
-        
-        return List(self.vals + other)
+        return List(None,op=np.add,args=(self,other))
+    
+    def __radd__(self, other):
+        return List(None,op=np.add,args=(other,self))
     
     def __mul__(self, other):
-        if isinstance(other, List):
-            other = other.vals
-        
-        return List(self.vals * other)
+        return List(None,op=np.multiply,args=(self,other))
         
     def __rmul__(self,other):
-        if isinstance(other, List):
-            other = other.vals
-        
-        return List(self.vals * other)
+        return List(None,op=np.multiply,args=(other,self))
     
     def __sub__(self, other):
-        if isinstance(other, List):
-            other = other.vals
-        
-        return List(self.vals - other)
+        return List(None,op=np.subtract,args=(self,other))
+    
+    def __rsub__(self, other):
+        return List(None,op=np.subtract,args=(other,self))
     
     def __truediv__(self, other):
-        if isinstance(other, List):
-            other = other.vals
-        
-        return List(self.vals / other)
-
+        return List(None,op=np.true_divide,args=(self,other))
+    
+    def __rtruediv__(self, other):
+        return List(None,op=np.true_divide,args=(other,self))
+    
+    def __neg__(self):
+        return List(None,op=np.negative,args=(self,))
+    
+    def __abs__(self):
+        return List(None,op=np.absolute,args=(self,))
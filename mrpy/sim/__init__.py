@@ -1,2 +1,5 @@
-
-from .sim import SequenceSim
\ No newline at end of file
+from .sim import SequenceSim
+from .bloch import BlochSim, Isochromats
+from .epg import EPG
+from .phantom import Phantom
+from .recon import CartesianRecon
\ No newline at end of file
@@ -0,0 +1,271 @@
+import numpy as np
+import multiprocessing
+from multiprocessing import shared_memory
+from mrpy.limits import gamma
+from mrpy.timeline import Timeline, piecewise
+
+class Isochromats:
+    '''
+    Isochromats defines a batch of spins for BlochSim
+
+        Isochromats(pos,df,t1,t2,m0)
+        pos = positions, (N,3) array along R, P and S, mm
+        df = off-resonance frequency, kHz
+        t1 = longitudinal relaxation time, ms (np.inf for none)
+        t2 = transverse relaxation time, ms (np.inf for none)
+        m0 = equilibrium magnetization
+
+        df, t1, t2 and m0 are scalars or length N arrays
+    '''
+    def __init__(self,pos,df=0.0,t1=np.inf,t2=np.inf,m0=1.0):
+        self.pos = np.atleast_2d(np.asarray(pos,dtype=np.float64))
+        n = len(self.pos)
+        self.df = np.broadcast_to(np.asarray(df,dtype=np.float64),(n,))
+        self.t1 = np.broadcast_to(np.asarray(t1,dtype=np.float64),(n,))
+        self.t2 = np.broadcast_to(np.asarray(t2,dtype=np.float64),(n,))
+        self.m0 = np.broadcast_to(np.asarray(m0,dtype=np.float64),(n,))
+
+    def __len__(self):
+        return len(self.pos)
+
+    def __getitem__(self,idx):
+        return Isochromats(self.pos[idx],self.df[idx],self.t1[idx],self.t2[idx],
+            self.m0[idx])
+
+    def pack(self,out=None):
+        '''
+        pack(out) writes the isochromats into an (N,7) array of pos, df, t1, t2, m0
+        '''
+        if out is None:
+            out = np.empty((len(self),7))
+        out[:,0:3] = self.pos
+        out[:,3] = self.df
+        out[:,4] = self.t1
+        out[:,5] = self.t2
+        out[:,6] = self.m0
+        return out
+
+    @staticmethod
+    def unpack(arr):
+        return Isochromats(arr[:,0:3],arr[:,3],arr[:,4],arr[:,5],arr[:,6])
+
+    @staticmethod
+    def grid(pos,df=(0.0,),relax=((np.inf,np.inf),),m0=1.0):
+        '''
+        grid(pos,df,relax,m0) returns every combination of position, off-resonance and
+        (t1,t2) pair, positions vary fastest
+        '''
+        pos = np.atleast_2d(np.asarray(pos,dtype=np.float64))
+        df = np.asarray(df,dtype=np.float64).ravel()
+        relax = np.asarray(relax,dtype=np.float64).reshape(-1,2)
+
+        r,f,p = np.meshgrid(np.arange(len(relax)),np.arange(len(df)),np.arange(len(pos)),
+            indexing='ij')
+        r,f,p = r.ravel(),f.ravel(),p.ravel()
+        return Isochromats(pos[p],df[f],relax[r,0],relax[r,1],m0)
+
+    @staticmethod
+    def line(fov,n,axis='S',**kwargs):
+        '''
+        line(fov,n,axis) returns n isochromats evenly spread over fov (mm) along an axis
+        '''
+        pos = np.zeros((n,3))
+        pos[:,'RPS'.index(axis)] = (np.arange(n)-(n-1)/2.0)*fov/n
+        return Isochromats.grid(pos,**kwargs)
+
+def spinor(w,wz):
+    '''
+    spinor(w,wz) composes the rotations of consecutive intervals into the Cayley-Klein
+    parameters a, b of every isochromat
+    
+        w = transverse rotation per interval, 2*pi*B1*dt, complex (n,) radians
+        wz = rotation about z per interval and isochromat, (n,N) radians
+    
+    Starting from equilibrium the magnetization is mxy = 2*conj(a)*b, mz = |a|^2-|b|^2.
+    '''
+    a = np.ones(wz.shape[1:],dtype=np.complex128)
+    b = np.zeros(wz.shape[1:],dtype=np.complex128)
+    for n in range(len(w)):
+        th = np.sqrt(np.abs(w[n])**2 + wz[n]**2)
+        s = np.sin(th/2)/np.where(th == 0,1,th)
+        an = np.cos(th/2) + 1j*wz[n]*s
+        bn = 1j*w[n]*s
+        a,b = an*a - np.conj(bn)*b, bn*a + np.conj(an)*b
+    return a,b
+
+class BlochSim:
+    '''
+    BlochSim(seq) simulates the magnetization of batches of isochromats through a
+    compiled sequence and returns the signal sampled by every Acquisition
+
+        BlochSim(seq,chunk)
+        seq = a sequence object or a compiled Timeline
+        chunk = number of isochromats propagated at once
+
+    The timeline is cut at every gradient corner, RF sample and ADC sample. Between RF
+    pulses the gradients only add phase, so free precession and readouts are applied
+    in closed form. Each distinct RF block is reduced once per chunk to a single
+    Cayley-Klein rotation per isochromat, with relaxation during the pulse applied
+    half before and half after it (hard pulse approximation).
+    '''
+    def __init__(self,seq,chunk=4096):
+        if not isinstance(seq,Timeline):
+            seq = Timeline.compile(seq)
+        self.timeline = seq
+        self.chunk = chunk
+        self._build()
+
+    def _build(self):
+        tl = self.timeline
+
+        grads = [tl.expand(axis) for axis in ('R','P','S')]
+        rt,ramp,rph,roff = tl.expand('rf')
+        at,aw,aph,aoff = tl.expand('acq')
+
+        self.npoints = np.diff(aoff)
+        if len(self.npoints) and np.any(self.npoints != self.npoints[0]):
+            raise Exception('BlochSim requires acquisitions with equal number of points')
+
+        breaks = np.unique(np.concatenate([g[0] for g in grads] + [rt,at]))
+        if len(breaks) < 2:
+            breaks = np.concatenate((breaks,breaks+1.0))[:2]
+        dt = np.diff(breaks)
+
+        # gradient moment (ms*mT/m) and complex B1 (kHz) of every interval
+        gm = np.stack([piecewise(breaks,g[0],g[1],g[3])[0]*dt for g in grads])
+        b1 = piecewise(breaks,rt,ramp*np.exp(1j*rph),roff)[0]
+        isrf = b1 != 0
+
+        # every ADC sample reads the state at the start of the interval it begins
+        adc = np.searchsorted(breaks,at)
+
+        self.blocks = []
+        self.rf_blocks = []
+        rf_ids = {}
+
+        # split into alternating runs of RF and free precession intervals
+        edges = np.flatnonzero(np.diff(isrf.astype(np.int8))) + 1
+        edges = np.concatenate(([0],edges,[len(dt)]))
+        for i0,i1 in zip(edges[:-1],edges[1:]):
+            if isrf[i0]:
+                # absolute times differ per repetition, so compare rounded blocks
+                key = tuple(np.round(x,9).tobytes() for x in
+                    (dt[i0:i1],b1[i0:i1],gm[:,i0:i1]))
+                if key not in rf_ids:
+                    rf_ids[key] = len(self.rf_blocks)
+                    self.rf_blocks.append((dt[i0:i1],b1[i0:i1],gm[:,i0:i1]))
+                self.blocks.append(('rf',rf_ids[key],np.sum(dt[i0:i1])))
+                continue
+
+            # closed form free precession, with the ADC samples falling inside it. Runs
+            # alternate, so a sample on either edge of this block belongs to it.
+            s0 = np.searchsorted(adc,i0,'left')
+            s1 = np.searchsorted(adc,i1,'right')
+            ids = np.arange(s0,s1)
+            cumt = np.concatenate(([0],np.cumsum(dt[i0:i1])))
+            cumm = np.concatenate((np.zeros((3,1)),np.cumsum(gm[:,i0:i1],axis=1)),axis=1)
+            k = adc[ids] - i0
+            self.blocks.append(('free',ids,cumt[k],cumm[:,k],cumt[-1],cumm[:,-1]))
+
+        self.nsamples = len(at)
+
+    def _rf_rotation(self,spins,block):
+        # compose the rotations of all intervals of an RF block into one spinor
+        dt,b1,gm = block
+        wz = (gamma*(gm.T @ spins.pos.T)/1000 + 2*np.pi*np.outer(dt,spins.df))
+        return spinor(2*np.pi*b1*dt,wz)
+    
+    def _relax(self,spins,mxy,mz,t):
+        e2 = np.exp(-t/spins.t2)
+        e1 = np.exp(-t/spins.t1)
+        return mxy*e2,mz*e1 + spins.m0*(1-e1)
+
+    def _run_chunk(self,spins,sig):
+        mxy = np.zeros(len(spins),dtype=np.complex128)
+        mz = np.array(spins.m0,dtype=np.float64)
+        rot = {}
+
+        for block in self.blocks:
+            if block[0] == 'rf':
+                kind,rf_id,t = block
+                if rf_id not in rot:
+                    rot[rf_id] = self._rf_rotation(spins,self.rf_blocks[rf_id])
+                a,b = rot[rf_id]
+
+                mxy,mz = self._relax(spins,mxy,mz,t/2)
+                ac = np.conj(a)
+                mxy,mz = (ac*ac*mxy - b*b*np.conj(mxy) + 2*ac*b*mz,
+                    (a*ac - b*np.conj(b)).real*mz - 2*(ac*np.conj(b)*mxy).real)
+                mxy,mz = self._relax(spins,mxy,mz,t/2)
+                continue
+
+            kind,ids,cumt,cumm,t,m = block
+            if len(ids):
+                phi = (gamma/1000*(spins.pos @ cumm) +
+                    2*np.pi*np.outer(spins.df,cumt))
+                decay = np.exp(-np.outer(1/spins.t2,cumt))
+                sig[ids] += mxy @ (np.exp(-1j*phi)*decay)
+
+            phi = gamma/1000*(spins.pos @ m) + 2*np.pi*spins.df*t
+            mxy,mz = self._relax(spins,mxy*np.exp(-1j*phi),mz,t)
+
+        return mxy,mz
+
+    def __getstate__(self):
+        # workers only need the step table, not the sequence objects
+        state = dict(self.__dict__)
+        state['timeline'] = None
+        return state
+
+    def run(self,spins,workers=1):
+        '''
+        run(spins,workers) simulates a batch of Isochromats
+
+            spins = Isochromats
+            workers = number of worker processes the chunks of spins are split over
+
+            returns the summed complex signal of every ADC sample, shaped
+            (number of acquisitions, points per acquisition) in time order
+
+        The signal of every chunk is added to the result in chunk order, so the result
+        is bit-identical for any number of workers.
+        '''
+        nchunks = -(-len(spins)//self.chunk)
+        sig = np.zeros(self.nsamples,dtype=np.complex128)
+        if workers > 1 and nchunks > 1:
+            self._run_parallel(spins,nchunks,workers,sig)
+        else:
+            part = np.empty(self.nsamples,dtype=np.complex128)
+            for n in range(nchunks):
+                part[:] = 0
+                self._run_chunk(spins[n*self.chunk:(n+1)*self.chunk],part)
+                sig += part
+        return sig.reshape(len(self.npoints),-1) if len(self.npoints) else sig
+
+    def _run_parallel(self,spins,nchunks,workers,sig):
+        # spins live in shared memory and tasks are chunk numbers. imap returns the
+        # chunk signals in chunk order, each is added and dropped as it arrives.
+        shm = shared_memory.SharedMemory(create=True,size=max(len(spins)*7*8,1))
+        try:
+            spins.pack(np.ndarray((len(spins),7),buffer=shm.buf))
+            args = (self,shm.name,len(spins))
+            with multiprocessing.Pool(min(workers,nchunks),_init_worker,args) as pool:
+                for part in pool.imap(_run_worker,range(nchunks)):
+                    sig += part
+        finally:
+            shm.close()
+            shm.unlink()
+
+_worker = {}
+
+def _init_worker(sim,spin_name,nspins):
+    _worker['sim'] = sim
+    _worker['shm'] = shared_memory.SharedMemory(name=spin_name)
+    _worker['spins'] = np.ndarray((nspins,7),buffer=_worker['shm'].buf)
+
+def _run_worker(n):
+    sim = _worker['sim']
+    spins = Isochromats.unpack(_worker['spins'][n*sim.chunk:(n+1)*sim.chunk])
+    out = np.zeros(sim.nsamples,dtype=np.complex128)
+    sim._run_chunk(spins,out)
+    return out
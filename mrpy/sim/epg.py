@@ -0,0 +1,249 @@
+import numpy as np
+
+class EPG:
+    '''
+    EPG(seq) computes the echo of every TR of a spoiled gradient echo with the extended
+    phase graph formalism, for many tissues and protocols at once
+
+        EPG(seq,t1,t2,flip,tr,te,ntr,rf_spoil,history,steady,tol,memory)
+        seq = a built GradientEcho that provides flip, tr, te, ntr and the phase cycle
+            (ph_cycle, degrees, one entry per TR) of its excitation pulse, or None to
+            give all of them here
+        t1, t2 = relaxation times, ms
+        flip = flip angle, degrees
+        tr, te = repetition and echo time, ms
+        ntr = number of TRs (default: every TR of seq)
+        rf_spoil = quadratic RF spoiling phase increment, degrees (0 for gradient
+            spoiling only), or None for ideal spoiling that removes all transverse
+            magnetization at the end of every TR
+        history = keep the echo of every TR, otherwise only the last one
+        steady = compute the steady state echo directly instead of the echo after ntr
+            TRs, which needs a constant phase cycle and no ntr (echo is None)
+        tol = configuration states are kept up to the order where T2 decay brings
+            them below tol
+        memory = bytes of configuration states held at a time, the default keeps them
+            in cache
+
+        t1, t2, flip, tr and te broadcast against each other to the combinations.
+
+        Calculated parameters:
+        shape = shape of the combinations
+        phase = RF phase of every TR, degrees (phase cycle plus RF spoiling), None for
+            steady
+        echo = complex echo at TE of every TR, (ntr,) + shape, relative to the
+            equilibrium magnetization, demodulated by the RF phase (history only)
+        signal = echo of the last TR (or the steady state echo), shape
+
+    Every TR the gradients dephase the transverse magnetization by one configuration
+    state, so the sequence is assumed to have the same unbalanced gradient area in
+    every TR. The RF pulse is instantaneous and T2* decay is not included. Ideal
+    spoiling only propagates the longitudinal magnetization, in closed form per TR.
+
+    All combinations are stepped through the TRs together, sorted by the number of
+    states they need and split into chunks that fit in memory. With quadratic RF
+    spoiling the TRs differ only by a rotation of the states that grows linearly with
+    their order, so in a frame that follows it every TR is the same linear map and
+    the steady state is its fixed point. steady solves for it in one sweep down the
+    states per combination instead of stepping through the TRs.
+    '''
+    t1 = 1000.0
+    t2 = 100.0
+    flip = None
+    tr = None
+    te = None
+    ntr = None
+    rf_spoil = 117.0
+    history = True
+    steady = False
+    tol = 1e-5
+    memory = 2 << 20
+
+    def __init__(self,seq=None,**kwargs):
+        self.seq = seq
+        for key,value in kwargs.items():
+            setattr(self,key,value)
+        self.calc()
+
+    def _from_seq(self):
+        # unset parameters are read from the sequence
+        seq = self.seq
+        ph_cycle = (0,)
+        if seq is not None:
+            if self.flip is None:
+                self.flip = seq.ss.flip
+            if self.tr is None:
+                self.tr = seq.tr
+            if self.te is None:
+                self.te = seq.te
+            if self.ntr is None and not self.steady:
+                self.ntr = int(seq.na*seq.nr*seq.enc.npe)
+            ph_cycle = seq.ss.parts[0].ph_cycle
+        if self.flip is None or self.tr is None or self.te is None or (self.ntr is None
+                and not self.steady):
+            raise Exception('EPG needs flip, tr, te and ntr, or a sequence to read them')
+
+        if self.steady:
+            if self.ntr is not None:
+                raise Exception('A steady state EPG has no number of TRs')
+            if len(set(np.asarray(ph_cycle,dtype=np.float64) % 360)) > 1:
+                raise Exception('The steady state needs a constant phase cycle')
+            self.phase = None
+            return
+
+        n = np.arange(self.ntr)
+        self.phase = np.asarray(ph_cycle,dtype=np.float64)[n % len(ph_cycle)]
+        if self.rf_spoil is not None:
+            self.phase = self.phase + self.rf_spoil*n*(n+1)/2
+
+    def calc(self):
+        self._from_seq()
+        parms = np.broadcast_arrays(*(np.asarray(p,dtype=np.float64) for p in
+            (self.t1,self.t2,self.flip,self.tr,self.te)))
+        self.shape = parms[0].shape
+        t1,t2,flip,tr,te = (p.ravel() for p in parms)
+
+        if self.rf_spoil is None:
+            echo = self._ideal(t1,t2,flip,tr,te)
+        elif self.steady:
+            if not np.all(np.isfinite(t2)):
+                raise Exception('The steady state needs a finite T2')
+            echo = np.empty((1,t1.size),dtype=np.complex128)
+            # the sweep holds about 16 arrays of one value per combination
+            for s,nk in self._chunks(self._orders(tr/t2,None),lambda nk: 16*16):
+                echo[0,s] = self._steady(t1[s],t2[s],flip[s],tr[s],te[s],nk)
+        else:
+            echo = np.empty((self.ntr if self.history else 1,t1.size),
+                dtype=np.complex128)
+            # F+, F-, Z and three work buffers of nk + 1 states per combination
+            for s,nk in self._chunks(self._orders(tr/t2,self.ntr),lambda nk: 6*16*(nk+1)):
+                echo[:,s] = self._states(t1[s],t2[s],flip[s],tr[s],te[s],nk)
+
+        self.signal = echo[-1].reshape(self.shape)
+        self.echo = (echo.reshape((len(echo),) + self.shape) if self.history and
+            not self.steady else None)
+
+    def _orders(self,decay,ntr):
+        # highest state order that T2 decay (tr/t2 per TR) leaves above tol
+        with np.errstate(divide='ignore'):
+            nk = np.ceil(np.log(self.tol)/-decay) + 1
+        if ntr is not None:
+            nk = np.minimum(nk,ntr)
+        return np.maximum(nk,1).astype(np.int64)
+
+    def _chunks(self,nk,nbytes):
+        # chunks of the combinations sorted by their number of states, that fit in
+        # memory and need at most half as many states again as their first one
+        order = np.argsort(nk,kind='stable')
+        nk = nk[order]
+        b0 = 0
+        while b0 < len(nk):
+            end = np.searchsorted(nk,1.5*nk[b0] + 1,'right')
+            b1 = min(end,b0 + max(int(self.memory//nbytes(nk[end-1])),1))
+            yield order[b0:b1],int(nk[b1-1])
+            b0 = b1
+
+    def _ideal(self,t1,t2,flip,tr,te):
+        # longitudinal recursion mz = mz*cos(flip)*e1 + 1 - e1, from equilibrium
+        e1 = np.exp(-tr/t1)
+        r = np.cos(np.radians(flip))*e1
+        ss = (1 - e1)/(1 - r)
+        gain = np.sin(np.radians(flip))*np.exp(-te/t2)*1j
+        if self.steady:
+            return (gain*ss)[None]
+        n = np.arange(self.ntr)[:,None] if self.history else self.ntr - 1
+        return gain*(ss + (1 - ss)*r**n)
+
+    def _steady(self,t1,t2,flip,tr,te,nk):
+        # In the frame where the states of order k are turned back by k*n*rf_spoil
+        # after TR n, one TR maps the states x before a pulse to
+        #   F+(k) = p(k)*(A x(k-1))[F+], F-(k) = m(k)*(A x(k+1))[F-],
+        #   Z(k) = z(k)*(A x(k))[Z] + (1 - e1 at k = 0), F+(0) = conj(F-(0))
+        # with A the pulse followed by relaxation and the frame phases p, m, z. At the
+        # fixed point Z(k) follows from F+(k) and F-(k), and F-(k) = R(k)*F+(k) for
+        # k > 0, with R swept down from R = 0 above the last state.
+        e1 = np.exp(-tr/t1)
+        e2 = np.exp(-tr/t2)
+        a = np.radians(flip)
+        c2,s2,sa,ca = np.cos(a/2)**2,np.sin(a/2)**2,np.sin(a),np.cos(a)
+        # A = [[e2 c2, e2 s2, i e2 sa], [e2 s2, e2 c2, -i e2 sa],
+        #      [i/2 e1 sa, -i/2 e1 sa, e1 ca]], so at the fixed point
+        # Z(k) = z(k)*i/2 e1 sa/(1 - z(k) e1 ca)*(F+(k) - F-(k)), which gives
+        # (A x)[F+] = u F+ + v F- and (A x)[F-] = v F+ + u F- with g = i e2 sa Z/(F+ - F-)
+        u0,v0 = e2*c2,e2*s2
+        q,ez = -0.5*e1*e2*sa*sa,e1*ca
+        step = np.exp(1j*np.radians(self.rf_spoil))
+
+        r = 0
+        g = step**(nk + 1)*q/(1 - step**(nk + 1)*ez)
+        for k in range(nk,-1,-1):
+            # F-(k) = m(k)*(v F+(k+1) + u F-(k+1)) and F+(k+1) = p(k+1)*(u F+(k) +
+            # v F-(k)), the frame phases m(k)*p(k+1) = step^(2k+1)
+            c = step**(2*k + 1)*((v0 - g) + (u0 + g)*r)
+            g = step**k*q/(1 - step**k*ez)
+            u,v = u0 + g,v0 - g
+            if k:
+                r = c*u/(1 - c*v)
+
+        # k = 0: F-(0) = c*(u F+(0) + v F-(0) + i e2 sa (1 - e1)/(1 - e1 ca)) with
+        # F+(0) = conj(F-(0)), solved as A x + B conj(x) = C
+        z0 = (1 - e1)/(1 - ez)
+        fa,fb,fc = 1 - c*v,-c*u,c*1j*e2*sa*z0
+        fm = (np.conj(fa)*fc - fb*np.conj(fc))/(np.abs(fa)**2 - np.abs(fb)**2)
+        fp = np.conj(fm)
+        z = 0.5j*e1*sa/(1 - ez)*(fp - fm) + z0
+        return ((c2*fp + s2*fm + 1j*sa*z)*np.exp(-te/t2))[None]
+
+    def _states(self,t1,t2,flip,tr,te,nk):
+        e1 = np.exp(-tr/t1)
+        e2 = np.exp(-tr/t2)
+        e2te = np.exp(-te/t2)
+        echo = np.empty((self.ntr if self.history else 1,len(t1)),dtype=np.complex128)
+
+        # F+ and F- states along the first axis, Z states never move. The rotated
+        # states are formed in work buffers and written back shifted.
+        fp = np.zeros((nk + 1,len(t1)),dtype=np.complex128)
+        fm = np.zeros((nk + 1,len(t1)),dtype=np.complex128)
+        z = np.zeros((nk + 1,len(t1)),dtype=np.complex128)
+        z[0] = 1
+        w0,w1,w2 = np.empty_like(fp),np.empty_like(fp),np.empty_like(fp)
+
+        a = np.radians(flip)
+        c2,s2,sa,ca = np.cos(a/2)**2,np.sin(a/2)**2,np.sin(a),np.cos(a)
+        for n,ph in enumerate(np.radians(self.phase)):
+            k = min(n,nk) + 1 # states that can be populated
+            kk = min(k,nk)
+            p,m,zz = fp[:k],fm[:k],z[:k]
+
+            # instantaneous rotation by flip about an axis at phase ph:
+            #   F+ = c2 F+ + e^2 s2 F- + i e sa Z
+            #   F- = conj(e^2) s2 F+ + c2 F- - i conj(e) sa Z
+            #   Z = i/2 sa (conj(e) F+ - e F-) + ca Z
+            e = np.exp(1j*ph)
+            pm,pz = e*e*s2,1j*e*sa
+            echo_n = (c2*p[0] + pm*m[0] + pz*zz[0])*e2te*np.conj(e)
+            if self.history:
+                echo[n] = echo_n
+            elif n == self.ntr - 1:
+                echo[0] = echo_n
+
+            # relaxation over the TR is folded into the coefficients, then the states
+            # dephase by one: F+ moves up, F- down and F+(0) = conj(F-(0))
+            self._mix(w0[:kk],p[:kk],m[:kk],zz[:kk],e2*c2,e2*pm,e2*pz,w1[:kk])
+            self._mix(w2[:k-1],p[1:k],m[1:k],zz[1:k],e2*np.conj(pm),e2*c2,
+                e2*np.conj(pz),w1[:k-1])
+            np.multiply(zz,e1*ca,out=zz)
+            zz += np.multiply(p,-0.5*e1*np.conj(pz),out=w1[:k])
+            zz += np.multiply(m,-0.5*e1*pz,out=w1[:k])
+            zz[0] += 1 - e1
+            fp[1:kk+1] = w0[:kk]
+            fm[:k-1] = w2[:k-1]
+            fm[k-1] = 0
+            fp[0] = np.conj(fm[0])
+        return echo
+
+    @staticmethod
+    def _mix(out,p,m,z,cp,cm,cz,work):
+        # out = cp*p + cm*m + cz*z without temporaries
+        np.multiply(p,cp,out=out)
+        out += np.multiply(m,cm,out=work)
+        out += np.multiply(z,cz,out=work)
@@ -0,0 +1,105 @@
+import numpy as np
+
+# 3D modified Shepp-Logan phantom: density, semi-axes and center (fractions of half
+# the field of view) and Euler angles phi, theta, psi (degrees)
+SHEPP_LOGAN = (
+    ( 1.0,0.6900,0.920,0.810, 0.00, 0.0000, 0.00,  0,0, 0),
+    (-0.8,0.6624,0.874,0.780, 0.00,-0.0184, 0.00,  0,0, 0),
+    (-0.2,0.1100,0.310,0.220, 0.22, 0.0000, 0.00,-18,0,10),
+    (-0.2,0.1600,0.410,0.280,-0.22, 0.0000, 0.00, 18,0,10),
+    ( 0.1,0.2100,0.250,0.410, 0.00, 0.3500,-0.15,  0,0, 0),
+    ( 0.1,0.0460,0.046,0.050, 0.00, 0.1000, 0.25,  0,0, 0),
+    ( 0.1,0.0460,0.046,0.050, 0.00,-0.1000, 0.25,  0,0, 0),
+    ( 0.1,0.0460,0.023,0.050,-0.08,-0.6050, 0.00,  0,0, 0),
+    ( 0.1,0.0230,0.023,0.020, 0.00,-0.6060, 0.00,  0,0, 0),
+    ( 0.1,0.0230,0.046,0.020, 0.06,-0.6050, 0.00,  0,0, 0),
+)
+
+def _rotation(phi,theta,psi):
+    # rotation into the frame of the ellipsoid axes
+    cf,sf = np.cos(np.radians(phi)),np.sin(np.radians(phi))
+    ct,st = np.cos(np.radians(theta)),np.sin(np.radians(theta))
+    cp,sp = np.cos(np.radians(psi)),np.sin(np.radians(psi))
+    return np.array([
+        [cp*cf - ct*sf*sp, cp*sf + ct*cf*sp, sp*st],
+        [-sp*cf - ct*sf*cp, -sp*sf + ct*cf*cp, cp*st],
+        [st*sf, -st*cf, ct]])
+
+def _ball(q):
+    # Fourier transform of the unit ball at radial frequency q (1/unit), the series
+    # near q = 0 avoids the cancellation of the closed form
+    x = 2*np.pi*q
+    xc = np.maximum(x,1e-3)
+    out = np.asarray(4*np.pi*(np.sin(x) - x*np.cos(x))/(xc*xc*xc))
+    small = x < 0.1
+    xs = x[small]
+    out[small] = 4*np.pi/3*(1 - xs**2/10 + xs**4/280)
+    return out
+
+class Phantom:
+    '''
+    Phantom(ellipsoids) is a numerical phantom made of uniform ellipsoids, which has an
+    analytic Fourier transform
+
+        Phantom(ellipsoids)
+        ellipsoids = one row per ellipsoid: density, semi-axes along R, P, S (mm),
+            center (mm) and Euler angles phi, theta, psi (degrees)
+
+    Densities of overlapping ellipsoids add up.
+    '''
+    def __init__(self,ellipsoids):
+        self.ellipsoids = np.atleast_2d(np.asarray(ellipsoids,dtype=np.float64))
+
+    @staticmethod
+    def shepp_logan(fov):
+        '''
+        shepp_logan(fov) returns the 3D modified Shepp-Logan phantom filling the field
+        of view fov (mm, along R, P, S)
+        '''
+        e = np.array(SHEPP_LOGAN)
+        half = np.asarray(fov,dtype=np.float64)/2
+        e[:,1:4] *= half
+        e[:,4:7] *= half
+        return Phantom(e)
+
+    def kspace(self,kx,ky,kz,dtype=np.complex128):
+        '''
+        kspace(kx,ky,kz,dtype) returns the Fourier transform of the phantom at k-space
+        positions kx, ky, kz (1/mm, broadcast against each other), density*mm^3. With
+        dtype complex64 the transform is evaluated in single precision, about three times
+        faster with errors around 1e-5 of the peak.
+        '''
+        real = np.float32 if dtype == np.complex64 else np.float64
+        kx,ky,kz = (np.asarray(k,dtype=real) for k in (kx,ky,kz))
+        k = (kx,ky,kz)
+        out = 0
+        for rho,a,b,c,x0,y0,z0,phi,theta,psi in self.ellipsoids:
+            # |diag(a,b,c) R k|^2 as a quadratic form, so that the k axes only broadcast
+            # for the terms that couple them
+            rot = np.diag((a,b,c)) @ _rotation(phi,theta,psi)
+            m = (rot.T @ rot).astype(real)
+            q2 = m[0,0]*kx**2 + m[1,1]*ky**2 + m[2,2]*kz**2
+            for i,j in ((0,1),(0,2),(1,2)):
+                if m[i,j] != 0:
+                    q2 = q2 + 2*m[i,j]*k[i]*k[j]
+
+            # the shift of the center is separable, it is formed on the axes
+            shift = (rho*a*b*c*np.exp(-2j*np.pi*kx*x0)*np.exp(-2j*np.pi*ky*y0)*
+                np.exp(-2j*np.pi*kz*z0)).astype(dtype)
+            out = out + _ball(np.sqrt(q2))*shift
+        return out
+
+    def image(self,x,y,z):
+        '''
+        image(x,y,z) returns the density of the phantom at positions x, y, z (mm,
+        broadcast against each other)
+        '''
+        x,y,z = (np.asarray(r,dtype=np.float64) for r in (x,y,z))
+        out = 0
+        for rho,a,b,c,x0,y0,z0,phi,theta,psi in self.ellipsoids:
+            rot = _rotation(phi,theta,psi)
+            r = (x - x0,y - y0,z - z0)
+            inside = sum(((rot[i,0]*r[0] + rot[i,1]*r[1] + rot[i,2]*r[2])/ax)**2
+                for i,ax in enumerate((a,b,c))) <= 1
+            out = out + rho*inside
+        return out
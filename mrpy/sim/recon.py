@@ -0,0 +1,215 @@
+import time
+import numpy as np
+from mrpy.limits import gamma
+from mrpy.seq import List
+from mrpy.grad import ArbGradient
+from mrpy.sim.phantom import Phantom
+
+def _areas(grad):
+    # area of a trapezoid for every value of its amplitude List, ms*mT/m
+    gmax = grad.gmax.vals if isinstance(grad.gmax,List) else np.asarray(grad.gmax)
+    return (2*grad.dur - grad.trise - grad.tfall)/2*np.atleast_1d(gmax)
+
+def cartesian_axes(enc):
+    '''
+    cartesian_axes(enc) returns the k-space positions (1/mm) of the readout samples,
+    the pe1 steps and the pe2 steps of a built CartesianEncoding, in acquisition order.
+    With a joint sampling pattern ky and kz pair up, one entry per phase encoding step.
+    '''
+    moment = np.zeros(3) if enc.moment is None else enc.moment
+
+    # the readout gradient and the acquisition share the anchor of the readout
+    g,t,axis = enc.ro_grad.get_wave()
+    ts = enc.ro_grad.anchor - enc.acq.anchor + np.arange(enc.acq.npoints)*enc.acq.dwell
+    ro = ArbGradient(g=g,t=t,axis=axis).area_until(ts)
+
+    scale = gamma/2/np.pi/1000
+    kx = scale*(_areas(enc.pp_grad)[0] - moment[0] + ro)
+    ky = scale*(_areas(enc.pe1_grad) - moment[1])
+    kz = scale*(_areas(enc.pe2_grad) - moment[2])
+    return kx,ky,kz
+
+class CartesianRecon:
+    '''
+    CartesianRecon(seq) samples a numerical phantom at the k-space positions of a
+    sequence with Cartesian encoding and reconstructs it with FFTs
+
+        CartesianRecon(seq,phantom,noise,chunk)
+        seq = a built sequence with a CartesianEncoding enc, e.g. a GradientEcho
+        phantom = a Phantom (default: the Shepp-Logan phantom filling the fov)
+        noise = standard deviation of complex gaussian noise added to every sample,
+            relative to the largest sample
+        chunk = number of samples simulated and transformed at a time
+
+        Calculated parameters:
+        kx, ky, kz = k-space positions of the readout samples, pe1 and pe2 steps, 1/mm
+        kspace = simulated data in acquisition order, (npe2,npe1,npoints) complex64, or
+            (npe,npoints) when the encoding pairs the pe1 and pe2 steps (enc.joint)
+        grid_error = largest distance of a sample from the Cartesian grid, grid steps
+        image = reconstructed image, (S,P,R) complex64, density
+        reference = image of the phantom sampled exactly on the Cartesian grid
+        nrmse = root mean square error of image over the norm of reference
+        psnr = peak of reference over the root mean square error, dB
+        timings = wall clock time of each step, s
+
+    The phantom is simulated a few pe2 planes at a time and the 3D FFT is done as 2D
+    FFTs over those planes followed by 1D FFTs along pe2 over groups of pe1 lines, so
+    that beyond the data itself memory use is bounded by chunk. Every sample is
+    placed at the nearest point of the reconstruction grid, unsampled points are zero
+    (partial Fourier and undersampled data are reconstructed zero filled).
+    A 2D acquisition (one pe2 step) sees the phantom averaged over the thickness fov[2].
+    '''
+    phantom = None
+    noise = 0.0
+    chunk = 2**22
+    seed = 0
+
+    def __init__(self,seq,**kwargs):
+        self.seq = seq
+        for key,value in kwargs.items():
+            setattr(self,key,value)
+        self.calc()
+
+    def calc(self):
+        enc = self.seq.enc
+        self.fov = np.asarray(enc.fov,dtype=np.float64)
+        self.matrix = tuple(int(n) for n in enc.enc_matrix)
+        if self.phantom is None:
+            self.phantom = Phantom.shepp_logan(self.fov)
+        self.timings = {}
+
+        self.kx,self.ky,self.kz = cartesian_axes(enc)
+        nx,ny,nz = self.matrix
+        self.joint = enc.joint
+        if self.joint:
+            shape = (len(self.ky),len(self.kx))
+        else:
+            shape = (len(self.kz),len(self.ky),len(self.kx))
+
+        # nearest grid point of every sample along each axis
+        pos = [k*f for k,f in zip((self.kx,self.ky,self.kz),self.fov)]
+        self.grid_error = max(float(np.max(np.abs(p - np.rint(p)))) for p in pos)
+        index = [np.rint(p).astype(np.int64) + n//2 for p,n in zip(pos,self.matrix)]
+        for i,n in zip(index,self.matrix):
+            if np.any(i < 0) or np.any(i >= n):
+                raise Exception('k-space samples fall outside of the reconstruction grid')
+        self.index = index
+
+        t0 = time.perf_counter()
+        self.kspace = self._sample(self.kx,self.ky,self.kz,shape)
+        if self.noise:
+            rng = np.random.default_rng(self.seed)
+            sigma = self.noise*np.max(np.abs(self.kspace))
+            planes = self._planes(shape)
+            for z0 in range(0,shape[0],planes):
+                noise = rng.standard_normal((2,) + self.kspace[z0:z0+planes].shape)
+                self.kspace[z0:z0+planes] += (sigma*(noise[0] + 1j*noise[1])).astype(np.complex64)
+        self.timings['kspace'] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        self.image = self._fft(self._grid(self.kspace))
+        self.timings['recon'] = time.perf_counter() - t0
+
+        # the reference is the noise free image when the samples are on the grid
+        t0 = time.perf_counter()
+        if self.grid_error < 1e-6 and not self.noise and np.all(enc.mask):
+            self.reference = self.image
+        else:
+            k = [(np.arange(n) - n//2)/f for n,f in zip(self.matrix,self.fov)]
+            self.reference = self._fft(self._sample(k[0],k[1],k[2],(nz,ny,nx)))
+        self.timings['reference'] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        err = ref = 0.0
+        planes = self._planes(self.image.shape)
+        for z0 in range(0,nz,planes):
+            r = self.reference[z0:z0+planes]
+            err += np.sum(np.abs(self.image[z0:z0+planes] - r)**2,dtype=np.float64)
+            ref += np.sum(np.abs(r)**2,dtype=np.float64)
+        rmse = np.sqrt(err/self.image.size)
+        self.nrmse = float(np.sqrt(err/ref)) if ref else 0.0
+        peak = float(np.max(np.abs(self.reference)))
+        self.psnr = float(20*np.log10(peak/rmse)) if rmse else np.inf
+        self.timings['metrics'] = time.perf_counter() - t0
+
+    def _planes(self,shape):
+        # pe2 planes (or pe lines of joint data) per chunk
+        return max(1,self.chunk//int(np.prod(shape[1:])))
+
+    def _sample(self,kx,ky,kz,shape):
+        # phantom k-space, a few pe2 planes at a time
+        out = np.empty(shape,dtype=np.complex64)
+        planes = self._planes(shape)
+        for z0 in range(0,shape[0],planes):
+            if len(shape) == 2:
+                s = slice(z0,z0+planes)
+                out[s] = self.phantom.kspace(kx[None,:],ky[s,None],kz[s,None],np.complex64)
+            else:
+                out[z0:z0+planes] = self.phantom.kspace(kx[None,None,:],ky[None,:,None],
+                    kz[z0:z0+planes,None,None],np.complex64)
+        return out
+
+    def _grid(self,data):
+        # zero filled Cartesian grid, k = 0 at index n//2
+        nx,ny,nz = self.matrix
+        ix,iy,iz = self.index
+        grid = np.zeros((nz,ny,nx),dtype=np.complex64)
+        planes = self._planes(data.shape)
+        for z0 in range(0,data.shape[0],planes):
+            if data.ndim == 2:
+                s = slice(z0,z0+planes)
+                grid[iz[s,None],iy[s,None],ix[None,:]] = data[s]
+            else:
+                grid[np.ix_(iz[z0:z0+planes],iy,ix)] = data[z0:z0+planes]
+        return grid
+
+    def _fft(self,grid):
+        # centered inverse 3D FFT in place, scaled from k-space integral to density
+        nz,ny,nx = grid.shape
+        scale = np.float32(nx*ny*nz/np.prod(self.fov))
+        planes = self._planes(grid.shape)
+        for z0 in range(0,nz,planes):
+            g = grid[z0:z0+planes]
+            g[...] = np.fft.fftshift(np.fft.ifft2(np.fft.ifftshift(g,axes=(1,2))),
+                axes=(1,2))*scale
+        if nz > 1:
+            lines = max(1,self.chunk//(nz*nx))
+            for y0 in range(0,ny,lines):
+                g = grid[:,y0:y0+lines]
+                g[...] = np.fft.fftshift(np.fft.ifft(np.fft.ifftshift(g,axes=0),axis=0),
+                    axes=0)
+        return grid
+
+def benchmark(sizes=((64,64,1),(128,128,64),(256,256,256)),fov=(240.,240.,240.),
+        **kwargs):
+    '''
+    benchmark(sizes,fov,**kwargs) simulates and reconstructs a GradientEcho at every
+    matrix size and returns one dict per size with the timings, throughput and image
+    quality, kwargs are passed to CartesianRecon
+    '''
+    from mrpy.gradientecho import GradientEcho
+
+    results = []
+    for size in sizes:
+        size = np.array(size)
+        fov_size = np.array(fov,dtype=np.float64)
+        if size[2] == 1:
+            fov_size[2] = 5.0 # slice thickness of 2D acquisitions
+        t0 = time.perf_counter()
+        seq = GradientEcho(te=0,tr=0,ss={'thk': fov_size[2],'flip': 20,'pulse_dur': 2.0},
+            enc={'fov': fov_size,'img_matrix': size,'dwell': 0.010})
+        t_build = time.perf_counter() - t0
+
+        recon = CartesianRecon(seq,**kwargs)
+        timings = dict(recon.timings,build=t_build)
+        nsamples = recon.kspace.size
+        results.append({
+            'matrix': tuple(int(n) for n in size),
+            'samples': int(nsamples),
+            'timings': timings,
+            'samples_per_s': nsamples/(timings['kspace'] + timings['recon']),
+            'grid_error': recon.grid_error,
+            'nrmse': recon.nrmse,
+            'psnr': recon.psnr,
+        })
+    return results
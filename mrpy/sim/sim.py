@@ -1,49 +1,256 @@
 import numpy as np
-import matplotlib.pyplot as pp
+from mrpy.seq import Machine
+from mrpy.timeline import Timeline, piecewise
+from mrpy.sim.bloch import BlochSim
 
 class Waveform:
-    def __init__(self):
-        self.t = []
-        self.wave = []
-
+    '''
+    Waveform stores the samples of one channel in contiguous, growable buffers
+    
+        Waveform(capacity)
+        capacity = number of samples to preallocate
+        
+        t = sample times, ms (view into the buffer)
+        wave = sample amplitudes (view into the buffer)
+        off = event offsets, the samples of event i are t[off[i]:off[i+1]]
+    '''
+    def __init__(self,capacity=1024):
+        self._t = np.empty(capacity)
+        self._wave = np.empty(capacity)
+        self._off = np.zeros(max(capacity//4,1)+1,dtype=np.int64)
+        self.nsamples = 0
+        self.nevents = 0
+    
+    @property
+    def t(self):
+        return self._t[:self.nsamples]
+    
+    @property
+    def wave(self):
+        return self._wave[:self.nsamples]
+    
+    @property
+    def off(self):
+        return self._off[:self.nevents+1]
+    
+    @property
+    def start(self):
+        return self._t[self._off[:self.nevents]]
+    
+    def __len__(self):
+        return self.nevents
+    
+    def reserve(self,nsamples,nevents):
+        '''
+        reserve(nsamples,nevents) grows the buffers to hold at least this many more
+        samples and events, doubling the capacity to keep appends amortized O(1)
+        '''
+        need = self.nsamples + nsamples
+        if need > len(self._t):
+            cap = max(need,2*len(self._t))
+            self._t = np.resize(self._t,cap)
+            self._wave = np.resize(self._wave,cap)
+        
+        need = self.nevents + nevents + 1
+        if need > len(self._off):
+            self._off = np.resize(self._off,max(need,2*len(self._off)))
+    
     def append(self,t,wave):
-        self.t.append(t)
-        self.wave.append(wave)
-
+        self.extend(t,wave,(0,len(t)))
+    
+    def extend(self,t,wave,off):
+        '''
+        extend(t,wave,off) appends many events at once, the samples of event i are
+        t[off[i]:off[i+1]]
+        '''
+        off = np.asarray(off,dtype=np.int64)
+        n = off[-1]-off[0]
+        nev = len(off)-1
+        self.reserve(n,nev)
+        
+        self._t[self.nsamples:self.nsamples+n] = t[off[0]:off[-1]]
+        self._wave[self.nsamples:self.nsamples+n] = wave[off[0]:off[-1]]
+        self._off[self.nevents+1:self.nevents+nev+1] = off[1:] - off[0] + self.nsamples
+        self.nsamples += n
+        self.nevents += nev
+    
+    def events(self):
+        '''
+        events() iterates over (t,wave) views of the individual events
+        '''
+        off = self.off
+        for i in range(self.nevents):
+            yield self.t[off[i]:off[i+1]],self.wave[off[i]:off[i+1]]
+    
+    def _gather(self,order):
+        # sample indices of the events in order
+        npts = np.diff(self.off)[order]
+        off = np.concatenate(([0],np.cumsum(npts)))
+        ev = np.repeat(np.arange(len(order)),npts)
+        src = np.arange(off[-1]) - off[ev] + self.off[order][ev]
+        return src,off
+    
     def sort(self):
-        arg = np.argsort(self.t)
-        self.t = self.t[arg]
-        self.wave = self.wave[arg]
+        '''
+        sort() orders the events by their start time
+        '''
+        order = np.argsort(self.start,kind='stable')
+        src,off = self._gather(order)
+        
+        self._t[:self.nsamples] = self.t[src]
+        self._wave[:self.nsamples] = self.wave[src]
+        self._off[:self.nevents+1] = off
+    
+    def merge(self,other):
+        '''
+        merge(other) returns a new, time sorted Waveform with the events of both
+        '''
+        out = Waveform(self.nsamples+other.nsamples)
+        out.extend(self.t,self.wave,self.off)
+        out.extend(other.t,other.wave,other.off)
+        out.sort()
+        return out
+    
+    def integrals(self):
+        '''
+        integrals() returns the area and the integral of the squared waveform, treating
+        every event as piecewise linear. Events that overlap in time add up before they
+        are squared.
+        '''
+        if self.nsamples == 0:
+            return 0.0,0.0
+        
+        # the summed waveform is linear between the sample times of all events
+        breaks = np.unique(self.t)
+        mid,slope = piecewise(breaks,self.t,self.wave,self.off)
+        dt = np.diff(breaks)
+        area = np.sum(mid*dt)
+        sq = np.sum(dt*(mid*mid + slope*slope*dt*dt/12))
+        return area,sq
+    
+    def polyline(self):
+        '''
+        polyline() returns t,wave with all events joined into one line, with a NaN
+        between consecutive events so that they are drawn unconnected
+        '''
+        return self._polyline(self.t,self.wave,self._event_index())
+    
+    def _event_index(self):
+        # event of every sample
+        return np.repeat(np.arange(self.nevents),np.diff(self.off))
+    
+    @staticmethod
+    def _polyline(t,wave,ev):
+        # samples of events ev joined into one line, with a NaN where the event changes
+        new = np.r_[False,ev[1:] != ev[:-1]]
+        pos = np.arange(len(t)) + np.cumsum(new)
+        n = len(t) + int(np.sum(new))
+        tout = np.full(n,np.nan)
+        wout = np.full(n,np.nan)
+        tout[pos] = t
+        wout[pos] = wave
+        return tout,wout
+    
+    def decimate(self,npix,trange=None):
+        '''
+        decimate(npix,trange) reduces the waveform to a min/max envelope of npix time
+        bins, which looks the same as the full waveform when drawn npix pixels wide
+        
+            npix = number of time bins, usually the plot width in pixels
+            trange = (start,stop) time window to keep, ms
+            
+            returns t,wave as a single line, with NaN between events
+        
+        Bins without samples inside an event (on a long flat top) are bridged, only the
+        stretches between events are left as gaps.
+        '''
+        t,wave,ev = self.t,self.wave,self._event_index()
+        if trange is not None:
+            keep = (t >= trange[0]) & (t <= trange[1])
+            t,wave,ev = t[keep],wave[keep],ev[keep]
+        
+        # too few samples to bin, or all at one time, where bins have no width
+        if len(t) <= 2*npix or np.max(t) <= np.min(t):
+            return self._polyline(t,wave,ev)
+        
+        order = np.argsort(t,kind='stable')
+        t,wave,ev = t[order],wave[order],ev[order]
+        t0,t1 = t[0],t[-1]
+        width = (t1-t0)/npix
+        
+        bins = np.minimum(((t-t0)/width).astype(np.int64),npix-1)
+        first = np.flatnonzero(np.r_[True,bins[1:] != bins[:-1]])
+        lo = np.minimum.reduceat(wave,first)
+        hi = np.maximum.reduceat(wave,first)
+        b = bins[first]
+        tc = t0 + (b+0.5)*width
+        
+        # the links between bin k and k+1 that lie inside the span of some event
+        nev = int(ev.max()) + 1
+        fb = np.full(nev,npix)
+        lb = np.full(nev,-1)
+        np.minimum.at(fb,ev,bins)
+        np.maximum.at(lb,ev,bins)
+        seen = lb >= 0
+        depth = np.zeros(npix+1,dtype=np.int64)
+        np.add.at(depth,fb[seen],1)
+        np.add.at(depth,lb[seen],-1)
+        inside = np.cumsum(depth)[:npix-1] > 0
+        outside = np.r_[0,np.cumsum(~inside)]
+        
+        # every bin gives a vertical segment, a NaN follows it when the next bin is
+        # reached through a link outside of every event
+        gap = np.r_[outside[b[1:]] - outside[b[:-1]] > 0,False]
+        tout = np.stack((tc,tc,np.full(tc.shape,np.nan)),axis=1)
+        wout = np.stack((lo,hi,np.full(tc.shape,np.nan)),axis=1)
+        keep = np.stack((np.ones(gap.shape,bool),np.ones(gap.shape,bool),gap),axis=1)
+        return tout[keep],wout[keep]
     
     def plot(self):
-        pp.plot(self.t,self.wave)
+        import matplotlib.pyplot as pp
+        pp.plot(*self.polyline())
         pp.show()
 
-class SequenceSim:
+class SequenceSim(Machine):
     def __init__(self):
         self.grad = {}
     
-    def run(self,seq):
+    def run(self,seq,render=True):
+        '''
+        run(seq,render) compiles the sequence and collects its waveforms, the plot is
+        only drawn if render is True
+        '''
         self.grad['R'] = Waveform()
         self.grad['P'] = Waveform()
         self.grad['S'] = Waveform()
         self.rf = Waveform()
         self.acq = Waveform()
         
-        seq.run(self)
+        self.timeline = Timeline.compile(seq)
+        self.load(self.timeline)
+        
+        if render:
+            self.plot()
+    
+    def plot(self,npix=None,trange=None,block=True):
+        '''
+        plot(npix,trange,block) draws every channel as a single decimated line
+        
+            npix = number of time bins per line, defaults to the figure width in pixels
+            trange = (start,stop) time window to draw, ms
+            block = block until the plot window is closed
+        '''
+        import matplotlib.pyplot as pp
         
         f,(ax1,ax2) = pp.subplots(2,sharex=True)
+        if npix is None:
+            npix = int(f.get_figwidth()*f.dpi)
         
-        for t,wave in zip(self.rf.t,self.rf.wave):
-            ax1.plot(t,wave,'b')
-        for t,wave in zip(self.acq.t,self.acq.wave):
-            ax1.plot(t,wave,'rx')
-        for t,wave in zip(self.grad['R'].t,self.grad['R'].wave):
-            hr = ax2.plot(t,wave,'b')
-        for t,wave in zip(self.grad['P'].t,self.grad['P'].wave):
-            hp = ax2.plot(t,wave,'r')
-        for t,wave in zip(self.grad['S'].t,self.grad['S'].wave):
-            hs = ax2.plot(t,wave,'g')
+        ax1.plot(*self.rf.decimate(npix,trange),'b')
+        ax1.plot(*self.acq.decimate(npix,trange),'rx')
+        hr = ax2.plot(*self.grad['R'].decimate(npix,trange),'b')
+        hp = ax2.plot(*self.grad['P'].decimate(npix,trange),'r')
+        hs = ax2.plot(*self.grad['S'].decimate(npix,trange),'g')
         
         ax1.set_ylabel('B1 (kHz)')
         ax1.legend(['RF pulse','ACQ'])
@@ -53,8 +260,37 @@ class SequenceSim:
         ax2.set_ylabel('gradient strength (mT/m)')
         ax2.legend([hr[0],hp[0],hs[0]],['Read','Phase','Slice'])
         ax2.grid(True)
-        pp.show(block=True)
-
+        pp.show(block=block)
+        return f
+    
+    def load(self,timeline):
+        '''
+        load(timeline) fills the waveforms from a compiled Timeline
+        '''
+        for axis in ('R','P','S'):
+            self._load(timeline,axis,self.grad[axis])
+        self._load(timeline,'rf',self.rf)
+        self._load(timeline,'acq',self.acq)
+    
+    def _load(self,timeline,channel,waveform):
+        t,wave,phase,off = timeline.expand(channel)
+        waveform.extend(t,wave,off)
+    
+    def simulate(self,spins,seq=None,workers=1):
+        '''
+        simulate(spins,seq,workers) runs a Bloch simulation of seq, or of the sequence
+        compiled by the last run(), and returns the ADC samples of every acquisition.
+        workers > 1 splits the spins over that many processes.
+        '''
+        if seq is not None:
+            self.timeline = Timeline.compile(seq)
+        return BlochSim(self.timeline).run(spins,workers)
+    
+    def totals(self):
+        '''
+        totals() returns the area (ms*mT/m) and squared integral of each gradient axis
+        '''
+        return {axis: self.grad[axis].integrals() for axis in ('R','P','S')}
     
     def addGradient(self,gradobj):
         g,t,axis = gradobj.get_wave()
@@ -5,26 +5,58 @@ import mrpy.limits as limits
 from mrpy.seq import Composite
 
 class SliceSelection(Composite):
-    req_parms= ('thk','flip','pulse_dur','pulse')
+    req_parms= ('thk','flip','pulse_dur','pulse','slew')
     pulse = 'gauss'
+    slew = None # mT/m/ms, ramp at this slew rate instead of the fixed rise time
     anchor = None
     time = 0
         
     def build(self,after_dur=0):
         pulse_inst = excitation_pulses[self.pulse](dur=self.pulse_dur,flip=self.flip)
         g = 2 * np.pi * pulse_inst.bw/limits.gamma/self.thk * 1000 # mT/m
-        self.gs = grad.ConstGradient(gmax=g,top_dur=self.pulse_dur,axis='S')
-        self.gs.anchor = self.gs.dur/2
+        if getattr(pulse_inst,'grad_scale',None) is not None:
+            self.gs = self._verse_gradient(pulse_inst,g)
+        elif self.slew is None:
+            self.gs = grad.ConstGradient(gmax=g,top_dur=self.pulse_dur,axis='S')
+            self.gs.anchor = self.gs.dur/2
+        else:
+            ramp = abs(g)/self.slew
+            self.gs = grad.ConstGradient(gmax=g,top_dur=self.pulse_dur,axis='S',
+                trise=ramp,tfall=ramp)
+            self.gs.anchor = self.gs.dur/2
         
         pulse_inst.dfdz = limits.gamma/2/np.pi*g
         
-        if self.anchor is None:
+        # the anchor follows the gradient when rebuilt, unless it was set explicitly
+        if self.anchor is None or getattr(self,'_auto_anchor',False):
             self.anchor = self.gs.anchor
+            self._auto_anchor = True
         
         self.parts = (pulse_inst,self.gs)
-        ssr = grad.TrapGradient.by_area(area=-self.gs.area/2.0,dur=after_dur,axis='S')
+        # area that refocuses the slice, the gradient played after the pulse anchor
+        if isinstance(self.gs,grad.ArbGradient):
+            self.refocus = self.gs.area_until(self.gs.anchor) - self.gs.area
+        else:
+            self.refocus = -self.gs.area/2.0
+        ssr = grad.TrapGradient.by_area(area=self.refocus,dur=after_dur,axis='S',
+            slew=self.slew)
         self.after = Composite(dur=0,parts=(ssr,))
         self.after.time = self.time
         self.before = ()
         self.dur = self.gs.dur
+    
+    def _verse_gradient(self,pulse,g):
+        # the slice gradient follows the speed-up of the reshaped pulse, with ramps
+        gv = g*pulse.grad_scale
+        if np.max(np.abs(gv)) > limits.GradientLimits.grad_lim:
+            raise Exception('VERSE slice gradient exceeds the gradient limit')
+        
+        if self.slew is None:
+            r0 = r1 = limits.GradientLimits.rise_time
+        else:
+            r0,r1 = abs(gv[0])/self.slew,abs(gv[-1])/self.slew
+        t = np.concatenate(([0,r0],r0 + pulse.grad_t,[r0 + pulse.dur,r0 + pulse.dur + r1]))
+        gs = grad.ArbGradient(g=np.concatenate(([0,gv[0]],gv,[gv[-1],0])),t=t,axis='S')
+        gs.anchor = r0 + pulse.anchor
+        return gs
 
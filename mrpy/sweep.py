@@ -0,0 +1,148 @@
+import numpy as np
+from mrpy.gradientecho import GradientEcho
+from mrpy.ss import SliceSelection
+from mrpy.encoding import CartesianEncoding
+
+def _key(val):
+    # hashable form of a parameter value, arrays compare by their contents
+    if isinstance(val,dict):
+        return tuple(sorted((k,_key(v)) for k,v in val.items()))
+    if np.ndim(val) > 0:
+        return tuple(np.ravel(val).tolist())
+    return val
+
+class Sweep:
+    '''
+    Sweep(parms,**grids) evaluates GradientEcho timing over a grid of parameters
+
+        parms = base GradientEcho parameters, as passed to GradientEcho() or returned
+            by serialize()
+        grids = parameter name and the values to sweep it over, e.g. te=..., flip=...
+            Names of SliceSelection ('flip','pulse_dur','pulse') and CartesianEncoding
+            ('fov','img_matrix','dwell','enc_matrix' and the sampling pattern, e.g.
+            'accel') parameters address the 'ss' and 'enc' sub-dictionaries, 'ss.thk'
+            style names are also accepted and needed for 'ss.slew' and 'enc.slew'.
+
+    Only the parts of the sequence a parameter feeds into are rebuilt: the slice
+    selection is built once per distinct (thk, flip, pulse_dur, pulse) and the encoding
+    once per distinct set of its parameters. te, tr, na and nr only enter the
+    arithmetic, which is evaluated for all grid points at once. Built parts are kept
+    between calls to run().
+    '''
+    def __init__(self,parms,**grids):
+        self.parms = parms
+        self.names = []
+        self.values = []
+        for name,vals in grids.items():
+            self.names.append(self._resolve(name))
+            self.values.append(list(vals))
+
+        self.shape = tuple(len(v) for v in self.values)
+        self._ss = {}
+        self._enc = {}
+        self._pairs = {}
+
+    @staticmethod
+    def _resolve(name):
+        if '.' in name:
+            return tuple(name.split('.'))
+        if name in SliceSelection.req_parms and name in CartesianEncoding.req_parms:
+            raise Exception('Ambiguous sweep parameter, use ss.%s or enc.%s' % (name,name))
+        if name in GradientEcho.req_parms:
+            return (name,)
+        if name in SliceSelection.req_parms:
+            return ('ss',name)
+        if name in CartesianEncoding.req_parms:
+            return ('enc',name)
+        raise Exception('Unknown sweep parameter: ' + name)
+
+    def protocol(self,index):
+        '''
+        protocol(index) returns the GradientEcho parameters of one grid point, index is
+        a tuple with one entry per swept parameter or a flat index
+        '''
+        if np.isscalar(index):
+            index = np.unravel_index(index,self.shape)
+
+        parms = dict(self.parms)
+        parms['ss'] = dict(parms['ss'])
+        parms['enc'] = dict(parms['enc'])
+        for name,vals,i in zip(self.names,self.values,index):
+            if len(name) == 1:
+                parms[name[0]] = vals[i]
+            else:
+                parms[name[0]][name[1]] = vals[i]
+        return parms
+
+    def _parts(self,ss_parms,enc_parms):
+        # slice selection and encoding timing, built once per distinct sub-protocol
+        ss_parms = dict(ss_parms,thk=enc_parms['fov'][2])
+        sk,ek = _key(ss_parms),_key(enc_parms)
+        if (sk,ek) in self._pairs:
+            return self._pairs[(sk,ek)]
+
+        if sk not in self._ss:
+            self._ss[sk] = SliceSelection(**ss_parms)
+        ss = self._ss[sk]
+        if enc_parms.get('slew') is None:
+            if ek not in self._enc:
+                self._enc[ek] = CartesianEncoding(**enc_parms)
+            enc = self._enc[ek]
+        else:
+            # the encoding then carries the slice refocusing, see GradientEcho.join
+            enc = CartesianEncoding(**enc_parms)
+            GradientEcho.join(ss,enc)
+            enc.build()
+
+        min_te = GradientEcho.calc_min_te(ss,enc)
+        tr_extra = GradientEcho.calc_min_tr(ss,enc,0.0)
+        nlines = enc.npe
+        self._pairs[(sk,ek)] = (min_te,tr_extra,nlines)
+        return self._pairs[(sk,ek)]
+
+    def run(self):
+        '''
+        run() evaluates every grid point, returns a dict of arrays shaped like the grid
+
+            min_te, min_tr = shortest possible TE and TR, ms
+            te, tr = TE and TR the sequence would be built with, ms
+            scan_time = total duration, ms
+            feasible = True where the requested te and tr are both achievable
+        '''
+        npts = int(np.prod(self.shape,dtype=np.int64))
+        idx = np.indices(self.shape).reshape(len(self.shape),npts)
+
+        # distinct combinations of the parameters that change the slice selection or
+        # encoding, everything else is plain arithmetic
+        sub = [n for n,name in enumerate(self.names) if len(name) > 1]
+        if sub:
+            combos,inverse = np.unique(idx[sub].T,axis=0,return_inverse=True)
+            inverse = inverse.ravel()
+        else:
+            combos,inverse = np.zeros((1,0),dtype=np.int64),np.zeros(npts,dtype=np.int64)
+
+        timing = np.empty((len(combos),3))
+        for c,combo in enumerate(combos):
+            index = np.zeros(len(self.shape),dtype=np.int64)
+            index[sub] = combo
+            parms = self.protocol(tuple(index))
+            timing[c] = self._parts(parms['ss'],parms['enc'])
+        min_te,tr_extra,nlines = timing[inverse].T
+
+        def top(name):
+            default = self.parms.get(name,getattr(GradientEcho,name,None))
+            for n,key in enumerate(self.names):
+                if key == (name,):
+                    return np.asarray(self.values[n],dtype=np.float64)[idx[n]]
+            return np.full(npts,default,dtype=np.float64)
+
+        te_req,tr_req = top('te'),top('tr')
+        te = np.maximum(min_te,te_req)
+        min_tr = tr_extra + te
+        tr = np.maximum(min_tr,tr_req)
+        scan_time = tr*nlines*top('na')*top('nr')
+        feasible = (te_req >= min_te) & (tr_req >= min_tr)
+
+        res = {'min_te': min_te,'min_tr': min_tr,'te': te,'tr': tr,
+            'scan_time': scan_time,'feasible': feasible}
+        return {k: v.reshape(self.shape) for k,v in res.items()}
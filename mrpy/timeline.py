@@ -0,0 +1,371 @@
+import numpy as np
+from mrpy.seq import List, Machine
+
+channels = ('R','P','S','rf','acq')
+
+def segments(t,wave,off):
+    '''
+    segments(t,wave,off) returns the start and end time and value (ta,tb,wa,wb) of the
+    linear pieces inside each event of expanded samples, see Timeline.expand
+    '''
+    seg = np.ones(max(len(t)-1,0),dtype=bool)
+    seg[off[1:-1]-1] = False
+    return t[:-1][seg],t[1:][seg],wave[:-1][seg],wave[1:][seg]
+
+def piecewise(breaks,t,wave,off):
+    '''
+    piecewise(breaks,t,wave,off) sums piecewise linear events over the intervals between
+    sorted breaks, every sample time of the events must be one of the breaks
+
+        returns the value at the midpoint and the slope of every interval
+    '''
+    ta,tb,wa,wb = segments(t,wave,off)
+    i0 = np.searchsorted(breaks,ta)
+    i1 = np.searchsorted(breaks,tb)
+    n = i1 - i0
+
+    # one entry per (segment, interval) pair covered by the segment, zero length
+    # segments (steps) cover no interval
+    seg = np.repeat(np.arange(len(ta)),n)
+    k = np.arange(n.sum()) - np.repeat(np.cumsum(n)-n,n) + i0[seg]
+    mid = (breaks[k] + breaks[k+1])/2
+    slope = (wb[seg]-wa[seg])/(tb[seg]-ta[seg])
+    val = wa[seg] + slope*(mid-ta[seg])
+
+    nint = max(len(breaks)-1,0)
+    def total(x):
+        if np.iscomplexobj(x):
+            return np.bincount(k,x.real,nint) + 1j*np.bincount(k,x.imag,nint)
+        return np.bincount(k,x,nint)
+    return total(val),total(slope)
+
+class EventTable:
+    '''
+    EventTable holds the events of one channel of a compiled sequence as columns
+
+        EventTable(start,shape,amp,leaf,rep)
+        start = start time of each event, ms
+        shape = index of the event waveform in the Timeline shape library
+        amp = amplitude the shape is scaled by
+        leaf = index of the Leaf in Timeline.leaves that produced the event
+        rep = flat repetition index of the event inside the loops around its leaf
+    '''
+    columns = ('start','shape','amp','leaf','rep')
+    dtypes = (np.float64,np.int32,np.float64,np.int32,np.int64)
+
+    def __init__(self,**cols):
+        for name,dtype in zip(self.columns,self.dtypes):
+            setattr(self,name,np.asarray(cols.get(name,()),dtype=dtype))
+
+    def __len__(self):
+        return len(self.start)
+
+    def take(self,idx):
+        return EventTable(**{name: getattr(self,name)[idx] for name in self.columns})
+
+    def sort(self):
+        # stable so that simultaneous events keep their traversal order
+        return self.take(np.argsort(self.start,kind='stable'))
+
+    @staticmethod
+    def concat(tables):
+        tables = list(tables)
+        if not tables:
+            return EventTable()
+        return EventTable(**{name: np.concatenate([getattr(tab,name) for tab in tables])
+            for name in EventTable.columns})
+
+class Leaf:
+    '''
+    Leaf records one waveform object (gradient, RF pulse or acquisition) of a compiled
+    sequence together with the loops it is repeated by
+
+        obj = the sequence object
+        channel = 'R', 'P', 'S', 'rf' or 'acq'
+        offset = start time of the first repetition, ms
+        loops = enclosing Loop objects, outermost first
+        strides = time step between repetitions of each loop, ms
+        nreps = number of repetitions of each loop
+        shape_ids, amps = shape and amplitude per repetition, broadcastable to nreps
+    '''
+    def __init__(self,obj,channel,offset,loops,strides,shape_ids,amps):
+        self.obj = obj
+        self.channel = channel
+        self.offset = offset
+        self.loops = tuple(loops)
+        self.strides = np.array(strides,dtype=np.float64)
+        self.nreps = tuple(loop.nreps for loop in self.loops)
+        self.nevents = int(np.prod(self.nreps,dtype=np.int64))
+        self.shape_ids = shape_ids
+        self.amps = amps
+
+        # loops built by Loop.build repeat their object back to back, so every stride is
+        # the inner stride times the inner repetitions and start time is linear in rep
+        inner = self.strides[1:]*np.array(self.nreps[1:])
+        self.linear = bool(self.loops) and np.allclose(self.strides[:-1],inner)
+
+    def __len__(self):
+        return self.nevents
+
+    def start(self,rep):
+        '''
+        start(rep) returns the start time of flat repetitions rep, ms
+        '''
+        if not self.loops:
+            return self.offset + 0*np.asarray(rep,dtype=np.float64)
+        idx = np.unravel_index(rep,self.nreps)
+        return self.offset + sum(i*s for i,s in zip(idx,self.strides))
+
+    def search(self,t,lo=0):
+        '''
+        search(t,lo) returns the first repetition from lo on that starts at or after t.
+        Loops repeat their object back to back, so start times increase with rep.
+        '''
+        hi = len(self)
+        if self.linear and self.strides[-1] > 0:
+            guess = int(np.ceil((t - self.offset)/self.strides[-1]))
+            lo = min(max(lo,guess-1),hi)
+            hi = min(max(lo,guess+1),hi)
+        while lo < hi:
+            mid = (lo+hi)//2
+            if self.start(mid) < t:
+                lo = mid+1
+            else:
+                hi = mid
+        return lo
+
+    def events(self,index,start=0,stop=None):
+        '''
+        events(index,start,stop) returns the EventTable for flat repetitions start:stop,
+        index is the position of this leaf in Timeline.leaves
+        '''
+        if stop is None:
+            stop = len(self)
+        rep = np.arange(start,stop,dtype=np.int64)
+
+        idx = np.unravel_index(rep,self.nreps) if self.loops else ()
+        t = self.start(rep)
+
+        # the shape table has length one along every loop it does not depend on
+        dep = tuple(i if n > 1 else 0 for i,n in zip(idx,self.shape_ids.shape))
+
+        return EventTable(start=t,shape=np.broadcast_to(self.shape_ids[dep],rep.shape),
+            amp=np.broadcast_to(self.amps[dep],rep.shape),leaf=np.full(rep.shape,index),
+            rep=rep)
+
+class Timeline:
+    '''
+    Timeline is the compiled, time ordered event table of a sequence. It is normally
+    created with Timeline.compile(seq).
+
+        leaves = list of Leaf objects, one per waveform object in the sequence tree
+        shapes = deduplicated waveform library, list of (t,wave,phase) arrays
+        loop_end = end of the last repetition of any loop, ms
+
+    The shape library is also stored flattened: shape_t, shape_wave and shape_phase
+    hold all shapes back to back, shape i spans shape_off[i]:shape_off[i+1]
+    '''
+    def __init__(self,shapes,leaves,loop_end=0.0):
+        self.shapes = shapes
+        self.leaves = leaves
+        self.loop_end = loop_end
+        self._events = {}
+
+        n = [len(t) for t,wave,phase in shapes]
+        self.shape_off = np.concatenate(([0],np.cumsum(n))).astype(np.int64)
+        self.shape_t = np.concatenate([s[0] for s in shapes] or [[]]).astype(np.float64)
+        self.shape_wave = np.concatenate([s[1] for s in shapes] or [[]]).astype(np.float64)
+        self.shape_phase = np.concatenate([s[2] for s in shapes] or [[]]).astype(np.float64)
+
+    @staticmethod
+    def compile(seq):
+        return Compiler().run(seq)
+
+    def events(self,channel):
+        '''
+        events(channel) returns the time sorted EventTable of a channel
+        '''
+        if channel not in self._events:
+            tabs = [leaf.events(n) for n,leaf in enumerate(self.leaves)
+                if leaf.channel == channel]
+            self._events[channel] = EventTable.concat(tabs).sort()
+        return self._events[channel]
+
+    def stream(self,dur=None):
+        '''
+        stream(dur) yields the events block by block in time order, without building the
+        full event table
+
+            dur = block duration in ms, by default the period of the innermost loop
+                (one TR for GradientEcho)
+
+            yields t0,t1,events, where events maps every channel to the EventTable of
+            the events starting in [t0,t1)
+        '''
+        if dur is None:
+            dur = self.period()
+
+        t_start = min([leaf.offset + np.sum(np.minimum(0,(np.array(leaf.nreps)-1)*leaf.strides))
+            for leaf in self.leaves] or [0.0])
+        end = self.dur
+        cursor = [0]*len(self.leaves)
+
+        n = 0
+        while True:
+            t0,t1 = t_start + n*dur,t_start + (n+1)*dur
+            if t0 >= end and n > 0:
+                break
+            tabs = {ch: [] for ch in channels}
+            for i,leaf in enumerate(self.leaves):
+                stop = leaf.search(t1,cursor[i])
+                if stop > cursor[i]:
+                    tabs[leaf.channel].append(leaf.events(i,cursor[i],stop))
+                    cursor[i] = stop
+            yield t0,t1,{ch: EventTable.concat(tab).sort() for ch,tab in tabs.items()}
+            n += 1
+
+    def period(self):
+        '''
+        period() returns the period of the innermost loop (one TR for GradientEcho), or
+        the whole duration of a sequence without loops, ms
+        '''
+        strides = [leaf.strides[-1] for leaf in self.leaves if leaf.loops]
+        return min([s for s in strides if s > 0] or [self.dur or 1.0])
+
+    def shape_dur(self):
+        return self.shape_t[self.shape_off[1:]-1]
+
+    def expand(self,channel,events=None):
+        '''
+        expand(channel) renders the events of a channel into absolute waveform samples
+
+            returns t,wave,phase,off where the samples of event i are off[i]:off[i+1]
+        '''
+        if events is None:
+            events = self.events(channel)
+
+        npts = self.shape_off[events.shape+1] - self.shape_off[events.shape]
+        off = np.concatenate(([0],np.cumsum(npts))).astype(np.int64)
+
+        # index of the event each sample belongs to, and of the sample in the library
+        ev = np.repeat(np.arange(len(events)),npts)
+        src = np.arange(off[-1]) - off[ev] + self.shape_off[events.shape][ev]
+
+        t = events.start[ev] + self.shape_t[src]
+        wave = events.amp[ev]*self.shape_wave[src]
+        phase = self.shape_phase[src]
+        return t,wave,phase,off
+
+    @property
+    def dur(self):
+        '''
+        end of the last event or loop, computed from the leaves without expanding them
+        '''
+        shape_dur = self.shape_dur()
+        end = [self.loop_end]
+        for leaf in self.leaves:
+            last = np.sum(np.maximum(0,(np.array(leaf.nreps)-1)*leaf.strides))
+            end.append(leaf.offset + last + np.max(shape_dur[leaf.shape_ids]))
+        return max(end)
+
+class Compiler(Machine):
+    '''
+    Compiler walks a sequence tree once, like a machine passed to Sequence.run, and
+    records every waveform object as a Leaf instead of rendering it for every
+    repetition of the loops around it. Waveforms are only evaluated once per distinct
+    index of the loops whose Lists they reference.
+
+        Compiler().run(seq) returns a Timeline
+    '''
+    def __init__(self):
+        self.shapes = []
+        self.leaves = []
+        self._shape_ids = {}
+        self._loops = []
+        self._strides = []
+        self._offset = 0
+        self._loop_end = 0.0
+
+    def run(self,seq):
+        self._offset = seq.time
+        seq.run(self)
+        return Timeline(self.shapes,self.leaves,self._loop_end)
+
+    def addComposite(self,compobj):
+        t0 = self._offset
+        for part in compobj.parts:
+            self._offset = part.time + t0 - part.anchor + compobj.anchor
+            part.run(self)
+        self._offset = t0
+
+    def addLoop(self,loopobj):
+        # the last repetition of the enclosing loops ends this loop the latest
+        last = sum(max(0,(loop.nreps-1)*stride)
+            for loop,stride in zip(self._loops,self._strides))
+        self._loop_end = max(self._loop_end,self._offset + last + loopobj.dur)
+
+        self._loops.append(loopobj)
+        self._strides.append(loopobj.obj.dur)
+        loopobj.obj.run(self)
+        self._loops.pop()
+        self._strides.pop()
+
+    def addGradient(self,gradobj):
+        def wave():
+            g,t,axis = gradobj.get_wave()
+            return axis,t,g,np.zeros(np.shape(t))
+        self._record(gradobj,wave)
+
+    def addRF(self,rfobj):
+        def wave():
+            b1,phase,t = rfobj.get_wave()
+            return 'rf',t,b1,phase
+        self._record(rfobj,wave)
+
+    def addAcquisition(self,acqobj):
+        def wave():
+            g,t = acqobj.get_wave()
+            return 'acq',t,g,np.zeros(np.shape(t))
+        self._record(acqobj,wave)
+
+    def _record(self,obj,wave):
+        loops = list(self._loops)
+
+        # loops whose Lists are referenced by the object
+        lists = [v for v in vars(obj).values() if isinstance(v,List)]
+        deps = [any(l.loop is loop for l in lists) for loop in loops]
+        dep_shape = tuple(loop.nreps if d else 1 for loop,d in zip(loops,deps))
+
+        shape_ids = np.empty(dep_shape,dtype=np.int32)
+        amps = np.empty(dep_shape,dtype=np.float64)
+        channel = None
+        for idx in np.ndindex(*dep_shape):
+            for loop,d,i in zip(loops,deps,idx):
+                if d:
+                    loop.idx = i
+            channel,t,w,phase = wave()
+            shape_ids[idx],amps[idx] = self._add_shape(t,w,phase)
+
+        for loop,d in zip(loops,deps):
+            if d:
+                loop.idx = None
+
+        self.leaves.append(Leaf(obj,channel,self._offset,loops,self._strides,
+            shape_ids,amps))
+
+    def _add_shape(self,t,wave,phase):
+        t = np.asarray(t,dtype=np.float64)
+        wave = np.asarray(wave,dtype=np.float64)
+        phase = np.asarray(phase,dtype=np.float64)
+
+        # store shapes with unit peak so that scaled copies share one entry
+        amp = wave.flat[np.argmax(np.abs(wave))] if wave.size else 0.0
+        if amp == 0:
+            amp = 1.0
+        wave = wave/amp + 0.0 # + 0.0 turns -0.0 into 0.0
+
+        key = (t.tobytes(),wave.tobytes(),phase.tobytes())
+        if key not in self._shape_ids:
+            self._shape_ids[key] = len(self.shapes)
+            self.shapes.append((t,wave,phase))
+        return self._shape_ids[key],amp
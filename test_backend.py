@@ -0,0 +1,43 @@
+import asyncio
+import numpy as np
+from mrpy import export
+from mrpy.gradientecho import GradientEcho
+from mrpy.timeline import Timeline
+from mrpy.backend import StreamBackend, MockScanner
+
+def stream(tl,**kwargs):
+    # plays tl on a mock scanner that consumes the blocks as they arrive
+    async def run():
+        scanner = MockScanner(speed=np.inf,keep=True)
+        address = await scanner.start()
+        try:
+            backend = StreamBackend(address=address,**kwargs)
+            result = await backend.play_async(tl)
+        finally:
+            await scanner.stop()
+        return backend,scanner,result
+    return asyncio.run(run())
+
+def test_round_trip(protocol):
+    tl = Timeline.compile(GradientEcho(**protocol((32,16,2),ss={'pulse': 'sinc'})))
+    ref = np.concatenate([export.pack(events) for t0,t1,events in tl.stream()])
+    for batch in (1,5,64):
+        backend,scanner,result = stream(tl,batch=batch)
+        assert np.array_equal(scanner.events,ref)
+        assert result['blocks'] == backend.blocks == 32
+        assert result['events'] == len(ref)
+
+def test_batch_not_dividing_blocks(protocol):
+    seq = GradientEcho(**protocol((32,16,16),ss={'pulse': 'sinc'}))
+    tl = Timeline.compile(seq)
+    for batch in (5,7):
+        backend,scanner,result = stream(tl,batch=batch)
+        assert result['blocks'] == 256
+        assert np.isclose(result['dur'],256*seq.tr)
+
+def test_block_duration(protocol):
+    tl = Timeline.compile(GradientEcho(**protocol((32,16,1),ss={'pulse': 'sinc'})))
+    backend,scanner,result = stream(tl,block=1.0,batch=3)
+    assert result['blocks'] == int(np.ceil(tl.dur))
+    assert result['events'] == len(tl.events('R')) + len(tl.events('P')) + \
+        len(tl.events('S')) + len(tl.events('rf')) + len(tl.events('acq'))
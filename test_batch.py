@@ -0,0 +1,34 @@
+import numpy as np
+from mrpy.batch import Batch
+from mrpy.gradientecho import GradientEcho
+from mrpy.sim import Isochromats
+
+def test_cache(tmp_path,protocol):
+    protocols = [GradientEcho(**protocol((16,8,1),ss={'flip': flip})).serialize()
+        for flip in (10,20,10)]
+    b = Batch(str(tmp_path),workers=1)
+    first = b.run(protocols)
+    assert (b.hits,b.misses) == (1,2)
+    second = b.run(protocols)
+    assert (b.hits,b.misses) == (4,2)
+    for r1,r2 in zip(first,second):
+        assert sorted(r1) == sorted(r2)
+        assert all(np.array_equal(r1[k],r2[k]) for k in r1)
+
+def test_spins_in_key(tmp_path,protocol):
+    fov = np.array([30.,30.,2.0])
+    protocols = [GradientEcho(**protocol((16,8,1),enc={'fov': fov})).serialize()]
+    b = Batch(str(tmp_path),task='simulate',workers=1,spins=Isochromats([[0,0,0]]))
+    path = b.path(protocols[0])
+    assert path == b.path(protocols[0])
+    b.spins = Isochromats([[0,0,1]])
+    moved = b.path(protocols[0])
+    assert moved != path
+    first = b.run(protocols)[0]['signal']
+    assert first.shape == (8,16)
+    # spins changed in place are not served from the cache of the old ones
+    b.spins.pos[0] = [0,0,-1]
+    assert b.path(protocols[0]) not in (path,moved)
+    second = b.run(protocols)[0]['signal']
+    assert (b.hits,b.misses) == (0,2)
+    assert not np.array_equal(first,second)
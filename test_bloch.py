@@ -0,0 +1,47 @@
+import numpy as np
+from mrpy.seq import Composite, Acquisition
+from mrpy.rf import ex
+from mrpy.sim import BlochSim, Isochromats
+from mrpy.timeline import Timeline
+
+def fid(flip,npoints=8,dwell=0.05):
+    # a block pulse followed by one acquisition
+    pulse = ex.Block(dur=0.1,flip=flip,tbw=1.0)
+    acq = Acquisition(npoints=npoints,dwell=dwell)
+    acq.time = 0.5
+    return Composite(dur=2.0,parts=[pulse,acq])
+
+def test_90_degree_pulse():
+    sig = BlochSim(fid(90)).run(Isochromats([[0,0,0]]))
+    assert sig.shape == (1,8)
+    assert np.allclose(np.abs(sig),1.0)
+    sig = BlochSim(fid(180)).run(Isochromats([[0,0,0]]))
+    assert np.allclose(sig,0.0,atol=1e-12)
+
+def test_free_precession():
+    tl = Timeline.compile(fid(90))
+    t = tl.expand('acq')[0]
+    center = tl.events('rf').start[0] + 0.05
+    df,t2 = 0.2,20.0
+    sig = BlochSim(tl).run(Isochromats([[0,0,0]],df=df,t2=t2))[0]
+    # off resonance during the pulse tilts it slightly off 90 degrees
+    assert np.allclose(np.abs(sig),np.exp(-(t - center)/t2),rtol=1e-5)
+    turn = np.angle(sig[1:]/sig[:-1])
+    assert np.allclose(np.abs(turn),2*np.pi*df*0.05)
+
+def test_spoiled_steady_state_is_ernst(spoiled):
+    # T2 much shorter than TR leaves no transverse magnetization for the next pulse
+    t1,t2,tr,te,flip = 800.0,1.0,10.0,0.5,30.0
+    sig = BlochSim(spoiled(flip,tr,te,150)).run(Isochromats([[0,0,0]],t1=t1,t2=t2))
+    a = np.radians(flip)
+    e1 = np.exp(-tr/t1)
+    ernst = np.sin(a)*(1 - e1)/(1 - e1*np.cos(a))*np.exp(-te/t2)
+    assert np.isclose(np.abs(sig[-1,0]),ernst,rtol=1e-3)
+
+def test_chunks_sum(spoiled):
+    tl = Timeline.compile(spoiled(30,10.0,3.0,20,10.0))
+    spins = Isochromats.line(40,100,'S',relax=((800,60),))
+    whole = BlochSim(tl).run(spins)
+    parts = BlochSim(tl,chunk=7).run(spins)
+    assert np.allclose(whole,parts,rtol=1e-12,atol=1e-12)
+    assert np.allclose(whole,BlochSim(tl).run(spins[:50]) + BlochSim(tl).run(spins[50:]))
@@ -0,0 +1,71 @@
+import time
+import numpy as np
+from mrpy.limits import gamma
+from mrpy.sim import BlochSim, Isochromats
+from mrpy.sim.epg import EPG
+
+def ernst(t1,t2,flip,tr,te):
+    a = np.deg2rad(flip)
+    e1 = np.exp(-tr/t1)
+    return np.sin(a)*(1 - e1)/(1 - e1*np.cos(a))*np.exp(-te/t2)
+
+def test_ideal_spoiling_is_ernst():
+    t1 = np.array([300.,800.,1500.])
+    flip = np.array([5.,15.,30.,60.])[:,None]
+    e = EPG(None,t1=t1,t2=60.,flip=flip,tr=8.,te=3.,ntr=4000,rf_spoil=None)
+    assert e.signal.shape == (4,3)
+    assert np.allclose(np.abs(e.signal),ernst(t1,60.,flip,8.,3.),rtol=1e-6)
+
+def test_chunks_identical():
+    kwargs = dict(t1=np.linspace(300,1500,7),t2=np.linspace(30,120,7),flip=25,tr=10,
+        te=4,ntr=200)
+    # chunks keep states up to their own order, which only differ below tol
+    assert np.allclose(EPG(None,memory=1,**kwargs).echo,EPG(None,**kwargs).echo,atol=1e-5)
+
+def test_rf_spoiling_near_ernst():
+    # 117 degree RF spoiling approaches ideal spoiling within a few percent
+    e = EPG(None,t1=1000.,t2=50.,flip=30,tr=10,te=4,ntr=500)
+    assert np.isclose(np.abs(e.signal),ernst(1000.,50.,30,10,4),rtol=0.05)
+    assert e.echo.shape == (500,)
+    assert np.array_equal(e.phase[:4],[0,117,351,702])
+
+def test_matches_bloch(spoiled):
+    # isochromats over one cycle of the spoiler dephasing, without RF spoiling
+    area = 10.0
+    n = 400
+    pos = np.zeros((n,3))
+    pos[:,2] = (np.arange(n) + 0.5)/n*2*np.pi*1000/(gamma*area)
+    sig = BlochSim(spoiled(30,10.0,3.0,100,area)).run(Isochromats(pos,t1=800,t2=60))/n
+    e = EPG(None,t1=800,t2=60,flip=30,tr=10.0,te=3.0,ntr=100,rf_spoil=0)
+    assert np.allclose(sig[:,0],e.echo,atol=1e-5)
+
+def test_needs_parameters():
+    try:
+        EPG(None,flip=30,tr=10)
+    except Exception:
+        return
+    assert False
+
+def test_steady_state():
+    t1 = np.array([300.,800.,1500.,1500.])
+    t2 = np.array([20.,60.,150.,40.])
+    flip = np.array([0.,5.,15.,30.,90.])[:,None]
+    for rf_spoil in (117.,50.,0.):
+        kwargs = dict(t1=t1,t2=t2,flip=flip,tr=8.,te=3.,rf_spoil=rf_spoil)
+        steady = EPG(None,steady=True,**kwargs)
+        assert steady.echo is None and steady.signal.shape == (5,4)
+        assert np.allclose(steady.signal,EPG(None,ntr=6000,history=False,**kwargs).signal,
+            atol=1e-9)
+    ideal = EPG(None,t1=t1,t2=t2,flip=flip,tr=8.,te=3.,rf_spoil=None,steady=True)
+    assert np.allclose(np.abs(ideal.signal),ernst(t1,t2,flip,8.,3.))
+
+def test_steady_state_million():
+    t1,t2,flip = np.meshgrid(np.linspace(300,2000,100),np.linspace(20,150,100),
+        np.linspace(2,40,100),indexing='ij')
+    t = time.perf_counter()
+    e = EPG(None,t1=t1,t2=t2,flip=flip,tr=8.,te=3.,steady=True)
+    assert time.perf_counter() - t < 30
+    assert e.signal.shape == (100,100,100)
+    i = (17,42,63)
+    one = EPG(None,t1=t1[i],t2=t2[i],flip=flip[i],tr=8.,te=3.,steady=True)
+    assert np.isclose(e.signal[i],one.signal)
@@ -0,0 +1,49 @@
+import numpy as np
+from mrpy.grad import design, TrapGradient
+from mrpy.seq import List
+
+gmax,slew = 40.0,200.0
+areas = np.array([0.5,8.0,20.0,-20.0]) # gmax**2/slew = 8 is the corner of the triangles
+
+def test_time_optimal():
+    dur = design.min_dur(areas,gmax,slew)
+    g,r = design.trapezoid(areas,dur,slew)
+    assert np.allclose(g*(dur - r),areas)
+    assert np.all(np.abs(g) <= gmax*(1 + 1e-9))
+    assert np.allclose(np.abs(g)/r,slew)
+    # either at the amplitude limit or a triangle
+    assert np.all(np.isclose(np.abs(g),gmax) | np.isclose(r,dur/2))
+    assert np.allclose(dur[:2],2*np.sqrt(np.abs(areas[:2])/slew))
+
+    # anything shorter breaks a limit
+    g,r = design.trapezoid(areas,dur*0.99,slew)
+    assert np.all((np.abs(g)/r > slew*1.001) | (np.abs(g) > gmax*1.001))
+
+def test_lists():
+    assert np.allclose(design.min_dur(List(areas),gmax,slew),
+        design.min_dur(areas,gmax,slew))
+
+def test_min_dur():
+    grad = TrapGradient.by_area(20.0,dur=0.1,slew=800.0)
+    assert np.isclose(grad.dur,design.min_dur(20.0,slew=800.0))
+    grad = TrapGradient.by_area(20.0,dur=3.0,slew=800.0)
+    grad.load()
+    grad.build()
+    assert grad.dur == 3.0
+    assert np.isclose(grad.area,20.0)
+
+def test_joint():
+    axes = [areas[:2],List(areas[2:]),5.0]
+    # the slowest axis sets the duration
+    dur = design.joint_min_dur(axes,gmax,slew)
+    assert np.isclose(dur,np.max(design.min_dur(areas,gmax,slew)))
+
+    # with a vector limit the axes play one trapezoid, scaled by their areas, whose
+    # combined amplitude reaches the limit and whose largest axis ramps at the slew limit
+    dur = design.joint_min_dur(axes,gmax,slew,vmax=gmax)
+    peaks = np.array([8.0,20.0,5.0])
+    total = np.sqrt(np.sum(peaks**2))
+    g,r = design.trapezoid(total,dur,slew*total/20.0)
+    assert np.isclose(g,gmax)
+    assert np.isclose(g*20.0/total/r,slew)
+    assert dur > np.max(design.min_dur(peaks,gmax,slew))
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from mrpy.gradientecho import GradientEcho
+from mrpy.analysis import HardwareCheck
+from mrpy.limits import GradientLimits
+from mrpy.seq import Composite
+from mrpy.grad import TrapGradient
+
+def test_within_limits(protocol):
+    check = HardwareCheck(GradientEcho(**protocol((16,8,4))))
+    assert check.ok and check.violations == []
+    check.check()
+
+def test_violations():
+    # R over the amplitude limit, P ramps too fast, S on for the whole sequence
+    read = TrapGradient(gmax=760.0,dur=2.0,axis='R',trise=0.3,tfall=0.3)
+    read.time = 1.0
+    phase = TrapGradient(gmax=400.0,dur=1.0,axis='P',trise=0.05,tfall=0.05)
+    phase.time = 4.0
+    slice = TrapGradient(gmax=300.0,dur=40.0,axis='S')
+    check = HardwareCheck(Composite(dur=40.0,parts=[read,phase,slice]))
+
+    assert np.isclose(check.grad_peak['R'],760.0)
+    assert np.isclose(check.times['R'],1.3)
+    assert np.isclose(check.slew_peak['P'],8000.0)
+    assert np.isclose(check.times['slew P'],4.0)
+    rms = 300.0*np.sqrt((40.0 - 0.4 + 0.4/3)/40.0)
+    assert np.isclose(check.grad_rms['S'],rms)
+    assert np.isclose(check.vector_peak,np.sqrt(760.0**2 + 300.0**2))
+
+    found = sorted(v.split(' exceeds')[0].rsplit(' ',2)[0] for v in check.violations)
+    assert found == ['P slew rate','R amplitude','S RMS amplitude','Vector amplitude']
+    assert not check.ok
+    with pytest.raises(Exception):
+        check.check()
+
+def test_resonance_band():
+    # a gradient switched every 1 ms has its fundamental at 0.5 kHz
+    parts = []
+    for n in range(10):
+        g = TrapGradient(gmax=100.0 if n % 2 else -100.0,dur=1.0,axis='R')
+        g.time = n*1.0
+        parts.append(g)
+    seq = Composite(dur=10.0,parts=parts)
+    assert HardwareCheck(seq,bands=[(0.4,0.6,500.0)]).ok
+    check = HardwareCheck(seq,bands=[(0.4,0.6,10.0)])
+    assert len(check.violations) == 1
+    assert check.violations[0].startswith('R harmonics in 0.4-0.6 kHz')
+    assert check.band_peak[0]['R'] > 100.0
@@ -0,0 +1,32 @@
+import numpy as np
+from mrpy.gradientecho import GradientEcho
+from mrpy.analysis.kspace import Trajectory
+
+def test_readout(protocol):
+    fov = np.array([240.,200.,120.])
+    seq = GradientEcho(**protocol((16,8,4),enc={'fov': fov}))
+    traj = Trajectory(seq)
+    assert traj.k.shape == (32,16,3)
+    # samples 1/fov apart along the readout, k = 0 at sample N/2 at TE
+    assert np.allclose(np.diff(traj.k[...,0],axis=1),1/fov[0])
+    assert np.allclose(traj.k[:,8,0],0,atol=1e-12)
+    assert np.allclose(traj.t[:,8] - traj.tex,seq.te)
+    assert np.allclose(traj.k[:,0,0],-8/fov[0])
+
+def test_phase_encoding(protocol):
+    seq = GradientEcho(**protocol((16,8,4)))
+    traj = Trajectory(seq)
+    # every pe1 and pe2 step once, equally spaced through the center of k-space
+    for axis,n in ((1,8),(2,4)):
+        k = np.unique(np.round(traj.k[:,8,axis],9))
+        assert len(k) == n and 0 in k
+        assert np.allclose(np.diff(k),k[1] - k[0])
+    # constant during the readout
+    assert np.allclose(traj.k[...,1:],traj.k[:,:1,1:])
+
+def test_balanced_axes(protocol):
+    traj = Trajectory(GradientEcho(**protocol((16,8,4))))
+    # readout and phase encoding are rewound at the end of every TR
+    assert len(traj.residual) == 32
+    assert np.allclose(traj.residual[:,:2],0,atol=1e-9)
+    assert np.allclose(traj.m0[:,8,0],0,atol=1e-12)
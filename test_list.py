@@ -0,0 +1,44 @@
+import numpy as np
+from mrpy.seq import List, Loop
+
+def test_arithmetic():
+    a = np.linspace(-1,1,5)
+    b = np.arange(5.)
+    c = (List(a)*2.0 + List(b))/3.0 - abs(List(b))*List(a)
+    assert np.allclose(c.vals,(a*2.0 + b)/3.0 - abs(b)*a)
+    assert np.allclose((-List(a)).vals,-a)
+    assert np.allclose((1 - List(a)).vals,1 - a)
+    assert np.allclose((2/(List(b) + 1)).vals,2/(b + 1))
+
+def test_integer_division():
+    c = (List(np.arange(4)) + 1)/2
+    assert c.vals.dtype == np.float64
+    assert np.array_equal(c.vals,[0.5,1.0,1.5,2.0])
+    assert np.array_equal((List(np.arange(4))/List(np.arange(1,5))).vals,
+        np.arange(4)/np.arange(1,5))
+
+def test_result_dtype():
+    assert (List(np.arange(3,dtype=np.float32))*2.0 + 1).vals.dtype == np.float32
+    assert (abs(List(np.arange(3)*1j) + 1)*2).vals.dtype == np.float64
+    assert (List(np.arange(3))*2 + 1).vals.dtype == np.arange(3).dtype
+
+def test_values_are_copied():
+    a = np.arange(4.)
+    b = np.ones(4)
+    la = List(a)
+    lc = la*2.0
+    ld = la*b
+    a[0] = 99
+    b[:] = 5
+    assert np.array_equal(la.vals,[0,1,2,3])
+    assert np.array_equal(lc.vals,[0,2,4,6])
+    assert np.array_equal(ld.vals,[0,1,2,3])
+
+def test_value():
+    l = List(np.array([1.0,-3.0,2.0]))
+    assert l.value() == -3.0
+    loop = Loop()
+    loop.add_list(l)
+    loop.idx = 2
+    assert l.value() == 2.0
+    assert (l*2.0).value() == -6.0
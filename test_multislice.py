@@ -0,0 +1,41 @@
+import numpy as np
+from mrpy.multislice import MultiSliceGradientEcho
+from mrpy.analysis import ScanAnalysis
+from mrpy.sim import BlochSim, Isochromats
+
+def multislice(protocol,**parms):
+    # 5 mm slices 1 mm apart
+    return MultiSliceGradientEcho(**protocol((16,8,1),nslices=3,gap=1.0,ss={'thk': 5.0},
+        enc={'fov': np.array([240.,240.,5.])},**parms))
+
+def test_positions(protocol):
+    seq = multislice(protocol,tr=100.0)
+    assert seq.npack == 3 and seq.nconcat == 1
+    assert np.allclose(seq.positions,[[-6.0,6.0,0.0]])
+    assert np.allclose(seq.freqs,seq.pulse.dfdz*seq.positions/1000)
+    seq = multislice(protocol,tr=100.0,order='sequential')
+    assert np.allclose(seq.positions,[[-6.0,0.0,6.0]])
+
+    # at the minimum TR of one slice, every slice is its own concatenation
+    seq = multislice(protocol,tr=0)
+    assert seq.npack == 1 and seq.nconcat == 3
+    assert np.allclose(seq.positions,[[-6.0],[0.0],[6.0]])
+
+def test_scan_time(protocol):
+    seq = multislice(protocol,tr=100.0,na=2)
+    assert np.isclose(seq.scan_time,100.0*8*2)
+    assert np.isclose(ScanAnalysis(seq).scan_time,seq.scan_time)
+    seq = multislice(protocol,tr=0)
+    assert np.isclose(seq.scan_time,3*8*seq.slot)
+    assert np.isclose(ScanAnalysis(seq).scan_time,seq.scan_time)
+
+def test_slices_excited(protocol):
+    # a spin at the center of each slice is first excited in the slot of its slice,
+    # the pulses of the other slots leave it alone
+    seq = multislice(protocol,tr=100.0)
+    sim = BlochSim(seq)
+    flip = np.sin(np.radians(seq.ss.flip))
+    for slot,z in enumerate(seq.positions[0]):
+        sig = np.max(np.abs(sim.run(Isochromats([[0,0,z]]))[:3]),axis=1)
+        assert np.all(sig[:slot] < 0.01)
+        assert np.allclose(sig[slot:],flip,rtol=0.02)
@@ -0,0 +1,34 @@
+import numpy as np
+from mrpy.analysis import PNS
+from mrpy.limits import PNSLimits
+from mrpy.seq import Composite
+from mrpy.grad import TrapGradient
+
+def trapezoid(axis,gmax=200.0,rise=0.2):
+    g = TrapGradient(gmax=gmax,dur=4.0,axis=axis,trise=rise,tfall=rise)
+    g.time = 1.0
+    return g
+
+def safe(slew,rise,n=0):
+    # SAFE stimulation at the end of a ramp from rest at constant slew
+    m = PNSLimits
+    y = slew*(1 - np.exp(-rise/np.array(m.tau[n])))
+    return np.sum(np.array(m.weight[n])*y)*m.g_scale[n]/m.threshold[n]
+
+def test_trapezoid():
+    # the ramp up is the peak, the filters have relaxed by the time of the ramp down
+    pns = PNS(Composite(dur=10.0,parts=[trapezoid('R')]))
+    assert np.isclose(pns.axis_peak['R'],safe(1000.0,0.2))
+    assert np.isclose(pns.axis_time['R'],1.2)
+    assert np.isclose(pns.peak,pns.axis_peak['R'])
+    assert np.isclose(pns.time,1.2)
+    assert pns.axis_peak['P'] == 0.0 and pns.axis_peak['S'] == 0.0
+
+def test_axes_combine():
+    pns = PNS(Composite(dur=10.0,parts=[trapezoid('R'),trapezoid('P',100.0,0.1)]))
+    assert np.isclose(pns.axis_peak['P'],safe(1000.0,0.1,1))
+    assert np.isclose(pns.axis_time['P'],1.1)
+    # identical waveforms on two axes add as the root of the sum of squares
+    both = PNS(Composite(dur=10.0,parts=[trapezoid('R'),trapezoid('P')]))
+    assert np.isclose(both.peak,np.sqrt(2)*safe(1000.0,0.2))
+    assert np.isclose(both.time,1.2)
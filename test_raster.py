@@ -0,0 +1,41 @@
+import numpy as np
+from mrpy.gradientecho import GradientEcho
+from mrpy.analysis.scan import ScanAnalysis
+from mrpy.raster import Raster
+from mrpy.timeline import Timeline
+from mrpy.limits import GradientLimits
+
+def test_energy_matches_scan_analysis(protocol):
+    # a longer TR stretches the encoding gradients over many raster points
+    tl = Timeline.compile(GradientEcho(**protocol((16,16,4),tr=20.0,te=4.0)))
+    r = Raster(tl)
+    scan = ScanAnalysis(tl)
+    axes = ('R','P','S')
+    energy = np.sum(r.grad.astype(np.float64)**2,axis=1)*r.dwell
+    assert np.allclose(energy,[scan.grad_energy[ax] for ax in axes],rtol=1e-3)
+    rf = np.sum(np.abs(r.rf.astype(np.complex128))**2)*r.dwell
+    assert np.isclose(rf,scan.rf_energy,rtol=1e-3)
+    assert np.allclose([r.peak[ax] for ax in axes],[scan.grad_peak[ax] for ax in axes],
+        rtol=1e-3)
+
+def test_small_blocks_match(protocol):
+    tl = Timeline.compile(GradientEcho(**protocol((16,8,2))))
+    r = Raster(tl)
+    small = Raster(tl,block=1000)
+    assert np.array_equal(r.grad,small.grad)
+    assert np.array_equal(r.rf,small.rf)
+    assert np.array_equal(r.adc,small.adc)
+    # one readout of 16 points of 0.01 ms per TR
+    assert abs(np.sum(r.adc)*r.dwell - 8*2*16*0.01) <= 8*2*r.dwell
+
+def test_dac_codes(protocol):
+    tl = Timeline.compile(GradientEcho(**protocol((16,8,2))))
+    r = Raster(tl)
+    d = Raster(tl,dac=True)
+    assert d.grad.dtype == np.int16 and d.rf.shape == (r.n,2)
+    assert sum(d.clipped.values()) == 0
+    lsb = GradientLimits.grad_max/np.iinfo(np.int16).max
+    assert np.max(np.abs(d.grad*lsb - r.grad)) <= lsb
+    half = Raster(tl,dac=True,full_scale={'grad': r.peak['R']/2})
+    assert half.clipped['R'] > 0
+    assert np.max(half.grad[0]) == np.iinfo(np.int16).max
@@ -0,0 +1,47 @@
+import numpy as np
+from mrpy.gradientecho import GradientEcho
+from mrpy.analysis.kspace import Trajectory
+from mrpy.sim import CartesianRecon, Phantom
+
+# two ellipses as thick as the slice, so that the image is their projection
+ellipses = np.array([
+    [1.0,60.0,40.0,2.0,30.0,-20.0,0,0,0,0],
+    [0.5,20.0,25.0,2.0,-40.0,50.0,0,0,0,0],
+])
+fov = np.array([240.,200.,5.])
+
+def projection(x,y):
+    # density of the ellipses averaged over the slice thickness fov[2]
+    out = 0
+    for rho,a,b,c,x0,y0 in ellipses[:,:6]:
+        out = out + rho*2*c/fov[2]*np.sqrt(np.maximum(1 - ((x - x0)/a)**2 -
+            ((y - y0)/b)**2,0.0))
+    return out
+
+def test_round_trip(protocol):
+    nx,ny = 64,48
+    seq = GradientEcho(**protocol((nx,ny,1),ss={'thk': fov[2]},enc={'fov': fov}))
+    recon = CartesianRecon(seq,phantom=Phantom(ellipses))
+    assert recon.image.shape == (1,ny,nx)
+    assert recon.grid_error < 1e-9
+
+    # voxel averages of the phantom, the image is at voxel (i - n//2)*fov/n
+    x = (np.arange(nx) - nx//2)*fov[0]/nx
+    y = (np.arange(ny) - ny//2)*fov[1]/ny
+    sub = (np.arange(4) + 0.5)/4 - 0.5
+    truth = np.mean([projection(x[None,:] + i*fov[0]/nx,y[:,None] + j*fov[1]/ny)
+        for i in sub for j in sub],axis=0)
+    err = np.linalg.norm(recon.image[0] - truth)/np.linalg.norm(truth)
+    assert err < 0.02
+    flipped = np.linalg.norm(recon.image[0,::-1] - truth)/np.linalg.norm(truth)
+    assert flipped > 0.5
+
+def test_phase_encoding_steps(protocol):
+    # the pe areas step by 1/fov, with N steps from -N/2 (not (N-1)/N of that)
+    for size in ((16,8,4),(16,15,5)):
+        seq = GradientEcho(**protocol(size,enc={'fov': np.array([240.,200.,120.])}))
+        traj = Trajectory(seq)
+        for axis,n,f in ((1,size[1],200.0),(2,size[2],120.0)):
+            k = np.unique(np.round(traj.k[:,0,axis]*f,9))
+            assert np.allclose(k,np.arange(n) - n//2)
+        assert CartesianRecon(seq).grid_error < 1e-9
@@ -0,0 +1,77 @@
+import numpy as np
+from mrpy.rf.design import slr, sinc
+from mrpy.rf import ex
+from mrpy.rf.profile import SliceProfile
+from mrpy.seq import Composite, Acquisition
+from mrpy.sim import BlochSim, Isochromats
+
+def profile(rf,x):
+    # Mxy and Mz after the hard pulse train, x = off resonance in cycles per sample
+    a = np.ones(len(x),dtype=np.complex128)
+    b = np.zeros(len(x),dtype=np.complex128)
+    z = np.exp(-1j*np.pi*x)
+    for r in rf:
+        phi = np.abs(r)
+        n = np.exp(1j*np.angle(r))
+        c,s = np.cos(phi/2),-1j*n*np.sin(phi/2)
+        a,b = c*a - np.conj(s)*b,s*a + c*b
+        a,b = a*z,b*np.conj(z)
+    return 2*np.conj(a)*b,np.abs(a)**2 - np.abs(b)**2
+
+def test_slr_excitation():
+    n,tbw = 128,8
+    rf = slr(n,tbw,90,'ex')
+    x = np.linspace(-0.5,0.5,2001)
+    mxy,mz = profile(rf,x)
+    w = tbw/n/2
+    assert np.all(np.abs(np.abs(mxy[np.abs(x) < 0.6*w]) - 1) < 0.03)
+    assert np.all(np.abs(mxy[np.abs(x) > 1.6*w]) < 0.03)
+
+def test_slr_refocusing():
+    n,tbw = 128,6
+    rf = slr(n,tbw,180,'se')
+    mxy,mz = profile(rf,np.array([0.0,0.4]))
+    assert mz[0] < -0.97 and mz[1] > 0.97
+
+def test_small_tip_area():
+    for rf in (slr(64,4,10,'st'),sinc(64,4,10)):
+        assert np.isclose(np.sum(rf).real,np.radians(10))
+    assert slr(64,4,30,'ex') is slr(64,4,30,'ex')
+
+def test_tbw_survives_waveform_cache(monkeypatch):
+    from mrpy.cache import waveforms
+    from mrpy.rf import ex, profile
+    calls = []
+    measure = profile.measure_tbw
+    monkeypatch.setattr(profile,'measure_tbw',lambda p: calls.append(p) or measure(p))
+    monkeypatch.setattr(ex,'_tbw',{})
+    a = ex.Gauss(dur=2.0,flip=20)
+    waveforms.clear()
+    b = ex.Gauss(dur=2.0,flip=20)
+    assert len(calls) == 1 and a.tbw == b.tbw and a.bw == b.bw
+
+def test_profile_matches_bloch():
+    pulse = ex.Sinc(dur=2.0,flip=10)
+    acq = Acquisition(npoints=1,dwell=0.001)
+    acq.time = 2.0
+    sim = BlochSim(Composite(dur=3.0,parts=[pulse,acq]))
+    freq = np.linspace(-4,4,81)
+    sig = np.array([sim.run(Isochromats([[0,0,0]],df=f))[0,0] for f in freq])
+
+    bloch = SliceProfile(pulse,freq)
+    assert np.allclose(np.abs(bloch.mxy),np.abs(sig),atol=1e-12)
+    # the small tip profile is close at 10 degrees
+    small = SliceProfile(pulse,freq,'fft')
+    peak = np.max(np.abs(sig))
+    assert np.isclose(peak,np.sin(np.radians(10)))
+    assert np.allclose(np.abs(small.mxy),np.abs(sig),atol=0.02*peak)
+    assert np.allclose(small.mxy,bloch.mxy,atol=0.02*peak)
+
+def test_profile_fwhm():
+    # the bandwidth of a sinc pulse is its number of zero crossings over its duration
+    for tbw,dur in ((4,2.0),(8,4.0),(6,1.0)):
+        pulse = ex.Sinc(dur=dur,flip=10,tbw=tbw)
+        for method in ('bloch','fft'):
+            prof = SliceProfile(pulse,method=method)
+            assert np.isclose(prof.fwhm,tbw/dur,rtol=0.01)
+            assert np.isclose(prof.tbw,tbw,rtol=0.01)
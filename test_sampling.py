@@ -0,0 +1,33 @@
+import numpy as np
+from mrpy.encoding import sampling
+
+def test_axis_mask():
+    k = sampling.lines(8)
+    assert np.array_equal(k,np.arange(-3,5))
+    keep = sampling.axis_mask(8,accel=2,acs=2)
+    assert np.array_equal(k[keep],[-2,-1,0,2,4])
+    keep = sampling.axis_mask(8,partial_fourier=0.75)
+    assert np.array_equal(k[keep],np.arange(-1,5))
+
+def test_poisson_disc():
+    shape = (32,48)
+    mask = sampling.poisson_disc(shape,4,acs=(8,6),seed=1)
+    assert mask.shape == shape
+    assert abs(np.sum(mask) - np.prod(shape)/4) <= 0.01*np.prod(shape)/4
+    k2,k1 = sampling.lines(32),sampling.lines(48)
+    assert np.all(mask[np.ix_((k2 >= -3) & (k2 < 3),(k1 >= -4) & (k1 < 4))])
+    # variable density: the center is sampled more densely than the edge
+    r = sampling.radius(shape)
+    assert np.mean(mask[r < 0.5]) > np.mean(mask[r > 0.5])
+    assert mask is sampling.poisson_disc(shape,4,acs=(8,6),seed=1)
+    assert np.array_equal(mask,sampling._poisson_disc(shape,4,(8,6),1,2.0))
+    assert not np.array_equal(mask,sampling.poisson_disc(shape,4,acs=(8,6),seed=2))
+
+def test_reorder():
+    k1 = np.tile(np.arange(-1,3),3)
+    k2 = np.repeat(np.arange(-1,2),4)
+    assert np.array_equal(k1[sampling.reorder(k1,k2,'centric')][:4],[0,-1,1,2])
+    assert np.array_equal(k2[sampling.reorder(k1,k2,'centric')][::4],[0,-1,1])
+    order = sampling.reorder(k1,k2,'elliptical')
+    assert (k1[order[0]],k2[order[0]]) == (0,0)
+    assert np.array_equal(np.sort(order),np.arange(12))
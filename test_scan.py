@@ -0,0 +1,40 @@
+import numpy as np
+from mrpy.gradientecho import GradientEcho
+from mrpy.analysis.scan import ScanAnalysis
+from mrpy.timeline import Timeline, piecewise
+
+def expanded(tl,channel):
+    # every event expanded, overlapping events added, as linear pieces. Times are
+    # rounded so that events meeting at the same time leave no slivers.
+    t,wave,phase,off = tl.expand(channel)
+    t = np.round(t,9)
+    if channel == 'rf':
+        wave = wave*np.exp(1j*phase)
+    breaks = np.unique(t)
+    mid,slope = piecewise(breaks,t,wave,off)
+    return np.diff(breaks),mid,slope
+
+def test_scan_time(protocol):
+    seq = GradientEcho(**protocol((16,8,4),tr=12.0,na=2,nr=3))
+    scan = ScanAnalysis(seq)
+    assert np.isclose(scan.scan_time,12.0*8*4*2*3)
+    assert np.isclose(scan.scan_time,seq.tr*seq.enc.npe*seq.na*seq.nr)
+
+def test_matches_expanded_sequence(protocol):
+    tl = Timeline.compile(GradientEcho(**protocol((16,8,4),na=2)))
+    scan = ScanAnalysis(tl)
+    for axis in ('R','P','S'):
+        dt,mid,slope = expanded(tl,axis)
+        energy = np.sum(dt*(mid**2 + slope**2*dt**2/12))
+        assert np.isclose(scan.grad_energy[axis],energy,rtol=1e-9)
+        assert np.isclose(scan.grad_rms[axis],np.sqrt(energy/tl.dur))
+        peak = np.max(np.abs(np.r_[mid - slope*dt/2,mid + slope*dt/2]))
+        assert np.isclose(scan.grad_peak[axis],peak)
+        assert np.isclose(scan.slew_peak[axis],np.max(np.abs(slope)))
+
+    dt,mid,slope = expanded(tl,'rf')
+    energy = np.sum(dt*(np.abs(mid)**2 + np.abs(slope)**2*dt**2/12))
+    assert np.isclose(scan.rf_energy,energy,rtol=1e-9)
+    assert np.isclose(scan.rf_rms,np.sqrt(energy/tl.dur))
+    peak = np.max(np.abs(np.r_[mid - slope*dt/2,mid + slope*dt/2]))
+    assert np.isclose(scan.rf_peak,peak)
@@ -0,0 +1,65 @@
+import numpy as np
+from mrpy.gradientecho import GradientEcho
+from mrpy.sim import SequenceSim
+from mrpy.sim.sim import Waveform
+from mrpy.analysis.scan import ScanAnalysis
+
+def test_integrals_overlap():
+    # two overlapping trapezoids add up before they are squared
+    w = Waveform()
+    w.append(np.array([0.,1.,3.,4.]),np.array([0.,2.,2.,0.]))
+    w.append(np.array([2.,2.5,5.5,6.]),np.array([0.,1.,1.,0.]))
+    t = np.linspace(0,6,600001)
+    g = np.interp(t,[0,1,3,4],[0,2,2,0]) + np.interp(t,[2,2.5,5.5,6],[0,1,1,0])
+    area,sq = w.integrals()
+    assert np.isclose(area,6 + 3.5)
+    assert np.isclose(sq,np.trapezoid(g*g,t),rtol=1e-6)
+
+def test_totals_match_scan_analysis(protocol):
+    seq = GradientEcho(**protocol((16,16,4)))
+    s = SequenceSim()
+    s.run(seq,render=False)
+    energy = ScanAnalysis(seq).grad_energy
+    for axis,(area,sq) in s.totals().items():
+        assert np.isclose(sq,energy[axis],rtol=1e-9)
+
+def test_bloch_workers_identical(protocol):
+    from mrpy.sim import BlochSim, Isochromats
+    sim = BlochSim(GradientEcho(**protocol((16,8,1))),chunk=300)
+    spins = Isochromats.line(40,1000,'S',relax=((1000,50),(800,40)),df=(0,0.01))
+    sig = sim.run(spins)
+    assert sig.shape == (8,16)
+    assert np.array_equal(sig,sim.run(spins,workers=2))
+
+def test_decimate_window_separates_events():
+    w = Waveform()
+    w.append(np.array([0.,1.,2.]),np.array([1.,2.,1.]))
+    w.append(np.array([3.,4.,5.]),np.array([1.,2.,1.]))
+    t,wave = w.decimate(100,(0.5,4.5))
+    assert np.array_equal(np.isnan(t),[False,False,True,False,False])
+    assert np.array_equal(t[~np.isnan(t)],[1.,2.,3.,4.])
+
+def test_decimate_zero_width():
+    # every sample at one time, a single event or a zoom onto one instant
+    w = Waveform()
+    w.append(np.zeros(50),np.linspace(-1,1,50))
+    t,wave = w.decimate(10)
+    assert np.all(t == 0) and np.array_equal(wave,np.linspace(-1,1,50))
+    w.append(np.linspace(1,2,50),np.ones(50))
+    t,wave = w.decimate(10,(0.,0.))
+    assert len(t) == 50 and np.all(np.isfinite(wave))
+
+def test_decimate_bridges_flat_tops():
+    # a long trapezoid leaves most bins empty, dense events before and after it
+    w = Waveform()
+    tt = np.linspace(0,1,500)
+    w.append(tt,np.sin(tt))
+    w.append(np.array([2.,2.1,9.9,10.]),np.array([0.,1.,1.,0.]))
+    w.append(tt + 11,np.sin(tt))
+    t,wave = w.decimate(100)
+    sep = np.flatnonzero(np.isnan(t))
+    assert len(sep) == 2
+    # bins are 0.12 ms wide, the gaps are where the events end and start
+    assert t[sep[0]-1] < 1.1 and t[sep[0]+1] > 1.9
+    assert t[sep[1]-1] < 10.1 and t[sep[1]+1] > 10.9
+    assert np.nanmax(wave) == 1.0
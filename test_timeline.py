@@ -0,0 +1,61 @@
+import numpy as np
+from mrpy import export
+from mrpy.gradientecho import GradientEcho
+from mrpy.multislice import MultiSliceGradientEcho
+from mrpy.sim.sim import SequenceSim, Waveform
+from mrpy.timeline import Timeline, EventTable, channels
+
+def traverse(seq):
+    # the waveforms of a plain traversal of the sequence tree by SequenceSim
+    s = SequenceSim()
+    for axis in ('R','P','S'):
+        s.grad[axis] = Waveform()
+    s.rf,s.acq = Waveform(),Waveform()
+    seq.run(s)
+    return {'R': s.grad['R'],'P': s.grad['P'],'S': s.grad['S'],'rf': s.rf,'acq': s.acq}
+
+def ordered(t,wave):
+    order = np.lexsort((wave,t))
+    return t[order],wave[order]
+
+def check(seq):
+    tl = Timeline.compile(seq)
+    for ch,wave in traverse(seq).items():
+        t,w,phase,off = tl.expand(ch)
+        assert len(off) - 1 == len(wave)
+        ta,wa = ordered(wave.t,wave.wave)
+        tb,wb = ordered(t,w)
+        assert np.allclose(ta,tb)
+        assert np.allclose(wa,wb,atol=1e-12)
+
+def test_compile_matches_traversal(protocol):
+    check(GradientEcho(**protocol((32,16,1))))
+    check(GradientEcho(**protocol((16,8,4),na=2,nr=3)))
+
+def test_compile_matches_traversal_multislice(protocol):
+    check(MultiSliceGradientEcho(**protocol((16,8,1),nslices=3,gap=1.0)))
+
+def test_stream_covers_events(protocol):
+    tl = Timeline.compile(GradientEcho(**protocol((16,8,4),nr=2)))
+    blocks = list(tl.stream())
+    for ch in channels:
+        streamed = EventTable.concat(events[ch] for t0,t1,events in blocks)
+        full = tl.events(ch)
+        assert np.array_equal(streamed.start,full.start)
+        assert np.array_equal(streamed.amp,full.amp)
+        assert np.array_equal(streamed.shape,full.shape)
+    for t0,t1,events in blocks:
+        for ch in channels:
+            assert np.all((events[ch].start >= t0) & (events[ch].start < t1))
+
+def test_export_round_trip(tmp_path,protocol):
+    tl = Timeline.compile(GradientEcho(**protocol((16,8,2))))
+    path = str(tmp_path/'seq.mrpy')
+    export.write(tl,path)
+    f = export.load(path)
+    assert np.isclose(f.dur,tl.dur)
+    for ch in channels:
+        t,w,phase,off = f.expand(f.channel(ch))
+        tr,wr,pr,offr = tl.expand(ch)
+        assert np.array_equal(off,offr)
+        assert np.allclose(t,tr) and np.allclose(w,wr)